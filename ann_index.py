@@ -0,0 +1,112 @@
+import numpy as np
+from vector_engine import _order_top_k
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbor index over normalized embeddings
+
+    Vectors are clustered into nlist cells with spherical k-means; a query only
+    scores the vectors in its nprobe closest cells.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, list_vectors, restaurant_ids, nprobe=8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.list_vectors = list_vectors
+        self.position_of_row = np.empty(len(list_rows), dtype=np.int64)
+        self.position_of_row[list_rows] = np.arange(len(list_rows))
+        self.restaurant_ids = list(restaurant_ids)
+        self.row_by_id = {rest_id: row for row, rest_id in enumerate(self.restaurant_ids)}
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, restaurant_ids, nlist=256, nprobe=8, n_iter=20, train_size=50000, seed=0):
+        """Train centroids with k-means and bucket every vector into its closest cell"""
+        rng = np.random.default_rng(seed)
+        nlist = max(1, min(nlist, len(matrix)))
+        train = matrix
+        if len(matrix) > train_size:
+            train = matrix[rng.choice(len(matrix), train_size, replace=False)]
+
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = _assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, train)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Re-seed empty cells from random training vectors
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = train[rng.choice(len(train), empty.sum(), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assignment = _assign(matrix, centroids)
+        list_rows = np.argsort(assignment, kind='stable')
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=list_offsets[1:])
+        list_vectors = np.ascontiguousarray(matrix[list_rows], dtype=np.float32)
+        return cls(centroids, list_offsets, list_rows, list_vectors, restaurant_ids, nprobe=nprobe)
+
+    @classmethod
+    def from_engine(cls, engine, **params):
+        """Build an index from a loaded VectorEngine"""
+        return cls.build(engine.matrix, engine.restaurant_ids, **params)
+
+    def save(self, path):
+        """Write the index to a single .npz file"""
+        np.savez(path,
+                 centroids=self.centroids,
+                 list_offsets=self.list_offsets,
+                 list_rows=self.list_rows,
+                 list_vectors=self.list_vectors,
+                 restaurant_ids=np.array(self.restaurant_ids),
+                 nprobe=np.array(self.nprobe))
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        with np.load(path) as data:
+            return cls(data['centroids'], data['list_offsets'], data['list_rows'],
+                       data['list_vectors'], data['restaurant_ids'].tolist(),
+                       nprobe=int(data['nprobe']))
+
+    def search(self, query, k=5, nprobe=None, exclude=None):
+        """Return (rows, scores) of the approximate top-k for a normalized query vector"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        cells = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        segments = [np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in cells]
+        positions = np.concatenate(segments)
+        rows = self.list_rows[positions]
+        scores = self.list_vectors[positions] @ query
+        if exclude is not None:
+            keep = rows != exclude
+            rows, scores = rows[keep], scores[keep]
+        if len(scores) > k:
+            threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            keep = scores >= threshold
+            rows, scores = rows[keep], scores[keep]
+        return _order_top_k(scores, rows, k)
+
+    def neighbors(self, restaurant_id, k=5, nprobe=None):
+        """Approximate counterpart of VectorEngine.neighbors"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = self.list_vectors[self.position_of_row[row]]
+        return self.search(query, k, nprobe=nprobe, exclude=row)
+
+def _assign(vectors, centroids, block_size=8192):
+    """Return the index of the most similar centroid for each vector"""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assignment[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
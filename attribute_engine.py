@@ -0,0 +1,192 @@
+import argparse
+import numpy as np
+from catalog import CatalogDetails
+from vector_engine import _order_top_k
+
+# Weights of the SQL-based recommender in test_recommendations, benchmark_recommendations,
+# find_perfect_matches and relevant_metrics
+SQL_WEIGHTS = {'category': 0.3, 'price': 0.3, 'rating': 0.4}
+# Variant used by category_matching_score (no price term)
+CATEGORY_MATCHING_WEIGHTS = {'category': 0.3, 'price': 0.0, 'rating': 0.7}
+
+def attribute_scores(category_match, price_diff, rating_diff, weights=SQL_WEIGHTS):
+    """Weighted attribute score, term order matching the SQL expression"""
+    return (category_match * weights['category'] +
+            (1 - price_diff / 4) * weights['price'] +
+            (1 - rating_diff / 5) * weights['rating'])
+
+class AttributeEngine:
+    """Column-oriented scoring of the SQL-based recommender over all restaurants"""
+
+    def __init__(self, restaurant_ids, details):
+        self.restaurant_ids = list(restaurant_ids)
+        self.row_by_id = {rest_id: row for row, rest_id in enumerate(self.restaurant_ids)}
+        if isinstance(details, CatalogDetails) and details.rows is None:
+            # Columns come straight from the catalog arrays; its category sets are interned the same way
+            catalog = details.catalog
+            self.details = details
+            self.category_ids = {value: i for i, value in enumerate(catalog.category_strings)}
+            self.category = catalog.category_set
+            self.price_level = catalog.price_level.astype(np.float64)
+            self.avg_rating = catalog.avg_rating
+            return
+        self.details = list(details)
+
+        self.category_ids = {}
+        self.category = np.array([self.category_ids.setdefault(d[1], len(self.category_ids))
+                                  for d in self.details], dtype=np.int32)
+        self.price_level = np.array([float(d[2]) for d in self.details], dtype=np.float64)
+        self.avg_rating = np.array([float(d[3]) for d in self.details], dtype=np.float64)
+
+    @classmethod
+    def load(cls, conn):
+        """Load the attribute columns of every restaurant"""
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT restaurant_id, name, categories, price_level, avg_rating, city, state
+            FROM restaurants
+            ORDER BY restaurant_id
+        """)
+        rows = cur.fetchall()
+        cur.close()
+        return cls([row[0] for row in rows], [row[1:] for row in rows])
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        return cls(catalog.restaurant_ids, catalog.details)
+
+    def __len__(self):
+        return len(self.restaurant_ids)
+
+    def scores_for_rows(self, query_rows, weights=SQL_WEIGHTS):
+        """Score every restaurant against each query row, shape (len(query_rows), n)"""
+        query_rows = np.asarray(query_rows)
+        category_match = (self.category[query_rows, None] == self.category[None, :]).astype(np.float64)
+        price_diff = np.abs(self.price_level[query_rows, None] - self.price_level[None, :])
+        rating_diff = np.abs(self.avg_rating[query_rows, None] - self.avg_rating[None, :])
+        return attribute_scores(category_match, price_diff, rating_diff, weights)
+
+    def neighbors(self, restaurant_id, k=5, weights=SQL_WEIGHTS):
+        """Return (rows, scores) of the k best attribute matches, excluding itself"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        scores = self.scores_for_rows([row], weights)[0]
+        return self._select(scores, k, exclude=row)
+
+    def neighbors_batch(self, restaurant_ids, k=5, weights=SQL_WEIGHTS, block_size=64):
+        """Score a batch of queries block by block with broadcast column arithmetic"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        results = [empty] * len(restaurant_ids)
+        known = [(i, self.row_by_id[rest_id]) for i, rest_id in enumerate(restaurant_ids)
+                 if rest_id in self.row_by_id]
+
+        for start in range(0, len(known), block_size):
+            block = known[start:start + block_size]
+            scores = self.scores_for_rows([row for _, row in block], weights)
+            for (i, row), row_scores in zip(block, scores):
+                results[i] = self._select(row_scores, k, exclude=row)
+        return results
+
+    def top_k(self, restaurant_id, k=5, weights=SQL_WEIGHTS):
+        """Return rows shaped like the SQL query: (name, categories, price_level, avg_rating, similarity_score)"""
+        return self._format(*self.neighbors(restaurant_id, k, weights))
+
+    def top_k_batch(self, restaurant_ids, k=5, weights=SQL_WEIGHTS, block_size=64):
+        """Batched version of top_k"""
+        return [self._format(rows, scores)
+                for rows, scores in self.neighbors_batch(restaurant_ids, k, weights, block_size)]
+
+    def perfect_matches(self, restaurant_id, weights=SQL_WEIGHTS):
+        """Return rows with identical categories, price level and rating, formatted like top_k"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return []
+        mask = ((self.category == self.category[row]) &
+                (self.price_level == self.price_level[row]) &
+                (self.avg_rating == self.avg_rating[row]))
+        mask[row] = False
+        rows = np.flatnonzero(mask)
+        scores = np.full(len(rows), attribute_scores(1.0, 0.0, 0.0, weights))
+        return self._format(rows, scores)
+
+    def _select(self, scores, k, exclude):
+        scores[exclude] = -np.inf
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        # Scores take few distinct values, so keep every row tied with the k-th one
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        candidates = np.flatnonzero(scores >= threshold)
+        candidates = candidates[candidates != exclude]
+        return _order_top_k(scores[candidates], candidates, k)
+
+    def _format(self, rows, scores):
+        return [tuple(self.details[row][:4]) + (float(score),) for row, score in zip(rows, scores)]
+
+def verify_parity(conn, engine, restaurant_ids, k=5, weights=SQL_WEIGHTS, tolerance=1e-9):
+    """Check the engine against the SQL self-join for each restaurant id
+
+    SQL breaks score ties arbitrarily, so a ranking matches when the score
+    sequences agree, every returned restaurant carries the score the engine
+    assigns it, and the rows strictly above the k-th score are the same set.
+    Returns the list of restaurant ids that did not match.
+    """
+    cur = conn.cursor()
+    mismatches = []
+    for rest_id in restaurant_ids:
+        cur.execute("""
+            SELECT
+                r2.restaurant_id,
+                (
+                    CASE WHEN r1.categories = r2.categories THEN %s ELSE 0 END +
+                    (1 - ABS(r1.price_level - r2.price_level)::float/4) * %s +
+                    (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * %s
+                ) as similarity_score
+            FROM restaurants r1
+            JOIN restaurants r2 ON r1.restaurant_id != r2.restaurant_id
+            WHERE r1.restaurant_id = %s
+            ORDER BY similarity_score DESC
+            LIMIT %s
+        """, (weights['category'], weights['price'], weights['rating'], rest_id, k))
+        sql_rows = cur.fetchall()
+
+        rows, scores = engine.neighbors(rest_id, k, weights)
+        all_scores = engine.scores_for_rows([engine.row_by_id[rest_id]], weights)[0]
+        sql_scores = np.array([row[1] for row in sql_rows])
+
+        matched = len(sql_rows) == len(rows) and np.allclose(sql_scores, scores, atol=tolerance)
+        if matched and len(rows):
+            kth = scores[-1]
+            matched = all(abs(all_scores[engine.row_by_id[sql_id]] - score) <= tolerance
+                          for sql_id, score in sql_rows)
+            sql_above = {sql_id for sql_id, score in sql_rows if score > kth + tolerance}
+            engine_above = {engine.restaurant_ids[row] for row, score in zip(rows, scores)
+                            if score > kth + tolerance}
+            matched = matched and sql_above == engine_above
+        if not matched:
+            mismatches.append(rest_id)
+    cur.close()
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the attribute engine against the SQL recommender')
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--weights', choices=['sql', 'category_matching'], default='sql')
+    args = parser.parse_args()
+    weights = SQL_WEIGHTS if args.weights == 'sql' else CATEGORY_MATCHING_WEIGHTS
+
+    # Imported here so serving from a snapshot does not load psycopg2
+    import db
+    conn = db.connect()
+    engine = AttributeEngine.load(conn)
+    sample = engine.restaurant_ids[::max(1, len(engine) // args.samples)][:args.samples]
+
+    mismatches = verify_parity(conn, engine, sample, weights=weights)
+    print(f"Checked {len(sample)} restaurants: {len(sample) - len(mismatches)} identical rankings")
+    for rest_id in mismatches:
+        print(f"Mismatch: {rest_id}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import numpy as np
+from vector_engine import _order_top_k
+from attribute_engine import SQL_WEIGHTS, attribute_scores
+
+class AttributeIndex:
+    """Bucketed index answering attribute top-k queries without scanning every restaurant
+
+    Restaurants are grouped by (price_level, avg_rating) and, inside each group,
+    by category. Relative to a query every restaurant then falls into one of a
+    few hundred classes -- (category match, price, rating) -- whose members all
+    share the same score, so a query visits classes in descending score order
+    and stops once k restaurants are covered.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        n = len(engine)
+
+        keys, bucket_of_row = np.unique(np.stack([engine.price_level, engine.avg_rating], axis=1),
+                                        axis=0, return_inverse=True)
+        bucket_of_row = bucket_of_row.reshape(-1)
+        self.bucket_price = keys[:, 0]
+        self.bucket_rating = keys[:, 1]
+
+        # Rows of each bucket, in ascending row order
+        order = np.argsort(bucket_of_row, kind='stable')
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(bucket_of_row, minlength=len(keys)), out=offsets[1:])
+        self.bucket_rows = [order[offsets[b]:offsets[b + 1]] for b in range(len(keys))]
+
+        # Rows of each (category, bucket) pair, in ascending row order
+        order = np.lexsort((np.arange(n), bucket_of_row, engine.category))
+        pair_keys = np.stack([engine.category[order], bucket_of_row[order]], axis=1)
+        boundaries = np.flatnonzero(np.any(np.diff(pair_keys, axis=0) != 0, axis=1)) + 1
+        self.category_rows = {}
+        for group in np.split(order, boundaries) if n else []:
+            first = group[0]
+            self.category_rows.setdefault(int(engine.category[first]), {})[int(bucket_of_row[first])] = group
+
+        self.bucket_of_row = bucket_of_row
+
+    @classmethod
+    def from_engine(cls, engine):
+        return cls(engine)
+
+    def __len__(self):
+        return len(self.engine)
+
+    def neighbors(self, restaurant_id, k=5, weights=SQL_WEIGHTS):
+        """Return (rows, scores) identical to AttributeEngine.neighbors"""
+        row = self.engine.row_by_id.get(restaurant_id)
+        k = min(k, len(self) - 1)
+        if row is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        category = int(self.engine.category[row])
+        own_bucket = self.bucket_of_row[row]
+        own_buckets = self.category_rows.get(category, {})
+        price_diff = np.abs(self.bucket_price - self.engine.price_level[row])
+        rating_diff = np.abs(self.bucket_rating - self.engine.avg_rating[row])
+        match_scores = attribute_scores(1.0, price_diff, rating_diff, weights)
+        other_scores = attribute_scores(0.0, price_diff, rating_diff, weights)
+
+        # (score, bucket, is_match, size) for every non-empty class
+        classes = []
+        for bucket in range(len(self.bucket_rows)):
+            matching = own_buckets.get(bucket)
+            n_matching = 0 if matching is None else len(matching)
+            if n_matching:
+                classes.append((match_scores[bucket], bucket, True, n_matching))
+            if len(self.bucket_rows[bucket]) > n_matching:
+                classes.append((other_scores[bucket], bucket, False,
+                                len(self.bucket_rows[bucket]) - n_matching))
+        classes.sort(key=lambda c: -c[0])
+
+        candidate_rows = []
+        candidate_scores = []
+        covered = 0
+        boundary = None
+        for score, bucket, is_match, size in classes:
+            if boundary is not None and score < boundary:
+                break
+            rows = self._class_rows(bucket, is_match, own_buckets, category, row, k)
+            candidate_rows.append(rows)
+            candidate_scores.append(np.full(len(rows), score))
+            covered += size - (is_match and bucket == own_bucket)
+            # Keep visiting classes tied with the k-th score so ties resolve by row index
+            if boundary is None and covered >= k:
+                boundary = score
+
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        return _order_top_k(scores, rows, k)
+
+    def neighbors_batch(self, restaurant_ids, k=5, weights=SQL_WEIGHTS):
+        return [self.neighbors(rest_id, k, weights) for rest_id in restaurant_ids]
+
+    def top_k(self, restaurant_id, k=5, weights=SQL_WEIGHTS):
+        """Return rows shaped like the SQL query: (name, categories, price_level, avg_rating, similarity_score)"""
+        return self.engine._format(*self.neighbors(restaurant_id, k, weights))
+
+    def top_k_batch(self, restaurant_ids, k=5, weights=SQL_WEIGHTS):
+        return [self.top_k(rest_id, k, weights) for rest_id in restaurant_ids]
+
+    def _class_rows(self, bucket, is_match, own_buckets, category, exclude, k):
+        """Return the k lowest rows of a class, skipping the query row"""
+        if is_match:
+            rows = own_buckets[bucket][:k + 1]
+        else:
+            n_matching = len(own_buckets.get(bucket, ()))
+            # A prefix this long always contains k non-matching rows when the class has them
+            prefix = self.bucket_rows[bucket][:k + n_matching + 1]
+            rows = prefix[self.engine.category[prefix] != category]
+        return rows[rows != exclude][:k]
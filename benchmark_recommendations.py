@@ -1,8 +1,22 @@
-import psycopg2
+import argparse
+import os
+import sys
+import tempfile
 import time
+from contextlib import contextmanager
+import db
+import numpy as np
 from tqdm import tqdm
-import pandas as pd
 from datetime import datetime
+from vector_engine import DETAIL_COLUMNS, VectorEngine
+from ann_index import IVFIndex
+from sharded_index import SHARD_KEYS, ShardedIndex
+from quantized_index import QuantizedIndex
+from attribute_engine import SQL_WEIGHTS, AttributeEngine
+from attribute_index import AttributeIndex
+from catalog import Catalog
+from metrics_kernel import MetricsColumns, compute_metrics, verify_parity as verify_metrics_parity
+from relevant_metrics import calculate_metrics
 
 def get_sample_restaurants(conn, n=100):
     """Get random restaurants that have embeddings"""
@@ -16,101 +30,444 @@ def get_sample_restaurants(conn, n=100):
     """, (n,))
     return cur.fetchall()
 
-def run_benchmark():
+@contextmanager
+def query_repository(repo, connections, prepared):
+    """The Repository one sampled restaurant is queried on, released even if a query fails"""
+    if connections == 'pool':
+        with db.pooled(prepared=prepared) as query_repo:
+            yield query_repo
+    elif connections == 'per-query':
+        conn = db.connect()
+        try:
+            yield db.Repository(conn, prepared=prepared)
+        finally:
+            conn.close()
+    else:
+        yield repo
+
+def run_benchmark(with_numpy=False, prepared=True, connections='reuse'):
+    """Time both recommenders for sampled restaurants
+
+    connections='reuse' runs every query on one connection, 'pool' borrows a
+    connection from the shared pool for each restaurant, and 'per-query'
+    opens a fresh connection for each restaurant, paying connection setup
+    and (with prepared statements) the PREPARE again every time.
+    """
     # Connect to database
-    conn = psycopg2.connect(
-        dbname="restaurant_db",
-        user="helloalpacaa",
-        host="localhost"
-    )
+    conn = db.connect()
+    repo = db.Repository(conn, prepared=prepared)
     
     # Get sample restaurants
     print("Getting sample restaurants...")
     sample_restaurants = get_sample_restaurants(conn)
     
+    engine = None
+    attribute_engine = None
+    if with_numpy:
+        print("Loading NumPy engines...")
+        load_start = time.time()
+        engine = VectorEngine.load(conn)
+        attribute_engine = AttributeEngine.load(conn)
+        print(f"Loaded {len(engine)} embeddings and {len(attribute_engine)} restaurants "
+              f"in {time.time() - load_start:.2f} seconds")
+    
     results = []
     
     print("Running benchmarks...")
     for rest_id, rest_name, categories in tqdm(sample_restaurants):
-        # Test SQL-based recommendations
-        cur = conn.cursor()
-        
-        # SQL timing
-        sql_start = time.time()
-        cur.execute("""
-            WITH RestaurantMetrics AS (
-                SELECT 
-                    r.restaurant_id,
-                    r.name,
-                    r.categories,
-                    r.price_level,
-                    r.avg_rating
-                FROM restaurants r
-            )
-            SELECT 
-                r2.name,
-                r2.categories,
-                r2.price_level,
-                r2.avg_rating,
-                (
-                    CASE WHEN r1.categories = r2.categories THEN 0.3 ELSE 0 END +
-                    (1 - ABS(r1.price_level - r2.price_level)::float/4) * 0.3 +
-                    (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * 0.4
-                ) as similarity_score
-            FROM RestaurantMetrics r1
-            JOIN RestaurantMetrics r2 ON r1.restaurant_id != r2.restaurant_id
-            WHERE r1.restaurant_id = %s
-            ORDER BY similarity_score DESC
-            LIMIT 5
-        """, (rest_id,))
-        sql_results = cur.fetchall()
-        sql_time = time.time() - sql_start
+        connect_start = time.time()
+        with query_repository(repo, connections, prepared) as query_repo:
+            connect_time = time.time() - connect_start
+
+            # SQL timing
+            sql_start = time.time()
+            sql_results = query_repo.sql_recommendations(rest_id, SQL_WEIGHTS, k=5)
+            sql_time = time.time() - sql_start
+
+            # Vector timing
+            vector_start = time.time()
+            vector_results = query_repo.vector_recommendations(rest_id, k=5)
+            vector_time = time.time() - vector_start
         
-        # Vector timing
-        vector_start = time.time()
-        cur.execute("""
-            SELECT 
-                r.name,
-                r.categories,
-                r.price_level,
-                r.avg_rating,
-                1 - (re1.embedding <=> re2.embedding) as similarity_score
-            FROM restaurant_embeddings re1
-            JOIN restaurant_embeddings re2 ON re1.restaurant_id != re2.restaurant_id
-            JOIN restaurants r ON re2.restaurant_id = r.restaurant_id
-            WHERE re1.restaurant_id = %s
-            ORDER BY similarity_score DESC
-            LIMIT 5
-        """, (rest_id,))
-        vector_results = cur.fetchall()
-        vector_time = time.time() - vector_start
+        numpy_time = None
+        numpy_results = None
+        numpy_attribute_time = None
+        numpy_attribute_results = None
+        if engine is not None:
+            numpy_start = time.time()
+            numpy_results = engine.top_k(rest_id, k=5)
+            numpy_time = time.time() - numpy_start
+            
+            numpy_start = time.time()
+            numpy_attribute_results = attribute_engine.top_k(rest_id, k=5)
+            numpy_attribute_time = time.time() - numpy_start
         
         results.append({
             'restaurant_id': rest_id,
             'restaurant_name': rest_name,
             'categories': categories,
+            'connect_time': connect_time,
             'sql_time': sql_time,
             'vector_time': vector_time,
             'sql_top_match': sql_results[0][0] if sql_results else None,
             'sql_similarity': sql_results[0][4] if sql_results else None,
             'vector_top_match': vector_results[0][0] if vector_results else None,
-            'vector_similarity': vector_results[0][4] if vector_results else None
+            'vector_similarity': vector_results[0][4] if vector_results else None,
+            'numpy_time': numpy_time,
+            'numpy_top_match': numpy_results[0][0] if numpy_results else None,
+            'numpy_attribute_time': numpy_attribute_time,
+            'numpy_attribute_similarity': numpy_attribute_results[0][4] if numpy_attribute_results else None
         })
     
     conn.close()
     return results
 
+def recall_at(exact_rows, approx_rows, k):
+    """Fraction of the exact top-k found in the approximate top-k"""
+    return len(set(exact_rows[:k]).intersection(approx_rows[:k])) / k
+
+def run_ann_benchmark(nlists, nprobes, n_queries=200, seed=42, index_dir=None):
+    """Report recall@5/@10 and p50/p95 latency of the IVF index against exact search"""
+    conn = db.connect()
+    print("Loading embeddings...")
+    engine = VectorEngine.load(conn)
+    conn.close()
+    
+    rng = np.random.default_rng(seed)
+    query_ids = [engine.restaurant_ids[i]
+                 for i in rng.choice(len(engine), min(n_queries, len(engine)), replace=False)]
+    
+    print("Computing exact neighbors...")
+    exact_latencies = []
+    exact = {}
+    for rest_id in query_ids:
+        start = time.perf_counter()
+        exact[rest_id] = engine.neighbors(rest_id, k=10)[0].tolist()
+        exact_latencies.append(time.perf_counter() - start)
+    
+    print(f"\nExact search: p50 {np.percentile(exact_latencies, 50) * 1000:.3f} ms, "
+          f"p95 {np.percentile(exact_latencies, 95) * 1000:.3f} ms")
+    print(f"\n{'nlist':>6} {'nprobe':>7} {'build s':>8} {'recall@5':>9} {'recall@10':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    print("=" * 62)
+    
+    for nlist in nlists:
+        build_start = time.perf_counter()
+        index = IVFIndex.from_engine(engine, nlist=nlist, seed=seed)
+        build_time = time.perf_counter() - build_start
+        if index_dir:
+            index.save(f"{index_dir}/ivf_nlist{nlist}.npz")
+        
+        for nprobe in nprobes:
+            if nprobe > index.nlist:
+                continue
+            latencies = []
+            recalls_5 = []
+            recalls_10 = []
+            for rest_id in query_ids:
+                start = time.perf_counter()
+                rows = index.neighbors(rest_id, k=10, nprobe=nprobe)[0].tolist()
+                latencies.append(time.perf_counter() - start)
+                recalls_5.append(recall_at(exact[rest_id], rows, 5))
+                recalls_10.append(recall_at(exact[rest_id], rows, 10))
+            print(f"{nlist:>6} {nprobe:>7} {build_time:>8.2f} {np.mean(recalls_5):>9.4f} "
+                  f"{np.mean(recalls_10):>10.4f} {np.percentile(latencies, 50) * 1000:>8.3f} "
+                  f"{np.percentile(latencies, 95) * 1000:>8.3f}")
+
+def run_shard_benchmark(engine, shard_by=('state', 'city'), fanout_workers=(1, 2, 4), n_queries=200, seed=42,
+                        k=5):
+    """Report shard sizes, same-region latency per shard and fan-out cost against a full scan"""
+    rng = np.random.default_rng(seed)
+    query_ids = [engine.restaurant_ids[i]
+                 for i in rng.choice(len(engine), min(n_queries, len(engine)), replace=False)]
+    
+    exact_latencies = []
+    exact = {}
+    for rest_id in query_ids:
+        start = time.perf_counter()
+        exact[rest_id] = engine.neighbors(rest_id, k)[0]
+        exact_latencies.append(time.perf_counter() - start)
+    exact_p50 = np.percentile(exact_latencies, 50) * 1000
+    print(f"\nFull scan of {len(engine)} embeddings: p50 {exact_p50:.3f} ms, "
+          f"p95 {np.percentile(exact_latencies, 95) * 1000:.3f} ms")
+    
+    for by in shard_by:
+        index = ShardedIndex(engine, by, workers=1)
+        sizes = np.array(list(index.shard_sizes().values()))
+        print(f"\nSharded by {by}: {len(sizes)} shards, rows per shard min {sizes.min()}, "
+              f"p50 {np.median(sizes):.0f}, max {sizes.max()}")
+        
+        by_shard = {}
+        recalls = []
+        for rest_id in query_ids:
+            start = time.perf_counter()
+            rows = index.neighbors(rest_id, k)[0]
+            by_shard.setdefault(index.region_of(rest_id), []).append(time.perf_counter() - start)
+            recalls.append(recall_at(exact[rest_id].tolist(), rows.tolist(), k))
+        local = [latency for latencies in by_shard.values() for latency in latencies]
+        print(f"Same-region queries: p50 {np.percentile(local, 50) * 1000:.3f} ms, "
+              f"p95 {np.percentile(local, 95) * 1000:.3f} ms, "
+              f"{exact_p50 / (np.percentile(local, 50) * 1000):.1f}x faster than a full scan; "
+              f"{np.mean(recalls):.1%} of the global top-{k} is in the same region")
+        print(f"\n{'shard':<28} {'rows':>8} {'queries':>8} {'p50 ms':>9}")
+        print("=" * 56)
+        sizes_by_key = index.shard_sizes()
+        for key in sorted(by_shard, key=lambda key: -sizes_by_key[key])[:10]:
+            print(f"{str(key):<28} {sizes_by_key[key]:>8} {len(by_shard[key]):>8} "
+                  f"{np.percentile(by_shard[key], 50) * 1000:>9.3f}")
+        index.close()
+        
+        print(f"\n{'fan-out workers':>15} {'p50 ms':>9} {'p95 ms':>9} {'vs full scan':>13} {'identical':>10}")
+        print("=" * 60)
+        for workers in fanout_workers:
+            index = ShardedIndex(engine, by, workers=workers)
+            latencies = []
+            identical = True
+            for rest_id in query_ids:
+                start = time.perf_counter()
+                rows = index.neighbors_fanout(rest_id, k)[0]
+                latencies.append(time.perf_counter() - start)
+                identical = identical and np.array_equal(rows, exact[rest_id])
+            index.close()
+            p50 = np.percentile(latencies, 50) * 1000
+            print(f"{workers:>15} {p50:>9.3f} {np.percentile(latencies, 95) * 1000:>9.3f} "
+                  f"{p50 / exact_p50:>12.2f}x {str(identical):>10}")
+
+def run_quantization_benchmark(engine, pq_subspaces=(48, 96), rescores=(10, 50, 200), n_queries=200, seed=42,
+                               index_dir=None):
+    """Report resident memory, queries/sec and recall@5/@10 of the quantized indexes against exact search"""
+    rng = np.random.default_rng(seed)
+    query_ids = [engine.restaurant_ids[i]
+                 for i in rng.choice(len(engine), min(n_queries, len(engine)), replace=False)]
+    
+    exact_start = time.perf_counter()
+    exact = {rest_id: engine.neighbors(rest_id, k=10)[0].tolist() for rest_id in query_ids}
+    exact_qps = len(query_ids) / (time.perf_counter() - exact_start)
+    
+    print(f"\n{'index':<12} {'resident MB':>12} {'build s':>8} {'rescore':>8} {'queries/s':>10} "
+          f"{'recall@5':>9} {'recall@10':>10}")
+    print("=" * 75)
+    print(f"{'float32':<12} {engine.matrix.nbytes / 1024 / 1024:>12.1f} {'-':>8} {'-':>8} {exact_qps:>10.1f} "
+          f"{1.0:>9.4f} {1.0:>10.4f}")
+    
+    directory = index_dir or tempfile.mkdtemp(prefix='quantized_')
+    variants = [('int8', {})] + [(f"pq{m}", {'kind': 'pq', 'm': m}) for m in pq_subspaces]
+    for name, params in variants:
+        build_start = time.perf_counter()
+        index = QuantizedIndex.from_engine(engine, os.path.join(directory, name),
+                                           **(params or {'kind': 'int8'}))
+        build_time = time.perf_counter() - build_start
+        for rescore in rescores:
+            recalls_5 = []
+            recalls_10 = []
+            start = time.perf_counter()
+            results = {rest_id: index.neighbors(rest_id, k=10, rescore=rescore)[0].tolist() for rest_id in query_ids}
+            qps = len(query_ids) / (time.perf_counter() - start)
+            for rest_id in query_ids:
+                recalls_5.append(recall_at(exact[rest_id], results[rest_id], 5))
+                recalls_10.append(recall_at(exact[rest_id], results[rest_id], 10))
+            print(f"{name:<12} {index.memory_bytes() / 1024 / 1024:>12.1f} {build_time:>8.2f} {rescore:>8} "
+                  f"{qps:>10.1f} {np.mean(recalls_5):>9.4f} {np.mean(recalls_10):>10.4f}")
+    print(f"\nIndexes written to {directory}")
+
+def synthetic_catalog(n, seed=42):
+    """Generate restaurant ids and detail rows with Yelp-like attribute distributions"""
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"Restaurants, Category {i}" for i in range(max(10, n // 10))]
+    category_rows = np.minimum(rng.zipf(1.3, n) - 1, len(vocabulary) - 1)
+    price_levels = rng.choice([1, 2, 3, 4], size=n, p=[0.35, 0.5, 0.1, 0.05])
+    ratings = rng.choice(np.arange(1.0, 5.5, 0.5), size=n)
+    states = rng.integers(0, 20, size=n)
+    cities = states * 10 + rng.integers(0, 10, size=n)
+    restaurant_ids = [f"synthetic-{i:08d}" for i in range(n)]
+    details = [(f"Restaurant {i}", vocabulary[category_rows[i]], int(price_levels[i]),
+                float(ratings[i]), f"City {cities[i]}", f"S{states[i]}")
+               for i in range(n)]
+    return restaurant_ids, details
+
+def run_attribute_index_benchmark(sizes, n_queries=200, seed=42):
+    """Compare the bucket index against the exhaustive attribute scan as the catalog grows"""
+    print(f"\n{'restaurants':>12} {'buckets':>8} {'scan ms':>9} {'index ms':>9} {'speedup':>8} {'identical':>10}")
+    print("=" * 62)
+    for size in sizes:
+        restaurant_ids, details = synthetic_catalog(size, seed)
+        engine = AttributeEngine(restaurant_ids, details)
+        index = AttributeIndex.from_engine(engine)
+        rng = np.random.default_rng(seed)
+        query_ids = [restaurant_ids[i] for i in rng.choice(size, min(n_queries, size), replace=False)]
+        
+        scan_start = time.perf_counter()
+        scan_results = [engine.neighbors(rest_id, k=5)[0] for rest_id in query_ids]
+        scan_time = (time.perf_counter() - scan_start) / len(query_ids)
+        
+        index_start = time.perf_counter()
+        index_results = [index.neighbors(rest_id, k=5)[0] for rest_id in query_ids]
+        index_time = (time.perf_counter() - index_start) / len(query_ids)
+        
+        identical = all(np.array_equal(a, b) for a, b in zip(scan_results, index_results))
+        print(f"{size:>12} {len(index.bucket_rows):>8} {scan_time * 1000:>9.3f} {index_time * 1000:>9.3f} "
+              f"{scan_time / index_time:>7.1f}x {str(identical):>10}")
+
+def run_metrics_benchmark(n_queries=10000, catalog_size=50000, k=5, seed=42):
+    """Time calculate_metrics per query against the vectorized kernel, and check they agree"""
+    restaurant_ids, details = synthetic_catalog(catalog_size, seed)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(catalog_size, n_queries)
+    rec_rows = rng.integers(0, catalog_size, size=(n_queries, k))
+    keys = ('name', 'categories', 'price_level', 'avg_rating', 'city', 'state')
+    
+    loop_start = time.perf_counter()
+    for query_row, rows in zip(query_rows, rec_rows):
+        calculate_metrics(dict(zip(keys, details[query_row])), [dict(zip(keys, details[row])) for row in rows])
+    loop_time = time.perf_counter() - loop_start
+    
+    columns_start = time.perf_counter()
+    columns = MetricsColumns(details)
+    columns_time = time.perf_counter() - columns_start
+    kernel_start = time.perf_counter()
+    compute_metrics(columns, query_rows, rec_rows)
+    kernel_time = time.perf_counter() - kernel_start
+    
+    print(f"\n{n_queries} queries x {k} recommendations over {catalog_size} restaurants")
+    print(f"calculate_metrics loop: {loop_time * 1000:>10.1f} ms")
+    print(f"Column setup (once):    {columns_time * 1000:>10.1f} ms")
+    print(f"Vectorized kernel:      {kernel_time * 1000:>10.1f} ms ({loop_time / kernel_time:.0f}x)")
+    
+    print("\nLargest difference from calculate_metrics:")
+    for metric, difference in verify_metrics_parity(details, query_rows, rec_rows).items():
+        print(f"{metric:<22} {difference:.2e}")
+
+def _deep_size(rows):
+    """Bytes of a list of tuples including each distinct element object once"""
+    seen = set()
+    total = sys.getsizeof(rows)
+    for row in rows:
+        for value in (row,) + tuple(row):
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+    return total
+
+def run_catalog_benchmark(sizes, seed=42):
+    """Memory and build time of restaurant metadata as a DataFrame, a list of tuples and a Catalog"""
+    import pandas as pd
+    print(f"\n{'restaurants':>12} {'DataFrame MB':>13} {'tuples MB':>10} {'Catalog MB':>11} {'reduction':>10} "
+          f"{'frame s':>8} {'catalog s':>10} {'columns s':>10} {'from catalog s':>15}")
+    print("=" * 107)
+    for size in sizes:
+        restaurant_ids, details = synthetic_catalog(size, seed)
+        review_counts = np.random.default_rng(seed).integers(5, 2000, size=size)
+        
+        frame_start = time.perf_counter()
+        frame = pd.DataFrame(details, columns=list(DETAIL_COLUMNS))
+        frame.insert(0, 'restaurant_id', restaurant_ids)
+        frame['review_count'] = review_counts
+        frame_time = time.perf_counter() - frame_start
+        frame_bytes = frame.memory_usage(deep=True).sum()
+        
+        catalog_start = time.perf_counter()
+        catalog = Catalog(restaurant_ids, details, review_counts)
+        catalog_time = time.perf_counter() - catalog_start
+        
+        # Metric columns as evaluation builds them: parsed from tuples, or taken from the catalog
+        columns_start = time.perf_counter()
+        MetricsColumns(details)
+        columns_time = time.perf_counter() - columns_start
+        from_catalog_start = time.perf_counter()
+        MetricsColumns.from_catalog(catalog)
+        from_catalog_time = time.perf_counter() - from_catalog_start
+        
+        megabytes = 1024 * 1024
+        print(f"{size:>12} {frame_bytes / megabytes:>13.1f} "
+              f"{(_deep_size(details) + _deep_size(restaurant_ids)) / megabytes:>10.1f} "
+              f"{catalog.nbytes() / megabytes:>11.1f} {frame_bytes / catalog.nbytes():>9.1f}x "
+              f"{frame_time:>8.2f} {catalog_time:>10.2f} {columns_time:>10.2f} {from_catalog_time:>15.3f}")
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['methods', 'ann', 'attribute-index', 'metrics', 'shards', 'quantization',
+                                           'catalog'],
+                        default='methods',
+                        help='methods: SQL vs vector queries; ann: IVF recall vs latency sweep; '
+                             'attribute-index: bucket index vs exhaustive scan on synthetic catalogs; '
+                             'metrics: vectorized evaluation metrics vs calculate_metrics; '
+                             'shards: region-sharded vector search vs a full scan; '
+                             'quantization: int8 and product-quantized codes with exact rescoring; '
+                             'catalog: memory of the struct-of-arrays catalog vs a DataFrame')
+    parser.add_argument('--numpy', action='store_true',
+                        help='also time the in-process NumPy vector and attribute engines')
+    parser.add_argument('--nlist', type=int, nargs='+', default=[64, 256, 1024],
+                        help='IVF cell counts to build (ann mode)')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32, 64],
+                        help='IVF cells probed per query (ann mode)')
+    parser.add_argument('--queries', type=int, default=None,
+                        help='number of sampled query restaurants (default 200 in ann, attribute-index, '
+                             'shards and quantization modes, 10000 in metrics mode)')
+    parser.add_argument('--shard-by', nargs='+', choices=sorted(SHARD_KEYS), default=['state', 'city'],
+                        help='region shard keys to compare (shards mode)')
+    parser.add_argument('--fanout-workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='threads scanning shards for cross-region queries (shards mode)')
+    parser.add_argument('--pq-subspaces', type=int, nargs='+', default=[48, 96],
+                        help='product quantization subspaces, one byte each per vector (quantization mode)')
+    parser.add_argument('--rescore', type=int, nargs='+', default=[10, 50, 200],
+                        help='approximate shortlist sizes rescored exactly (quantization mode)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 200000, 1000000],
+                        help='synthetic catalog sizes (attribute-index and catalog modes)')
+    parser.add_argument('--unprepared', action='store_true',
+                        help='send the full SQL text with every query instead of EXECUTE of a prepared statement')
+    parser.add_argument('--connections', choices=['reuse', 'pool', 'per-query'], default='reuse',
+                        help='run all queries on one connection, borrow a pooled connection per sampled '
+                             'restaurant, or open a new one per sampled restaurant')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--index-dir',
+                        help='save each built IVF index (ann mode) or quantized index (quantization mode) here')
+    args = parser.parse_args()
+    
+    if args.mode == 'ann':
+        run_ann_benchmark(args.nlist, args.nprobe, args.queries or 200, args.seed, args.index_dir)
+        return
+    if args.mode == 'shards':
+        conn = db.connect()
+        print("Loading embeddings...")
+        engine = VectorEngine.load(conn)
+        conn.close()
+        run_shard_benchmark(engine, args.shard_by, args.fanout_workers, args.queries or 200, args.seed)
+        return
+    if args.mode == 'quantization':
+        conn = db.connect()
+        print("Loading embeddings...")
+        engine = VectorEngine.load(conn)
+        conn.close()
+        run_quantization_benchmark(engine, args.pq_subspaces, args.rescore, args.queries or 200, args.seed,
+                                   args.index_dir)
+        return
+    if args.mode == 'metrics':
+        run_metrics_benchmark(args.queries or 10000, seed=args.seed)
+        return
+    if args.mode == 'attribute-index':
+        run_attribute_index_benchmark(args.sizes, args.queries or 200, args.seed)
+        return
+    if args.mode == 'catalog':
+        run_catalog_benchmark(args.sizes, args.seed)
+        return
+    
     # Run benchmark
     print("Starting benchmark...")
-    results = run_benchmark()
+    timer = db.QueryTimer()
+    db.add_query_hook(timer)
+    results = run_benchmark(with_numpy=args.numpy, prepared=not args.unprepared,
+                            connections=args.connections)
     
     # Convert to DataFrame
+    import pandas as pd
     df = pd.DataFrame(results)
     
     # Generate summary statistics
     print("\nBenchmark Results:")
     print(f"Number of restaurants tested: {len(df)}")
+    print(f"Statements: {'inline SQL' if args.unprepared else 'prepared'}, connections: {args.connections}")
+    if args.connections != 'reuse':
+        print(f"Connect Average: {df['connect_time'].mean():.4f}")
     print("\nTiming Results (seconds):")
     print(f"SQL Average: {df['sql_time'].mean():.4f}")
     print(f"SQL Max: {df['sql_time'].max():.4f}")
@@ -118,6 +475,20 @@ def main():
     print(f"\nVector Average: {df['vector_time'].mean():.4f}")
     print(f"Vector Max: {df['vector_time'].max():.4f}")
     print(f"Vector Min: {df['vector_time'].min():.4f}")
+    if args.numpy:
+        print(f"\nNumPy Vector Average: {df['numpy_time'].mean():.4f}")
+        print(f"NumPy Vector Max: {df['numpy_time'].max():.4f}")
+        print(f"NumPy Vector Min: {df['numpy_time'].min():.4f}")
+        print(f"NumPy speedup over pgvector: {df['vector_time'].mean() / df['numpy_time'].mean():.1f}x")
+        print(f"Top match agreement: {(df['numpy_top_match'] == df['vector_top_match']).mean():.2%}")
+        print(f"\nNumPy Attribute Average: {df['numpy_attribute_time'].mean():.4f}")
+        print(f"NumPy Attribute Max: {df['numpy_attribute_time'].max():.4f}")
+        print(f"NumPy Attribute Min: {df['numpy_attribute_time'].min():.4f}")
+        print(f"NumPy speedup over SQL: {df['sql_time'].mean() / df['numpy_attribute_time'].mean():.1f}x")
+    
+    print("\nPer-statement timing (calls, mean ms):")
+    for name, (calls, total, mean) in timer.summary().items():
+        print(f"{name:<24} {calls:>6} {mean * 1000:>10.3f}")
     
     print("\nSimilarity Scores:")
     print(f"SQL Average: {df['sql_similarity'].mean():.4f}")
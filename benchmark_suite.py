@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import db
+from attribute_engine import SQL_WEIGHTS, AttributeEngine
+from attribute_index import AttributeIndex
+from catalog import Catalog
+from ann_index import IVFIndex
+from evaluation import sample_restaurants
+from hybrid_engine import HybridEngine
+from sharded_index import ShardedIndex
+from quantized_index import QuantizedIndex
+from materialized_neighbors import NeighborTable
+from recommendation_cache import CachedRepository, RecommendationCache
+from vector_engine import VectorEngine
+
+# name -> factory(conn, context) returning query(restaurant_id, k)
+BACKENDS = {}
+
+def register_backend(name):
+    """Register a backend factory under name"""
+    def decorator(factory):
+        BACKENDS[name] = factory
+        return factory
+    return decorator
+
+def _catalog(conn, context):
+    # Restaurant metadata shared by every in-memory engine of a run
+    if 'catalog' not in context:
+        context['catalog'] = Catalog.load(conn)
+    return context['catalog']
+
+def _vector_engine(conn, context):
+    if 'vector_engine' not in context:
+        context['vector_engine'] = VectorEngine.load(conn, catalog=_catalog(conn, context))
+    return context['vector_engine']
+
+def _attribute_engine(conn, context):
+    if 'attribute_engine' not in context:
+        context['attribute_engine'] = AttributeEngine.from_catalog(_catalog(conn, context))
+    return context['attribute_engine']
+
+def _shared(context, key, build):
+    # Indexes that do not depend on the connection are built once per context and shared by
+    # every connection of a run; only the DB-backed backends need a fresh object per connection
+    if key not in context:
+        context[key] = build()
+    return context[key]
+
+def _on_close(context, cleanup):
+    """Register cleanup to run when the backends built with context are torn down"""
+    context.setdefault('cleanups', []).append(cleanup)
+
+def close_context(context):
+    """Release what the backends of a run registered: thread pools, temporary directories"""
+    cleanups = context.pop('cleanups', [])
+    while cleanups:
+        cleanups.pop()()
+
+def _quantized_dir(context, kind):
+    # Codes go to a temporary directory removed on teardown unless context['quantized_dir'] is given
+    if context.get('quantized_dir') is None:
+        directory = tempfile.mkdtemp(prefix='quantized-')
+        _on_close(context, lambda: shutil.rmtree(directory, ignore_errors=True))
+        context['quantized_dir'] = directory
+    return os.path.join(context['quantized_dir'], kind)
+
+def _recommendation_cache(context):
+    # One cache shared by every connection of a run; sized by context['cache_options'] if given
+    if 'recommendation_cache' not in context:
+        context['recommendation_cache'] = RecommendationCache(**context.get('cache_options', {}))
+    return context['recommendation_cache']
+
+def _formatted(engine, index):
+    # ANN and quantized indexes return (rows, scores); shape them like every other backend's results
+    def query(rest_id, k):
+        rows, scores = index.neighbors(rest_id, k)
+        return [tuple(engine.details[row][:4]) + (float(score),) for row, score in zip(rows, scores)]
+    return query
+
+@register_backend('pgvector')
+def pgvector_backend(conn, context):
+    repo = db.Repository(conn)
+    return lambda rest_id, k: repo.vector_recommendations(rest_id, k)
+
+@register_backend('attribute-sql')
+def attribute_sql_backend(conn, context):
+    repo = db.Repository(conn)
+    return lambda rest_id, k: repo.sql_recommendations(rest_id, SQL_WEIGHTS, k)
+
+@register_backend('cached-pgvector')
+def cached_pgvector_backend(conn, context):
+    repo = CachedRepository(db.Repository(conn), _recommendation_cache(context))
+    return lambda rest_id, k: repo.vector_recommendations(rest_id, k)
+
+@register_backend('cached-attribute-sql')
+def cached_attribute_sql_backend(conn, context):
+    repo = CachedRepository(db.Repository(conn), _recommendation_cache(context))
+    return lambda rest_id, k: repo.sql_recommendations(rest_id, SQL_WEIGHTS, k)
+
+@register_backend('numpy-vector')
+def numpy_vector_backend(conn, context):
+    return _vector_engine(conn, context).top_k
+
+@register_backend('numpy-attribute')
+def numpy_attribute_backend(conn, context):
+    return _attribute_engine(conn, context).top_k
+
+@register_backend('attribute-index')
+def attribute_index_backend(conn, context):
+    return _shared(context, 'attribute_index',
+                   lambda: AttributeIndex.from_engine(_attribute_engine(conn, context))).top_k
+
+@register_backend('ivf')
+def ivf_backend(conn, context):
+    engine = _vector_engine(conn, context)
+    return _formatted(engine, _shared(context, 'ivf_index', lambda: IVFIndex.from_engine(engine)))
+
+@register_backend('hybrid')
+def hybrid_backend(conn, context):
+    return _shared(context, 'hybrid', lambda: HybridEngine(
+        _vector_engine(conn, context), _attribute_engine(conn, context),
+        depth=context.get('hybrid_depth', 200))).top_k
+
+@register_backend('hybrid-state')
+def hybrid_state_backend(conn, context):
+    return _shared(context, 'hybrid_state', lambda: HybridEngine(
+        _vector_engine(conn, context), _attribute_engine(conn, context),
+        depth=context.get('hybrid_depth', 200), location='state')).top_k
+
+@register_backend('sharded-state')
+def sharded_state_backend(conn, context):
+    return _shared(context, 'sharded_state', lambda: ShardedIndex(_vector_engine(conn, context), 'state',
+                                                                  workers=1)).top_k
+
+@register_backend('sharded-city')
+def sharded_city_backend(conn, context):
+    return _shared(context, 'sharded_city', lambda: ShardedIndex(_vector_engine(conn, context), 'city',
+                                                                 workers=1)).top_k
+
+@register_backend('sharded-fanout')
+def sharded_fanout_backend(conn, context):
+    def build():
+        index = ShardedIndex(_vector_engine(conn, context), 'state', workers=context.get('fanout_workers', 4))
+        _on_close(context, index.close)
+        return index
+    return _shared(context, 'sharded_fanout', build).top_k_fanout
+
+@register_backend('int8-rescore')
+def int8_backend(conn, context):
+    engine = _vector_engine(conn, context)
+    return _formatted(engine, _shared(context, 'int8_index', lambda: QuantizedIndex.from_engine(
+        engine, _quantized_dir(context, 'int8'), kind='int8')))
+
+@register_backend('pq-rescore')
+def pq_backend(conn, context):
+    engine = _vector_engine(conn, context)
+    return _formatted(engine, _shared(context, 'pq_index', lambda: QuantizedIndex.from_engine(
+        engine, _quantized_dir(context, 'pq'), kind='pq')))
+
+@register_backend('materialized-vector')
+def materialized_vector_backend(conn, context):
+    repo = db.Repository(conn)
+    return lambda rest_id, k: repo.materialized_recommendations(rest_id, 'vector', k)
+
+@register_backend('materialized-attribute')
+def materialized_attribute_backend(conn, context):
+    repo = db.Repository(conn)
+    return lambda rest_id, k: repo.materialized_recommendations(rest_id, 'sql', k)
+
+def _neighbor_table(context):
+    if 'neighbor_table' not in context:
+        context['neighbor_table'] = NeighborTable.open(context.get('neighbors_dir', 'neighbors'))
+    return context['neighbor_table']
+
+@register_backend('mmap-vector')
+def mmap_vector_backend(conn, context):
+    table = _neighbor_table(context)
+    return lambda rest_id, k: table.top_k(rest_id, 'vector', k)
+
+@register_backend('mmap-attribute')
+def mmap_attribute_backend(conn, context):
+    table = _neighbor_table(context)
+    return lambda rest_id, k: table.top_k(rest_id, 'sql', k)
+
+def bootstrap_ci(clusters, statistic, n_resamples=1000, confidence=0.95, seed=0):
+    """Cluster bootstrap confidence interval of statistic over all values of clusters
+
+    clusters has one row per query holding that query's repeated latencies.
+    Repeats of one query are correlated, so whole queries are resampled
+    rather than individual calls.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(clusters), size=(n_resamples, len(clusters)))
+    estimates = statistic(clusters[picks].reshape(n_resamples, -1), axis=1)
+    alpha = (1 - confidence) / 2
+    return float(np.quantile(estimates, alpha)), float(np.quantile(estimates, 1 - alpha))
+
+def summarize(latencies_ns, seed=0):
+    """Latency statistics in milliseconds, with 95% bootstrap intervals for the mean and median
+
+    latencies_ns has shape (repeats, queries) as returned by time_backend;
+    a flat sequence is treated as one call per query.
+    """
+    ms = np.asarray(latencies_ns, dtype=np.float64) / 1e6
+    clusters = ms.reshape(-1, 1) if ms.ndim == 1 else ms.T
+    flat = clusters.ravel()
+    return {
+        'n': len(flat),
+        'queries': len(clusters),
+        'mean_ms': float(flat.mean()),
+        'std_ms': float(flat.std(ddof=1)) if len(flat) > 1 else 0.0,
+        'min_ms': float(flat.min()),
+        'p50_ms': float(np.percentile(flat, 50)),
+        'p90_ms': float(np.percentile(flat, 90)),
+        'p99_ms': float(np.percentile(flat, 99)),
+        'max_ms': float(flat.max()),
+        'mean_ci_ms': bootstrap_ci(clusters, np.mean, seed=seed),
+        'p50_ci_ms': bootstrap_ci(clusters, np.median, seed=seed)
+    }
+
+def time_backend(query, query_ids, k=5, warmup=10, repeats=5, seed=42):
+    """Per-call latencies in nanoseconds, shape (repeats, len(query_ids))
+
+    The first warmup calls are not recorded. Each pass visits the queries
+    in a different seeded order so caching does not favour a fixed sequence,
+    and entry [pass, i] is the latency of query_ids[i] in that pass. The
+    timed region includes fetching every result row.
+    """
+    rng = np.random.default_rng(seed)
+    for rest_id in query_ids[:warmup]:
+        query(rest_id, k)
+    latencies = np.empty((repeats, len(query_ids)), dtype=np.int64)
+    for repeat in range(repeats):
+        for i in rng.permutation(len(query_ids)):
+            start = time.perf_counter_ns()
+            query(query_ids[i], k)
+            latencies[repeat, i] = time.perf_counter_ns() - start
+    return latencies
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(backends, n_queries=100, seed=42, warmup=10, repeats=5, k=5, context=None):
+    """Benchmark each backend on the same seeded sample and return a JSON-serializable result"""
+    conn = db.connect()
+    query_ids = [row[0] for row in sample_restaurants(conn, n_queries, seed)]
+    context = {} if context is None else context
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'params': {'queries': len(query_ids), 'seed': seed, 'warmup': warmup, 'repeats': repeats, 'k': k},
+        'backends': {}
+    }
+    try:
+        for name in backends:
+            setup_start = time.perf_counter()
+            query = BACKENDS[name](conn, context)
+            setup_seconds = time.perf_counter() - setup_start
+            print(f"Timing {name}...")
+            latencies = time_backend(query, query_ids, k, warmup, repeats, seed)
+            results['backends'][name] = dict(summarize(latencies, seed), setup_seconds=setup_seconds)
+    finally:
+        close_context(context)
+        conn.close()
+    return results
+
+def print_results(results):
+    params = results['params']
+    print(f"\n{params['queries']} queries x {params['repeats']} repeats, {params['warmup']} warmup, "
+          f"seed {params['seed']}, k={params['k']}")
+    print(f"\n{'backend':<16} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'mean 95% CI':>21}")
+    print("=" * 78)
+    for name, stats in results['backends'].items():
+        low, high = stats['mean_ci_ms']
+        print(f"{name:<16} {stats['p50_ms']:>9.3f} {stats['p90_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+              f"{stats['mean_ms']:>9.3f} {f'[{low:.3f}, {high:.3f}]':>21}")
+
+    names = list(results['backends'])
+    if len(names) > 1:
+        base = results['backends'][names[0]]
+        print(f"\nSpeedup of median latency over {names[0]}:")
+        for name in names[1:]:
+            stats = results['backends'][name]
+            # Conservative interval: slowest plausible base over fastest plausible candidate and vice versa
+            low = base['p50_ci_ms'][0] / stats['p50_ci_ms'][1]
+            high = base['p50_ci_ms'][1] / stats['p50_ci_ms'][0]
+            print(f"{name:<16} {base['p50_ms'] / stats['p50_ms']:>7.2f}x  [{low:.2f}x, {high:.2f}x]")
+
+def compare(baseline, candidate, threshold=0.10):
+    """Return backends whose median latency got worse than threshold beyond the confidence intervals"""
+    regressions = []
+    print(f"\n{'backend':<16} {'base p50':>10} {'new p50':>10} {'change':>8}  status")
+    print("=" * 58)
+    for name, new in candidate['backends'].items():
+        old = baseline['backends'].get(name)
+        if old is None:
+            print(f"{name:<16} {'-':>10} {new['p50_ms']:>10.3f} {'-':>8}  new")
+            continue
+        change = new['p50_ms'] / old['p50_ms'] - 1
+        # Only flag changes larger than the threshold whose intervals do not overlap
+        if change > threshold and new['p50_ci_ms'][0] > old['p50_ci_ms'][1]:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold and new['p50_ci_ms'][1] < old['p50_ci_ms'][0]:
+            status = 'improved'
+        else:
+            status = 'ok'
+        print(f"{name:<16} {old['p50_ms']:>10.3f} {new['p50_ms']:>10.3f} {change:>+7.1%}  {status}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Recommendation latency benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='benchmark backends and write a JSON result file')
+    run.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=['pgvector', 'attribute-sql'])
+    run.add_argument('--queries', type=int, default=100)
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--warmup', type=int, default=10, help='untimed calls before measuring')
+    run.add_argument('--repeats', type=int, default=5, help='timed passes over the sampled queries')
+    run.add_argument('--k', type=int, default=5)
+    run.add_argument('--output', help='result file (default benchmark_<timestamp>.json)')
+    run.add_argument('--neighbors-dir', default='neighbors', help='materialized neighbors for the mmap-* backends')
+    run.add_argument('--quantized-dir',
+                     help='keep the codes of the *-rescore backends here (default: a temporary directory)')
+    run.add_argument('--hybrid-depth', type=int, default=200, help='vector candidates reranked by the hybrid-* backends')
+
+    cmp = commands.add_parser('compare', help='flag regressions between two result files')
+    cmp.add_argument('baseline')
+    cmp.add_argument('candidate')
+    cmp.add_argument('--threshold', type=float, default=0.10,
+                     help='relative slowdown of median latency that counts as a regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run_suite(args.backends, args.queries, args.seed, args.warmup, args.repeats, args.k,
+                            {'neighbors_dir': args.neighbors_dir, 'hybrid_depth': args.hybrid_depth,
+                             'quantized_dir': args.quantized_dir})
+        print_results(results)
+        output = args.output or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {output}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.threshold)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import io
+import struct
+import numpy as np
+
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_BINARY_TRAILER = struct.pack('!h', -1)
+
+RESTAURANT_COLUMNS = ('restaurant_id', 'name', 'address', 'city', 'state', 'categories',
+                      'price_level', 'avg_rating', 'review_count')
+REVIEW_COLUMNS = ('review_id', 'restaurant_id', 'user_id', 'rating', 'review_text', 'review_date')
+EMBEDDING_COLUMNS = ('restaurant_id', 'embedding')
+
+_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def encode_text_value(value):
+    """Encode one value for COPY text format"""
+    if value is None:
+        return '\\N'
+    return str(value).translate(_TEXT_ESCAPES)
+
+def encode_text_rows(rows):
+    """Encode rows as COPY text format lines"""
+    return ''.join('\t'.join(encode_text_value(v) for v in row) + '\n' for row in rows)
+
+def encode_vector(embedding):
+    """pgvector binary wire format: int16 dimensions, int16 unused, big-endian float4 values"""
+    values = np.asarray(embedding, dtype='>f4')
+    return struct.pack('!hh', len(values), 0) + values.tobytes()
+
+def encode_embedding_rows(rows):
+    """Encode (restaurant_id, embedding) rows as COPY binary format"""
+    parts = [COPY_BINARY_HEADER]
+    for rest_id, embedding in rows:
+        rest_id = rest_id.encode('utf-8')
+        vector = encode_vector(embedding)
+        parts.append(struct.pack('!hi', 2, len(rest_id)))
+        parts.append(rest_id)
+        parts.append(struct.pack('!i', len(vector)))
+        parts.append(vector)
+    parts.append(COPY_BINARY_TRAILER)
+    return b''.join(parts)
+
+class CopyWriter:
+    """Write row batches to a table with COPY ... FROM STDIN
+
+    Plain COPY fails on duplicate keys. With staging=True each batch is
+    copied into an unlogged staging table and merged with
+    INSERT ... ON CONFLICT DO NOTHING, matching the execute_batch path.
+    Embeddings are sent in binary format to avoid formatting 384 floats as text.
+    """
+
+    def __init__(self, cur, table, columns, key, staging=False, binary=False):
+        self.cur = cur
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self.staging = staging
+        self.binary = binary
+        self.bytes_written = 0
+        self.target = f"{table}_staging" if staging else table
+        if staging:
+            cur.execute(f"CREATE UNLOGGED TABLE IF NOT EXISTS {self.target} "
+                        f"(LIKE {table} INCLUDING DEFAULTS)")
+            cur.execute(f"TRUNCATE {self.target}")
+
+    def __call__(self, rows):
+        """Write one batch of rows"""
+        column_list = ', '.join(self.columns)
+        if self.binary:
+            payload = encode_embedding_rows(rows)
+            sql = f"COPY {self.target} ({column_list}) FROM STDIN WITH (FORMAT binary)"
+        else:
+            payload = encode_text_rows(rows).encode('utf-8')
+            sql = f"COPY {self.target} ({column_list}) FROM STDIN"
+        self.cur.copy_expert(sql, io.BytesIO(payload))
+        self.bytes_written += len(payload)
+
+        if self.staging:
+            self.cur.execute(f"""
+                INSERT INTO {self.table} ({column_list})
+                SELECT {column_list} FROM {self.target}
+                ON CONFLICT ({self.key}) DO NOTHING
+            """)
+            self.cur.execute(f"TRUNCATE {self.target}")
+
+def restaurant_writer(cur, staging=False):
+    return CopyWriter(cur, 'restaurants', RESTAURANT_COLUMNS, 'restaurant_id', staging)
+
+def review_writer(cur, staging=False):
+    return CopyWriter(cur, 'ratings', REVIEW_COLUMNS, 'review_id', staging)
+
+def embedding_writer(cur, staging=False):
+    return CopyWriter(cur, 'restaurant_embeddings', EMBEDDING_COLUMNS, 'restaurant_id', staging, binary=True)
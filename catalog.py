@@ -0,0 +1,226 @@
+import sys
+from collections.abc import Sequence
+import numpy as np
+
+# Same order as vector_engine.DETAIL_COLUMNS
+DETAIL_COLUMNS = ('name', 'categories', 'price_level', 'avg_rating', 'city', 'state')
+# Column arrays of a Catalog; everything else is ids and small vocabularies
+ARRAY_COLUMNS = ('name_buffer', 'name_offsets', 'price_level', 'avg_rating', 'review_count', 'location_id',
+                 'state_id', 'category_set', 'category_offsets', 'category_ids')
+
+def _intern(values):
+    """(ids, vocabulary): an int32 id per value and the distinct values in first-seen order"""
+    ids = {}
+    codes = np.array([ids.setdefault(value, len(ids)) for value in values], dtype=np.int32)
+    return codes, list(ids)
+
+class Catalog:
+    """Struct-of-arrays restaurant metadata
+
+    Numbers are typed column arrays, names one UTF-8 buffer with offsets,
+    (city, state) pairs and states interned ids. Each distinct categories
+    string is split once into sorted integer ids over a shared vocabulary
+    (calculate_metrics' ', ' split), stored as offsets into one array.
+    """
+
+    def __init__(self, restaurant_ids, details, review_counts=None):
+        """details: rows of (name, categories, price_level, avg_rating, city, state)"""
+        self.restaurant_ids = list(restaurant_ids)
+        self.row_by_id = {rest_id: row for row, rest_id in enumerate(self.restaurant_ids)}
+        n = len(self.restaurant_ids)
+
+        names = [row[0].encode('utf-8') for row in details]
+        self.name_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in names], out=self.name_offsets[1:])
+        self.name_buffer = np.frombuffer(b''.join(names), dtype=np.uint8)
+        self.price_level = np.array([row[2] for row in details], dtype=np.int8)
+        self.avg_rating = np.array([float(row[3]) for row in details], dtype=np.float64)
+        self.review_count = np.array(review_counts if review_counts is not None else [0] * n, dtype=np.int32)
+
+        self.location_id, self.locations = _intern([(row[4], row[5]) for row in details])
+        self.state_id, self.states = _intern([row[5] for row in details])
+
+        # One entry per distinct categories string; rows point at it
+        self.category_set, self.category_strings = _intern([row[1] for row in details])
+        vocabulary = {}
+        members = [sorted({vocabulary.setdefault(category, len(vocabulary)) for category in value.split(', ')})
+                   for value in self.category_strings]
+        self.category_vocabulary = list(vocabulary)
+        self.category_offsets = np.zeros(len(members) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in members], out=self.category_offsets[1:])
+        self.category_ids = np.array([category for ids in members for category in ids], dtype=np.int32)
+        self._category_bitsets = None
+        self.details = CatalogDetails(self)
+
+    @classmethod
+    def load(cls, conn):
+        """Load every restaurant in restaurant_id order, like the engines"""
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT restaurant_id, name, categories, price_level, avg_rating, city, state, review_count
+            FROM restaurants
+            ORDER BY restaurant_id
+        """)
+        rows = cur.fetchall()
+        cur.close()
+        return cls([row[0] for row in rows], [row[1:7] for row in rows], [row[7] or 0 for row in rows])
+
+    @classmethod
+    def from_arrays(cls, restaurant_ids, arrays, category_strings, category_vocabulary, locations, states):
+        """Rebuild a catalog around existing column arrays (e.g. views of a snapshot) without copying them"""
+        catalog = cls.__new__(cls)
+        catalog.restaurant_ids = list(restaurant_ids)
+        catalog.row_by_id = {rest_id: row for row, rest_id in enumerate(catalog.restaurant_ids)}
+        for name in ARRAY_COLUMNS:
+            setattr(catalog, name, arrays[name])
+        catalog.category_strings = list(category_strings)
+        catalog.category_vocabulary = list(category_vocabulary)
+        catalog.locations = [tuple(location) for location in locations]
+        catalog.states = list(states)
+        catalog._category_bitsets = None
+        catalog.details = CatalogDetails(catalog)
+        return catalog
+
+    def arrays(self):
+        """name -> column array, the counterpart of from_arrays"""
+        return {name: getattr(self, name) for name in ARRAY_COLUMNS}
+
+    def __len__(self):
+        return len(self.restaurant_ids)
+
+    def name(self, row):
+        return bytes(self.name_buffer[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+    def categories(self, row):
+        return self.category_strings[self.category_set[row]]
+
+    def category_id_set(self, row):
+        """Sorted vocabulary ids of the row's categories"""
+        category_set = self.category_set[row]
+        return self.category_ids[self.category_offsets[category_set]:self.category_offsets[category_set + 1]]
+
+    def city(self, row):
+        return self.locations[self.location_id[row]][0]
+
+    def state(self, row):
+        return self.states[self.state_id[row]]
+
+    def view(self, row):
+        return RestaurantView(self, row)
+
+    def get(self, restaurant_id):
+        """Row view of a restaurant id, or None"""
+        row = self.row_by_id.get(restaurant_id)
+        return None if row is None else RestaurantView(self, row)
+
+    def category_bitsets(self):
+        """uint64 bitsets over the category vocabulary, one row per distinct categories string"""
+        if self._category_bitsets is None:
+            n_words = max(1, (len(self.category_vocabulary) + 63) // 64)
+            bitsets = np.zeros((len(self.category_strings), n_words), dtype=np.uint64)
+            owners = np.repeat(np.arange(len(self.category_strings)), np.diff(self.category_offsets))
+            bits = np.left_shift(np.uint64(1), (self.category_ids & 63).astype(np.uint64))
+            np.bitwise_or.at(bitsets, (owners, self.category_ids >> 6), bits)
+            self._category_bitsets = bitsets
+        return self._category_bitsets
+
+    def nbytes(self):
+        """Approximate memory held by the catalog, including ids, lookup dict and vocabularies"""
+        strings = (self.restaurant_ids + self.category_strings + self.category_vocabulary + self.states +
+                   [city for city, _ in self.locations])
+        return (sum(array.nbytes for array in self.arrays().values()) +
+                sum(sys.getsizeof(value) for value in strings) + sys.getsizeof(self.restaurant_ids) +
+                sys.getsizeof(self.row_by_id) + sys.getsizeof(self.locations) +
+                sum(sys.getsizeof(location) for location in self.locations))
+
+class CatalogDetails(Sequence):
+    """Read-only sequence of detail tuples over catalog rows, built on access
+
+    Engines take it in place of a list of (name, categories, price_level,
+    avg_rating, city, state) tuples. rows selects and orders a subset.
+    """
+
+    def __init__(self, catalog, rows=None):
+        self.catalog = catalog
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.catalog) if self.rows is None else len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        row = index if self.rows is None else self.rows[index]
+        catalog = self.catalog
+        city, state = catalog.locations[catalog.location_id[row]]
+        return (catalog.name(row), catalog.categories(row), int(catalog.price_level[row]),
+                float(catalog.avg_rating[row]), city, state)
+
+    def subset(self, rows):
+        """Details of the given catalog rows, in that order"""
+        return CatalogDetails(self.catalog, rows)
+
+    def catalog_rows(self):
+        return np.arange(len(self.catalog)) if self.rows is None else self.rows
+
+class RestaurantView:
+    """Lightweight read-only view of one catalog row
+
+    Supports item access and items() over DETAIL_COLUMNS, so it can be
+    passed to calculate_metrics in place of a dict.
+    """
+    __slots__ = ('catalog', 'row')
+
+    def __init__(self, catalog, row):
+        self.catalog = catalog
+        self.row = row
+
+    @property
+    def restaurant_id(self):
+        return self.catalog.restaurant_ids[self.row]
+
+    @property
+    def name(self):
+        return self.catalog.name(self.row)
+
+    @property
+    def categories(self):
+        return self.catalog.categories(self.row)
+
+    @property
+    def category_ids(self):
+        return self.catalog.category_id_set(self.row)
+
+    @property
+    def price_level(self):
+        return int(self.catalog.price_level[self.row])
+
+    @property
+    def avg_rating(self):
+        return float(self.catalog.avg_rating[self.row])
+
+    @property
+    def review_count(self):
+        return int(self.catalog.review_count[self.row])
+
+    @property
+    def city(self):
+        return self.catalog.city(self.row)
+
+    @property
+    def state(self):
+        return self.catalog.state(self.row)
+
+    def __getitem__(self, key):
+        if key not in DETAIL_COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return DETAIL_COLUMNS
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in DETAIL_COLUMNS]
+
+    def __repr__(self):
+        return f"RestaurantView({self.restaurant_id!r}, {self.name!r})"
@@ -1,6 +1,13 @@
-import psycopg2
+import argparse
+import db
+import instrumentation
+from instrumentation import stage
 import numpy as np
 from tqdm import tqdm
+from vector_engine import VectorEngine
+from attribute_engine import CATEGORY_MATCHING_WEIGHTS, AttributeEngine
+from catalog import Catalog
+from evaluation import batched_recommendations, parallel_map, sample_restaurants
 
 def calculate_category_accuracy(original_categories, recommended_categories):
     """
@@ -18,75 +25,64 @@ def calculate_category_accuracy(original_categories, recommended_categories):
         return 0.0
     return overlap / len(orig_cats)
 
-def evaluate_recommendations():
+def _score_query(args):
+    """Average category match of both methods for one query; None where a method returned nothing"""
+    categories, sql_recs, vector_recs = args
+    return (np.mean([calculate_category_accuracy(categories, rec[1]) for rec in sql_recs]) if sql_recs else None,
+            np.mean([calculate_category_accuracy(categories, rec[1]) for rec in vector_recs]) if vector_recs else None)
+
+def evaluate_recommendations(backend='sql', batched=False, samples=50, seed=42, workers=1):
     # Connect to database
-    conn = psycopg2.connect(
-        dbname="restaurant_db",
-        user="helloalpacaa",
-        host="localhost"
-    )
-    cur = conn.cursor()
+    conn = db.connect()
+    repo = db.Repository(conn)
     
     # Get sample restaurants for testing
-    cur.execute("""
-        SELECT DISTINCT r.restaurant_id, r.name, r.categories
-        FROM restaurants r
-        JOIN restaurant_embeddings re ON r.restaurant_id = re.restaurant_id
-        LIMIT 50
-    """)
-    test_restaurants = cur.fetchall()
+    with stage('sample'):
+        test_restaurants = sample_restaurants(conn, samples, seed)
+    
+    with stage('engines.load'):
+        catalog = Catalog.load(conn) if backend == 'numpy' else None
+        engine = VectorEngine.load(conn, catalog=catalog) if catalog else None
+        attribute_engine = AttributeEngine.from_catalog(catalog) if catalog else None
     
     sql_scores = []
     vector_scores = []
     
     print("Evaluating recommendations...")
-    for rest_id, name, categories in tqdm(test_restaurants):
-        # Get SQL-based recommendations
-        cur.execute("""
-            WITH RestaurantMetrics AS (
-                SELECT 
-                    r.restaurant_id,
-                    r.name,
-                    r.categories,
-                    r.price_level,
-                    r.avg_rating
-                FROM restaurants r
-            )
-            SELECT 
-                r2.name,
-                r2.categories
-            FROM RestaurantMetrics r1
-            JOIN RestaurantMetrics r2 ON r1.restaurant_id != r2.restaurant_id
-            WHERE r1.restaurant_id = %s
-            ORDER BY (
-                CASE WHEN r1.categories = r2.categories THEN 0.3 ELSE 0 END +
-                (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * 0.7
-            ) DESC
-            LIMIT 5
-        """, (rest_id,))
-        sql_recs = cur.fetchall()
-        
-        # Get vector-based recommendations
-        cur.execute("""
-            SELECT 
-                r.name,
-                r.categories
-            FROM restaurant_embeddings re1
-            JOIN restaurant_embeddings re2 ON re1.restaurant_id != re2.restaurant_id
-            JOIN restaurants r ON re2.restaurant_id = r.restaurant_id
-            WHERE re1.restaurant_id = %s
-            ORDER BY 1 - (re1.embedding <=> re2.embedding) DESC
-            LIMIT 5
-        """, (rest_id,))
-        vector_recs = cur.fetchall()
-        
-        # Calculate average category match scores
-        if sql_recs:
-            sql_score = np.mean([calculate_category_accuracy(categories, rec[1]) for rec in sql_recs])
+    rest_ids = [rest_data[0] for rest_data in test_restaurants]
+    if batched:
+        # Both methods' top-5 for the whole sample at once
+        with stage('recommend.batched'):
+            all_sql_recs, all_vector_recs = batched_recommendations(repo, rest_ids, CATEGORY_MATCHING_WEIGHTS, 5,
+                                                                    engine, attribute_engine)
+    else:
+        all_sql_recs = []
+        all_vector_recs = []
+        for rest_id in tqdm(rest_ids):
+            # Get SQL-based recommendations
+            if attribute_engine is not None:
+                sql_recs = [rec[:2] for rec in attribute_engine.top_k(rest_id, k=5, weights=CATEGORY_MATCHING_WEIGHTS)]
+            else:
+                sql_recs = repo.sql_recommendations(rest_id, CATEGORY_MATCHING_WEIGHTS, k=5)
+            
+            # Get vector-based recommendations
+            if engine is not None:
+                vector_recs = [rec[:2] for rec in engine.top_k(rest_id, k=5)]
+            else:
+                vector_recs = repo.vector_recommendations(rest_id, k=5)
+            all_sql_recs.append(sql_recs)
+            all_vector_recs.append(vector_recs)
+    
+    # Calculate average category match scores
+    queries = [(rest_data[2], [rec[:2] for rec in sql_recs], [rec[:2] for rec in vector_recs])
+               for rest_data, sql_recs, vector_recs in zip(test_restaurants, all_sql_recs, all_vector_recs)]
+    with stage('score'):
+        scored = parallel_map(_score_query, queries, workers)
+    for sql_score, vector_score in scored:
+        if sql_score is not None:
             sql_scores.append(sql_score)
             
-        if vector_recs:
-            vector_score = np.mean([calculate_category_accuracy(categories, rec[1]) for rec in vector_recs])
+        if vector_score is not None:
             vector_scores.append(vector_score)
     
     # Print results
@@ -99,4 +95,20 @@ def evaluate_recommendations():
     conn.close()
 
 if __name__ == "__main__":
-    evaluate_recommendations()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['sql', 'numpy'], default='sql',
+                        help='run recommendations in PostgreSQL or in the in-process NumPy engines')
+    parser.add_argument('--batched', action='store_true',
+                        help='fetch top-k of the whole sample in one LATERAL query or engine batch per method')
+    parser.add_argument('--samples', type=int, default=50, help='number of sampled restaurants')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the restaurant sample')
+    parser.add_argument('--workers', type=int, default=1, help='processes scoring the recommendations')
+    parser.add_argument('--metrics-file', help='write stage timings, counters and captured query plans here')
+    parser.add_argument('--explain-rate', type=float, default=None,
+                        help='fraction of queries re-run under EXPLAIN (ANALYZE, BUFFERS)')
+    args = parser.parse_args()
+    instrumentation.configure(explain_rate=args.explain_rate)
+    evaluate_recommendations(backend=args.backend, batched=args.batched, samples=args.samples,
+                             seed=args.seed, workers=args.workers)
+    if args.metrics_file:
+        instrumentation.write_report(args.metrics_file)
@@ -0,0 +1,329 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.extensions import connection as _connection
+from psycopg2.pool import ThreadedConnectionPool
+import instrumentation
+
+# Connection settings; override with environment variables
+DB_PARAMS = {
+    'dbname': os.environ.get('RESTAURANT_DB_NAME', 'restaurant_db'),
+    'user': os.environ.get('RESTAURANT_DB_USER', 'helloalpacaa'),
+    'password': os.environ.get('RESTAURANT_DB_PASSWORD', ''),
+    'host': os.environ.get('RESTAURANT_DB_HOST', 'localhost'),
+    'port': os.environ.get('RESTAURANT_DB_PORT', '5432')
+}
+
+RECOMMENDATION_COLUMNS = ('name', 'categories', 'price_level', 'avg_rating', 'similarity_score', 'city', 'state')
+
+# Server-side prepared statements: name -> (parameter types, SQL)
+STATEMENTS = {
+    'restaurant_details': ('text', """
+        SELECT name, categories, price_level, avg_rating, city, state
+        FROM restaurants
+        WHERE restaurant_id = $1
+    """),
+    'sql_recommendations': ('text, float8, float8, float8, int', """
+        SELECT
+            r2.name,
+            r2.categories,
+            r2.price_level,
+            r2.avg_rating,
+            (
+                CASE WHEN r1.categories = r2.categories THEN $2 ELSE 0 END +
+                (1 - ABS(r1.price_level - r2.price_level)::float/4) * $3 +
+                (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * $4
+            ) as similarity_score,
+            r2.city,
+            r2.state
+        FROM restaurants r1
+        JOIN restaurants r2 ON r1.restaurant_id != r2.restaurant_id
+        WHERE r1.restaurant_id = $1
+        ORDER BY similarity_score DESC
+        LIMIT $5
+    """),
+    'vector_recommendations': ('text, int', """
+        SELECT
+            r.name,
+            r.categories,
+            r.price_level,
+            r.avg_rating,
+            1 - (re1.embedding <=> re2.embedding) as similarity_score,
+            r.city,
+            r.state
+        FROM restaurant_embeddings re1
+        JOIN restaurant_embeddings re2 ON re1.restaurant_id != re2.restaurant_id
+        JOIN restaurants r ON re2.restaurant_id = r.restaurant_id
+        WHERE re1.restaurant_id = $1
+        ORDER BY similarity_score DESC
+        LIMIT $2
+    """),
+    'sql_recommendations_batch': ('text[], float8, float8, float8, int', """
+        SELECT q.restaurant_id, rec.*
+        FROM unnest($1) WITH ORDINALITY AS q(restaurant_id, ord)
+        JOIN restaurants r1 ON r1.restaurant_id = q.restaurant_id
+        CROSS JOIN LATERAL (
+            SELECT
+                r2.name,
+                r2.categories,
+                r2.price_level,
+                r2.avg_rating,
+                (
+                    CASE WHEN r1.categories = r2.categories THEN $2 ELSE 0 END +
+                    (1 - ABS(r1.price_level - r2.price_level)::float/4) * $3 +
+                    (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * $4
+                ) as similarity_score,
+                r2.city,
+                r2.state
+            FROM restaurants r2
+            WHERE r2.restaurant_id != r1.restaurant_id
+            ORDER BY similarity_score DESC
+            LIMIT $5
+        ) rec
+        ORDER BY q.ord, rec.similarity_score DESC
+    """),
+    'vector_recommendations_batch': ('text[], int', """
+        SELECT q.restaurant_id, rec.*
+        FROM unnest($1) WITH ORDINALITY AS q(restaurant_id, ord)
+        JOIN restaurant_embeddings re1 ON re1.restaurant_id = q.restaurant_id
+        CROSS JOIN LATERAL (
+            SELECT
+                r.name,
+                r.categories,
+                r.price_level,
+                r.avg_rating,
+                1 - (re1.embedding <=> re2.embedding) as similarity_score,
+                r.city,
+                r.state
+            FROM restaurant_embeddings re2
+            JOIN restaurants r ON re2.restaurant_id = r.restaurant_id
+            WHERE re2.restaurant_id != re1.restaurant_id
+            ORDER BY similarity_score DESC
+            LIMIT $2
+        ) rec
+        ORDER BY q.ord, rec.similarity_score DESC
+    """),
+    'materialized_recommendations': ('text, text, int', """
+        SELECT r.name, r.categories, r.price_level, r.avg_rating, n.score AS similarity_score, r.city, r.state
+        FROM restaurant_neighbors n
+        JOIN restaurants r ON r.restaurant_id = n.neighbor_id
+        WHERE n.restaurant_id = $1 AND n.method = $2 AND n.rank <= $3
+        ORDER BY n.rank
+    """),
+    'materialized_recommendations_batch': ('text[], text, int', """
+        SELECT n.restaurant_id, r.name, r.categories, r.price_level, r.avg_rating,
+               n.score AS similarity_score, r.city, r.state
+        FROM restaurant_neighbors n
+        JOIN restaurants r ON r.restaurant_id = n.neighbor_id
+        WHERE n.restaurant_id = ANY($1) AND n.method = $2 AND n.rank <= $3
+        ORDER BY n.restaurant_id, n.rank
+    """),
+    'data_version': ('', """
+        SELECT version FROM data_version WHERE id = 1
+    """),
+    'data_version_exists': ('', """
+        SELECT to_regclass('data_version') IS NOT NULL
+    """),
+    'perfect_matches': ('text, float8, float8, float8', """
+        SELECT
+            r2.name,
+            r2.categories,
+            r2.price_level,
+            r2.avg_rating,
+            (
+                CASE WHEN r1.categories = r2.categories THEN $2 ELSE 0 END +
+                (1 - ABS(r1.price_level - r2.price_level)::float/4) * $3 +
+                (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * $4
+            ) as similarity_score,
+            r2.city,
+            r2.state
+        FROM restaurants r1
+        JOIN restaurants r2 ON r1.restaurant_id != r2.restaurant_id
+        WHERE r1.restaurant_id = $1
+        AND r1.categories = r2.categories
+        AND r1.price_level = r2.price_level
+        AND r1.avg_rating = r2.avg_rating
+        ORDER BY similarity_score DESC
+    """)
+}
+
+# One-row stamp bumped by the loaders in every transaction that changes restaurants, ratings or embeddings
+CREATE_DATA_VERSION = """
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+"""
+
+def bump_data_version(cur):
+    """Advance the data version inside the caller's transaction"""
+    cur.execute("""
+        INSERT INTO data_version (id, version) VALUES (1, 1)
+        ON CONFLICT (id) DO UPDATE SET version = data_version.version + 1, updated_at = now()
+    """)
+
+# Called as hook(statement_name, seconds, row_count) after every repository query
+QUERY_HOOKS = []
+
+class PreparingConnection(_connection):
+    """Connection that remembers which statements it has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+def connect(**overrides):
+    """Open a connection with DB_PARAMS, optionally overriding some settings"""
+    return psycopg2.connect(connection_factory=PreparingConnection, **{**DB_PARAMS, **overrides})
+
+_pool = None
+
+def get_pool(minconn=1, maxconn=8):
+    """Process-wide thread-safe connection pool, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(minconn, maxconn, connection_factory=PreparingConnection, **DB_PARAMS)
+    return _pool
+
+@contextmanager
+def pooled(prepared=True):
+    """Borrow a pooled connection wrapped in a Repository, returned to the pool even on errors"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield Repository(conn, prepared=prepared)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+def add_query_hook(hook):
+    QUERY_HOOKS.append(hook)
+
+def remove_query_hook(hook):
+    QUERY_HOOKS.remove(hook)
+
+class QueryTimer:
+    """Query hook collecting per-statement durations"""
+
+    def __init__(self):
+        self.timings = {}
+
+    def __call__(self, name, seconds, rows):
+        self.timings.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        """Return {statement: (calls, total seconds, mean seconds)}"""
+        return {name: (len(times), sum(times), sum(times) / len(times))
+                for name, times in self.timings.items()}
+
+class Repository:
+    """Recommendation queries over one connection
+
+    Statements are prepared once per connection and then run with EXECUTE,
+    so parsing and planning are not repeated on every call. With
+    prepared=False the SQL text is sent each time, as a baseline.
+    """
+
+    def __init__(self, conn, prepared=True):
+        self.conn = conn
+        self.prepared = prepared
+        self.has_data_version = False
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def execute(self, name, params):
+        """Run a named statement and return all rows"""
+        cur = self.conn.cursor()
+        start = time.perf_counter()
+        if self.prepared and isinstance(self.conn, PreparingConnection):
+            if name not in self.conn.prepared:
+                types, sql = STATEMENTS[name]
+                signature = f" ({types})" if types else ""
+                with instrumentation.stage(f"{name}.prepare"):
+                    cur.execute(f"PREPARE {name}{signature} AS {sql}")
+                self.conn.prepared.add(name)
+            arguments = f" ({', '.join(['%s'] * len(params))})" if params else ""
+            sql, query_params = f"EXECUTE {name}{arguments}", params
+        else:
+            sql = re.sub(r'\$(\d+)', r'%(p\1)s', STATEMENTS[name][1])
+            query_params = {f"p{i}": value for i, value in enumerate(params, 1)}
+        # The client-side cursor receives the whole result in execute(); fetchall() only converts rows
+        with instrumentation.stage(f"{name}.execute"):
+            cur.execute(sql, query_params)
+        with instrumentation.stage(f"{name}.fetch"):
+            rows = cur.fetchall()
+        seconds = time.perf_counter() - start
+        if instrumentation.should_explain():
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", query_params)
+            instrumentation.record_plan(name, params, [row[0] for row in cur.fetchall()])
+        cur.close()
+        instrumentation.observe('query_seconds', seconds, statement=name)
+        instrumentation.count('queries_total', statement=name)
+        instrumentation.count('query_rows_total', len(rows), statement=name)
+        for hook in QUERY_HOOKS:
+            hook(name, seconds, len(rows))
+        return rows
+
+    def restaurant_details(self, restaurant_id):
+        """(name, categories, price_level, avg_rating, city, state), or None"""
+        rows = self.execute('restaurant_details', (restaurant_id,))
+        return rows[0] if rows else None
+
+    def data_version(self):
+        """Current data version stamp, 0 before the loaders have written one
+
+        Checks for the table first rather than catching UndefinedTable, which
+        would abort the caller's transaction. Once seen, the table is assumed
+        to stay.
+        """
+        if not self.has_data_version:
+            if not self.execute('data_version_exists', ())[0][0]:
+                return 0
+            self.has_data_version = True
+        rows = self.execute('data_version', ())
+        return rows[0][0] if rows else 0
+
+    def sql_recommendations(self, restaurant_id, weights, k=5):
+        return self.execute('sql_recommendations',
+                            (restaurant_id, weights['category'], weights['price'], weights['rating'], k))
+
+    def vector_recommendations(self, restaurant_id, k=5):
+        return self.execute('vector_recommendations', (restaurant_id, k))
+
+    def sql_recommendations_batch(self, restaurant_ids, weights, k=5):
+        """Top-k SQL recommendations of many restaurants in one LATERAL query, aligned with restaurant_ids"""
+        rows = self.execute('sql_recommendations_batch', (list(restaurant_ids), weights['category'],
+                                                          weights['price'], weights['rating'], k))
+        return _group_by_query(restaurant_ids, rows)
+
+    def vector_recommendations_batch(self, restaurant_ids, k=5):
+        """Top-k vector recommendations of many restaurants in one LATERAL query, aligned with restaurant_ids"""
+        rows = self.execute('vector_recommendations_batch', (list(restaurant_ids), k))
+        return _group_by_query(restaurant_ids, rows)
+
+    def materialized_recommendations(self, restaurant_id, method, k=5):
+        """Precomputed top-k of method ('sql' or 'vector') from restaurant_neighbors"""
+        return self.execute('materialized_recommendations', (restaurant_id, method, k))
+
+    def materialized_recommendations_batch(self, restaurant_ids, method, k=5):
+        """Precomputed top-k of many restaurants in one indexed query, aligned with restaurant_ids"""
+        rows = self.execute('materialized_recommendations_batch', (list(restaurant_ids), method, k))
+        return _group_by_query(restaurant_ids, rows)
+
+    def perfect_matches(self, restaurant_id, weights):
+        return self.execute('perfect_matches',
+                            (restaurant_id, weights['category'], weights['price'], weights['rating']))
+
+def _group_by_query(restaurant_ids, rows):
+    """Split (query_id, *recommendation) rows into one list per query id"""
+    grouped = {rest_id: [] for rest_id in restaurant_ids}
+    for row in rows:
+        grouped[row[0]].append(tuple(row[1:]))
+    return [grouped[rest_id] for rest_id in restaurant_ids]
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import numpy as np
+from embeddings import EMBEDDING_DIM
+
+class EmbeddingCache:
+    """Content-addressed on-disk cache of text embeddings
+
+    Entries are keyed on a hash of the model name and the exact text fed to
+    the model. Vectors live in a memory-mapped float32 file and the
+    key -> slot index in a JSON sidecar. When the cache exceeds max_bytes the
+    least recently used entries are evicted, and the index is rewritten
+    before their slots are reused.
+    """
+
+    def __init__(self, directory, model_name, max_bytes=1024 ** 3, dim=EMBEDDING_DIM):
+        self.directory = directory
+        self.model_name = model_name
+        self.dim = dim
+        self.row_bytes = dim * 4
+        self.max_entries = max(1, max_bytes // self.row_bytes)
+        self.vectors_path = os.path.join(directory, 'vectors.f32')
+        self.index_path = os.path.join(directory, 'index.json')
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing_rows = 0
+        if os.path.exists(self.vectors_path):
+            existing_rows = os.path.getsize(self.vectors_path) // self.row_bytes
+        usable_rows = min(existing_rows, self.max_entries)
+
+        self.slots = {}
+        self.last_used = {}
+        self.free_slots = []
+        self.tick = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index['dim'] == dim:
+                self.tick = index['tick']
+                # Entries beyond a smaller max_bytes are dropped
+                for key, (slot, last_used) in index['entries'].items():
+                    if slot < usable_rows:
+                        self.slots[key] = slot
+                        self.last_used[key] = last_used
+
+        self.capacity = 0
+        self.vectors = None
+        self._ensure_capacity(max(usable_rows, 1))
+        used = set(self.slots.values())
+        self.free_slots = [slot for slot in range(self.capacity) if slot not in used]
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """Return (vectors, hit_mask); rows of vectors for misses are zero"""
+        self.tick += 1
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        hit_mask = np.zeros(len(texts), dtype=bool)
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            slot = self.slots.get(key)
+            if slot is None:
+                self.misses += 1
+                continue
+            vectors[i] = self.vectors[slot]
+            hit_mask[i] = True
+            self.last_used[key] = self.tick
+            self.hits += 1
+            self.bytes_saved += len(text.encode('utf-8'))
+        return vectors, hit_mask
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts, evicting least recently used entries when full"""
+        self.tick += 1
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = self._allocate_slot()
+                self.slots[key] = slot
+            self.vectors[slot] = vector
+            self.last_used[key] = self.tick
+
+    def flush(self):
+        """Persist vectors and the index"""
+        self.vectors.flush()
+        index = {
+            'model': self.model_name,
+            'dim': self.dim,
+            'tick': self.tick,
+            'entries': {key: [slot, self.last_used[key]] for key, slot in self.slots.items()}
+        }
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(temp_path, self.index_path)
+
+    def stats(self):
+        return {
+            'entries': len(self.slots),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes_saved': self.bytes_saved,
+            'disk_bytes': self.capacity * self.row_bytes
+        }
+
+    def _allocate_slot(self):
+        if not self.free_slots:
+            if self.capacity < self.max_entries:
+                self._ensure_capacity(self.capacity + 1)
+            else:
+                self._evict(max(1, self.max_entries // 10))
+        return self.free_slots.pop()
+
+    def _evict(self, count):
+        """Drop the count least recently used entries"""
+        victims = sorted(self.last_used, key=self.last_used.get)[:count]
+        for key in victims:
+            self.free_slots.append(self.slots.pop(key))
+            del self.last_used[key]
+        self.evictions += len(victims)
+        # Persist the index without the victims before their slots are overwritten, so a crash in
+        # between can never leave an old key pointing at another text's vector
+        self.flush()
+
+    def _ensure_capacity(self, rows):
+        if rows <= self.capacity:
+            return
+        # Grow geometrically, but never past the configured bound
+        capacity = min(max(rows, self.capacity * 2, 1024), self.max_entries)
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(capacity * self.row_bytes)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+',
+                                 shape=(capacity, self.dim))
+        self.free_slots.extend(range(self.capacity, capacity))
+        self.capacity = capacity
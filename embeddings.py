@@ -0,0 +1,111 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from tqdm import tqdm
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384
+
+_worker_model = None
+
+def load_model(model_name=MODEL_NAME):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def length_buckets(texts, batch_size):
+    """Split text indices into batches of similar length, longest first
+
+    Sorting by length keeps padding inside each batch small, so the model
+    does little wasted work on pad tokens.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = load_model(model_name)
+
+def _encode_batch(texts):
+    return _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+def encode_texts(texts, batch_size=64, workers=1, model_name=MODEL_NAME, model=None, cache=None):
+    """Encode texts into a (len(texts), 384) float32 matrix, in input order
+
+    With an EmbeddingCache only texts missing from the cache are encoded.
+    """
+    if cache is not None:
+        embeddings, hit_mask = cache.get_many(texts)
+        misses = np.flatnonzero(~hit_mask)
+        if len(misses):
+            miss_texts = [texts[i] for i in misses]
+            embeddings[misses] = encode_texts(miss_texts, batch_size, workers, model_name, model)
+            cache.put_many(miss_texts, embeddings[misses])
+            cache.flush()
+        return embeddings
+
+    embeddings = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    buckets = length_buckets(texts, batch_size)
+
+    if workers <= 1:
+        model = model or load_model(model_name)
+        for bucket in tqdm(buckets, desc="Generating embeddings"):
+            embeddings[bucket] = model.encode([texts[i] for i in bucket], batch_size=len(bucket),
+                                              convert_to_numpy=True)
+        return embeddings
+
+    # One model per worker, with the CPU threads split between them
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, threads)) as pool:
+        batches = ([texts[i] for i in bucket] for bucket in buckets)
+        results = pool.map(_encode_batch, batches)
+        for bucket, vectors in tqdm(zip(buckets, results), total=len(buckets), desc="Generating embeddings"):
+            embeddings[bucket] = vectors
+    return embeddings
+
+def combined_texts(restaurant_texts, per_restaurant=5):
+    """Join the first reviews of each restaurant, the text fed to the model"""
+    return {rest_id: " ".join(texts[:per_restaurant]) for rest_id, texts in restaurant_texts.items()}
+
+def synthetic_texts(n, seed=42):
+    """Review-like texts with a long-tailed length distribution"""
+    rng = np.random.default_rng(seed)
+    vocabulary = ("great food service pizza tacos burger friendly staff slow wait table "
+                  "delicious fresh menu price dinner lunch order spicy sauce bar drinks").split()
+    lengths = np.clip(rng.lognormal(5.5, 0.6, n), 20, 1500).astype(int)
+    return [" ".join(rng.choice(vocabulary, length)) for length in lengths]
+
+def run_benchmark(batch_sizes, worker_counts, n_texts=2000, model_name=MODEL_NAME):
+    """Report restaurants/sec for each batch size and worker count
+
+    Multi-worker timings include loading one model per worker process.
+    """
+    texts = synthetic_texts(n_texts)
+    model = load_model(model_name)
+
+    start = time.perf_counter()
+    for text in texts:
+        model.encode(text)
+    baseline = len(texts) / (time.perf_counter() - start)
+    print(f"\nOne text per encode call: {baseline:.1f} restaurants/sec")
+
+    print(f"\n{'batch size':>10} {'workers':>8} {'restaurants/sec':>16} {'speedup':>8}")
+    print("=" * 46)
+    for workers in worker_counts:
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            encode_texts(texts, batch_size, workers, model_name, model=model)
+            rate = len(texts) / (time.perf_counter() - start)
+            print(f"{batch_size:>10} {workers:>8} {rate:>16.1f} {rate / baseline:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Embedding throughput benchmark')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[8, 32, 64, 128])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--texts', type=int, default=2000)
+    args = parser.parse_args()
+    run_benchmark(args.batch_sizes, args.workers, args.texts)
@@ -0,0 +1,66 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+def sample_restaurants(conn, n=50, seed=42):
+    """Seeded sample of restaurants with embeddings
+
+    Rows are (restaurant_id, name, categories, price_level, avg_rating, city, state),
+    in restaurant_id order, so the same seed always selects the same sample.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT r.restaurant_id, r.name, r.categories, r.price_level,
+               r.avg_rating, r.city, r.state
+        FROM restaurants r
+        JOIN restaurant_embeddings re ON r.restaurant_id = re.restaurant_id
+        ORDER BY r.restaurant_id
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    rng = np.random.default_rng(seed)
+    picks = np.sort(rng.choice(len(rows), min(n, len(rows)), replace=False))
+    return [rows[i] for i in picks]
+
+def _engine_recommendations(engine, results):
+    # Same shape as db.RECOMMENDATION_COLUMNS
+    return [[tuple(engine.details[row][:4]) + (float(score),) + tuple(engine.details[row][4:6])
+             for row, score in zip(rows, scores)]
+            for rows, scores in results]
+
+def batched_recommendations(repo, restaurant_ids, weights, k=5, engine=None, attribute_engine=None,
+                            materialized=False):
+    """Top-k of both methods for every restaurant id in one batched operation each
+
+    Uses one LATERAL query per method, the in-process engines when given, or
+    one indexed lookup per method in restaurant_neighbors when materialized
+    (which holds the SQL_WEIGHTS ranking only). Returns (sql_recs,
+    vector_recs), lists aligned with restaurant_ids of rows shaped like
+    db.RECOMMENDATION_COLUMNS.
+    """
+    if materialized:
+        return (repo.materialized_recommendations_batch(restaurant_ids, 'sql', k),
+                repo.materialized_recommendations_batch(restaurant_ids, 'vector', k))
+    if attribute_engine is not None:
+        sql_recs = _engine_recommendations(attribute_engine,
+                                           attribute_engine.neighbors_batch(restaurant_ids, k, weights))
+    else:
+        sql_recs = repo.sql_recommendations_batch(restaurant_ids, weights, k)
+    if engine is not None:
+        vector_recs = _engine_recommendations(engine, engine.neighbors_batch(restaurant_ids, k))
+    else:
+        vector_recs = repo.vector_recommendations_batch(restaurant_ids, k)
+    return sql_recs, vector_recs
+
+def parallel_map(fn, items, workers=1, initializer=None, initargs=()):
+    """map() over a process pool; fn must be a module-level function
+
+    initializer(*initargs) runs once per worker (or once in-process), so
+    shared state such as a catalog is sent once rather than with every item.
+    """
+    if initializer is not None and workers <= 1:
+        initializer(*initargs)
+    if workers <= 1:
+        return list(map(fn, items))
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(fn, items, chunksize=chunksize))
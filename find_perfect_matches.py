@@ -1,48 +1,31 @@
-import psycopg2
+import argparse
 import time
+import db
+from attribute_engine import SQL_WEIGHTS, AttributeEngine
+from perfect_match_index import PerfectMatchIndex
 
-def find_perfect_matches(restaurant_id):
-    conn = psycopg2.connect(
-        dbname="restaurant_db",
-        user="helloalpacaa",
-        host="localhost"
-    )
-    cur = conn.cursor()
+def find_perfect_matches(restaurant_id, backend='sql'):
+    conn = db.connect()
+    repo = db.Repository(conn)
     
     # First get the original restaurant details
-    cur.execute("""
-        SELECT name, categories, price_level, avg_rating 
-        FROM restaurants 
-        WHERE restaurant_id = %s
-    """, (restaurant_id,))
-    original = cur.fetchone()
+    original = repo.restaurant_details(restaurant_id)
     print(f"\nLooking for perfect matches for: {original[0]}")
     print(f"Categories: {original[1]}")
     print(f"Price Level: {original[2]}")
     print(f"Average Rating: {original[3]}")
     
-    # Look for perfect matches
-    cur.execute("""
-        SELECT 
-            r2.name,
-            r2.categories,
-            r2.price_level,
-            r2.avg_rating,
-            (
-                CASE WHEN r1.categories = r2.categories THEN 0.3 ELSE 0 END +
-                (1 - ABS(r1.price_level - r2.price_level)::float/4) * 0.3 +
-                (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * 0.4
-            ) as similarity_score
-        FROM restaurants r1
-        JOIN restaurants r2 ON r1.restaurant_id != r2.restaurant_id
-        WHERE r1.restaurant_id = %s
-        AND r1.categories = r2.categories
-        AND r1.price_level = r2.price_level
-        AND r1.avg_rating = r2.avg_rating
-        ORDER BY similarity_score DESC
-    """, (restaurant_id,))
+    engine = None
+    if backend == 'numpy':
+        engine = AttributeEngine.load(conn)
+    elif backend == 'index':
+        engine = PerfectMatchIndex.from_engine(AttributeEngine.load(conn))
     
-    perfect_matches = cur.fetchall()
+    # Look for perfect matches
+    if engine is not None:
+        perfect_matches = engine.perfect_matches(restaurant_id)
+    else:
+        perfect_matches = repo.perfect_matches(restaurant_id, SQL_WEIGHTS)
     
     if perfect_matches:
         print("\nPerfect Matches Found:")
@@ -56,25 +39,13 @@ def find_perfect_matches(restaurant_id):
         print("\nNo perfect matches found.")
         
         # Let's see what's close
-        cur.execute("""
-            SELECT 
-                r2.name,
-                r2.categories,
-                r2.price_level,
-                r2.avg_rating,
-                (
-                    CASE WHEN r1.categories = r2.categories THEN 0.3 ELSE 0 END +
-                    (1 - ABS(r1.price_level - r2.price_level)::float/4) * 0.3 +
-                    (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * 0.4
-                ) as similarity_score
-            FROM restaurants r1
-            JOIN restaurants r2 ON r1.restaurant_id != r2.restaurant_id
-            WHERE r1.restaurant_id = %s
-            ORDER BY similarity_score DESC
-            LIMIT 5
-        """, (restaurant_id,))
+        if backend == 'index':
+            close_matches = engine.closest_matches(restaurant_id, k=5)
+        elif engine is not None:
+            close_matches = engine.top_k(restaurant_id, k=5)
+        else:
+            close_matches = repo.sql_recommendations(restaurant_id, SQL_WEIGHTS, k=5)
         
-        close_matches = cur.fetchall()
         print("\nClosest matches:")
         for match in close_matches:
             print(f"\nName: {match[0]}")
@@ -85,5 +56,39 @@ def find_perfect_matches(restaurant_id):
     
     conn.close()
 
-# Use the same restaurant ID we used before
-find_perfect_matches('XQfwVwDr-v0ZS3_CbbE5Xw')  # Turning Point
\ No newline at end of file
+def audit_perfect_matches(top=20):
+    """Report every group of restaurants that are perfect matches of each other"""
+    conn = db.connect()
+    start_time = time.time()
+    index = PerfectMatchIndex.from_engine(AttributeEngine.load(conn))
+    groups = index.audit()
+    audit_time = time.time() - start_time
+    conn.close()
+    
+    grouped = sum(len(rows) for _, rows in groups)
+    print(f"\nRestaurants: {len(index.engine)}")
+    print(f"Perfect-match groups: {len(groups)}")
+    print(f"Restaurants with at least one perfect match: {grouped} ({grouped / max(len(index.engine), 1):.2%})")
+    print(f"Audit took {audit_time:.3f} seconds")
+    
+    print(f"\nLargest {min(top, len(groups))} groups:")
+    for (categories, price_level, avg_rating), rows in groups[:top]:
+        names = ', '.join(index.engine.details[row][0] for row in rows[:3])
+        print(f"\n{len(rows)} restaurants - Price Level: {price_level:g}, Rating: {avg_rating:g}")
+        print(f"Categories: {', '.join(sorted(categories))}")
+        print(f"Examples: {names}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # Use the same restaurant ID we used before
+    parser.add_argument('restaurant_id', nargs='?', default='XQfwVwDr-v0ZS3_CbbE5Xw')  # Turning Point
+    parser.add_argument('--backend', choices=['sql', 'numpy', 'index'], default='sql',
+                        help='run matching in PostgreSQL, in the in-process NumPy engine, '
+                             'or with the precomputed perfect-match index')
+    parser.add_argument('--audit', action='store_true',
+                        help='report the perfect-match groups of the whole catalog instead')
+    args = parser.parse_args()
+    if args.audit:
+        audit_perfect_matches()
+    else:
+        find_perfect_matches(args.restaurant_id, backend=args.backend)
\ No newline at end of file
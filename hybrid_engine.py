@@ -0,0 +1,95 @@
+import numpy as np
+from attribute_engine import SQL_WEIGHTS, attribute_scores
+from vector_engine import _order_top_k
+
+# Candidate pre-filters: any restaurant, same state, or same (city, state)
+LOCATIONS = ('none', 'state', 'city')
+
+def _group_rows(keys):
+    """key -> int64 array of the rows holding it, in row order"""
+    groups = {}
+    for row, key in enumerate(keys):
+        groups.setdefault(key, []).append(row)
+    return {key: np.array(rows, dtype=np.int64) for key, rows in groups.items()}
+
+class HybridEngine:
+    """Two-stage recommender: embedding candidates reranked by the attribute formula
+
+    Stage one takes the depth restaurants most similar by embedding,
+    optionally only among those in the same state or city. Stage two scores
+    just those candidates with the SQL-based price/rating/category formula
+    and keeps the best k, breaking ties by similarity. Rows, details and
+    scores follow the vector engine's rows.
+    """
+
+    def __init__(self, vector_engine, attribute_engine, depth=200, location='none', weights=SQL_WEIGHTS,
+                 index=None):
+        """index: optional IVFIndex over vector_engine for unfiltered candidates"""
+        if location not in LOCATIONS:
+            raise ValueError(f"location must be one of {LOCATIONS}")
+        self.engine = vector_engine
+        self.depth = depth
+        self.location = location
+        self.weights = weights
+        self.index = index
+        self.restaurant_ids = vector_engine.restaurant_ids
+        self.row_by_id = vector_engine.row_by_id
+        self.details = vector_engine.details
+
+        # Attribute columns aligned with the vector engine's rows
+        attribute_rows = np.array([attribute_engine.row_by_id[rest_id] for rest_id in self.restaurant_ids],
+                                  dtype=np.int64)
+        self.category = attribute_engine.category[attribute_rows]
+        self.price_level = attribute_engine.price_level[attribute_rows]
+        self.avg_rating = attribute_engine.avg_rating[attribute_rows]
+        self.groups = {
+            'state': _group_rows([details[5] for details in self.details]),
+            'city': _group_rows([(details[4], details[5]) for details in self.details])
+        }
+
+    def __len__(self):
+        return len(self.restaurant_ids)
+
+    def candidates(self, row):
+        """(rows, similarities) of up to depth candidates for query row, excluding itself"""
+        if self.location == 'none':
+            if self.index is not None:
+                return self.index.neighbors(self.restaurant_ids[row], self.depth)
+            scores = self.engine.matrix @ self.engine.matrix[row]
+            scores[row] = -np.inf
+            return self.engine._select(scores, self.depth, exclude=row)
+
+        details = self.details[row]
+        key = details[5] if self.location == 'state' else (details[4], details[5])
+        pool = self.groups[self.location][key]
+        pool = pool[pool != row]
+        scores = self.engine.matrix[pool] @ self.engine.matrix[row]
+        if len(pool) > self.depth:
+            # Keep every row tied with the cutoff, then break ties by row like VectorEngine._select
+            threshold = scores[np.argpartition(-scores, self.depth - 1)[self.depth - 1]]
+            keep = scores >= threshold
+            pool, scores = _order_top_k(scores[keep], pool[keep], self.depth)
+        return pool, scores
+
+    def neighbors(self, restaurant_id, k=5):
+        """Return (rows, attribute scores) of the k best reranked candidates"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        rows, similarities = self.candidates(row)
+        rows = np.asarray(rows, dtype=np.int64)
+        category_match = (self.category[rows] == self.category[row]).astype(np.float64)
+        scores = attribute_scores(category_match,
+                                  np.abs(self.price_level[rows] - self.price_level[row]),
+                                  np.abs(self.avg_rating[rows] - self.avg_rating[row]),
+                                  self.weights)
+        order = np.lexsort((rows, -np.asarray(similarities), -scores))[:k]
+        return rows[order], scores[order]
+
+    def neighbors_batch(self, restaurant_ids, k=5):
+        return [self.neighbors(rest_id, k) for rest_id in restaurant_ids]
+
+    def top_k(self, restaurant_id, k=5):
+        """Rows shaped like the SQL query: (name, categories, price_level, avg_rating, similarity_score)"""
+        rows, scores = self.neighbors(restaurant_id, k)
+        return [tuple(self.details[row][:4]) + (float(score),) for row, score in zip(rows, scores)]
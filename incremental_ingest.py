@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import db
+from psycopg2.extras import execute_batch, execute_values
+from tqdm import tqdm
+from load_yelp_data import (INSERT_RESTAURANTS, MAX_RESTAURANTS, MAX_REVIEWS, REVIEWS_PER_RESTAURANT,
+                            transform_restaurant, transform_review)
+from embeddings import MODEL_NAME, encode_texts, load_model
+from embedding_cache import EmbeddingCache
+
+CREATE_CHECKPOINTS = """
+    CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+        source TEXT PRIMARY KEY,
+        byte_offset BIGINT NOT NULL,
+        rows_loaded BIGINT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+"""
+
+INSERT_REVIEWS_RETURNING = """
+    INSERT INTO ratings
+    (review_id, restaurant_id, user_id, rating, review_text, review_date)
+    VALUES %s
+    ON CONFLICT (review_id) DO NOTHING
+    RETURNING restaurant_id, rating
+"""
+
+# Unrounded sum of all ratings behind avg_rating, so repeated chunk updates do not drift
+ADD_RATING_TOTAL = "ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS rating_total DOUBLE PRECISION"
+
+UPSERT_EMBEDDINGS = """
+    INSERT INTO restaurant_embeddings (restaurant_id, embedding)
+    VALUES (%s, %s)
+    ON CONFLICT (restaurant_id) DO UPDATE SET embedding = EXCLUDED.embedding
+"""
+
+def get_checkpoint(cur, source):
+    """Return (byte_offset, rows_loaded) recorded for a source file"""
+    cur.execute("SELECT byte_offset, rows_loaded FROM ingest_checkpoints WHERE source = %s", (source,))
+    row = cur.fetchone()
+    return row if row else (0, 0)
+
+def save_checkpoint(cur, source, byte_offset, rows_loaded):
+    """Record progress; called inside the transaction that wrote the rows"""
+    cur.execute("""
+        INSERT INTO ingest_checkpoints (source, byte_offset, rows_loaded)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (source) DO UPDATE
+        SET byte_offset = EXCLUDED.byte_offset, rows_loaded = EXCLUDED.rows_loaded, updated_at = now()
+    """, (source, byte_offset, rows_loaded))
+
+def source_key(kind, path):
+    return f"{kind}:{os.path.abspath(path)}"
+
+def read_chunks(path, offset, chunk_size):
+    """Yield (end_offset, records) chunks of JSON lines starting at a byte offset
+
+    A trailing line without a newline is left for the next run, since the
+    file may still be being written.
+    """
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            records.append(json.loads(line))
+            if len(records) >= chunk_size:
+                yield offset, records
+                records = []
+    if records:
+        yield offset, records
+
+def load_restaurants(conn, business_path, chunk_size, limit=MAX_RESTAURANTS):
+    """Load restaurants in committed chunks, resuming from the last checkpoint"""
+    cur = conn.cursor()
+    source = source_key('business', business_path)
+    offset, loaded = get_checkpoint(cur, source)
+    if loaded >= limit:
+        return loaded
+
+    for end_offset, businesses in tqdm(read_chunks(business_path, offset, chunk_size), desc="Loading businesses"):
+        rows = []
+        for business in businesses:
+            categories = business.get('categories', '')
+            if categories and 'Restaurants' in categories and loaded + len(rows) < limit:
+                rows.append(transform_restaurant(business))
+        execute_batch(cur, INSERT_RESTAURANTS, rows)
+        if rows:
+            db.bump_data_version(cur)
+        loaded += len(rows)
+        save_checkpoint(cur, source, end_offset, loaded)
+        conn.commit()
+        if loaded >= limit:
+            break
+    return loaded
+
+def first_review_texts(cur, restaurant_ids, per_restaurant=REVIEWS_PER_RESTAURANT):
+    """Combined text of each restaurant's first reviews, the input of its embedding
+
+    Restarts lose the original file order, so "first" is by (review_date, review_id),
+    the same load_yelp_data.review_order used by the full loader. COLLATE "C"
+    compares ids by code point, like Python strings.
+    """
+    cur.execute("""
+        SELECT restaurant_id, string_agg(review_text, ' ' ORDER BY review_date, review_id COLLATE "C")
+        FROM (
+            SELECT restaurant_id, review_text, review_date, review_id,
+                   ROW_NUMBER() OVER (PARTITION BY restaurant_id
+                                      ORDER BY review_date, review_id COLLATE "C") AS n
+            FROM ratings
+            WHERE restaurant_id = ANY(%s)
+        ) first_reviews
+        WHERE n <= %s
+        GROUP BY restaurant_id
+    """, (list(restaurant_ids), per_restaurant))
+    return dict(cur.fetchall())
+
+def embed_restaurants(cur, restaurant_ids, model=None, cache=None, batch_size=64):
+    """Recompute and upsert the embeddings of the given restaurants
+
+    Pass a loaded model when calling once per chunk; otherwise every call loads its own.
+    """
+    texts = first_review_texts(cur, restaurant_ids)
+    if not texts:
+        return 0
+    vectors = encode_texts(list(texts.values()), batch_size=batch_size, model=model, cache=cache)
+    execute_batch(cur, UPSERT_EMBEDDINGS,
+                  [(rest_id, vector.tolist()) for rest_id, vector in zip(texts.keys(), vectors)])
+    return len(texts)
+
+def apply_rating_deltas(cur, inserted):
+    """Fold newly inserted ratings into restaurants.review_count and avg_rating
+
+    The running total starts from Yelp's stars times review_count and is kept
+    unrounded in rating_total; avg_rating is rounded once from it, so it
+    becomes a 2-decimal mean rather than Yelp's half-star value.
+    """
+    deltas = {}
+    for rest_id, rating in inserted:
+        count, total = deltas.get(rest_id, (0, 0.0))
+        deltas[rest_id] = (count + 1, total + float(rating))
+    execute_batch(cur, """
+        UPDATE restaurants
+        SET rating_total = COALESCE(rating_total, COALESCE(avg_rating, 0) * review_count) + %(total)s,
+            avg_rating = (COALESCE(rating_total, COALESCE(avg_rating, 0) * review_count) + %(total)s)
+                         / NULLIF(review_count + %(count)s, 0),
+            review_count = review_count + %(count)s
+        WHERE restaurant_id = %(rest_id)s
+    """, [{'total': total, 'count': count, 'rest_id': rest_id} for rest_id, (count, total) in deltas.items()])
+    return set(deltas)
+
+def load_reviews(conn, review_path, chunk_size, incremental=False, model=None, cache=None, limit=MAX_REVIEWS):
+    """Load reviews in committed chunks, resuming from the last checkpoint
+
+    In incremental mode every chunk also updates the rating aggregates and
+    re-embeds the affected restaurants inside the same transaction, so a
+    crash never applies a chunk twice.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT restaurant_id FROM restaurants")
+    restaurant_ids = {row[0] for row in cur.fetchall()}
+    source = source_key('review', review_path)
+    offset, loaded = get_checkpoint(cur, source)
+    if not incremental and loaded >= limit:
+        return loaded
+
+    for end_offset, reviews in tqdm(read_chunks(review_path, offset, chunk_size), desc="Loading reviews"):
+        rows = [transform_review(review) for review in reviews if review['business_id'] in restaurant_ids]
+        if not incremental:
+            rows = rows[:max(limit - loaded, 0)]
+        inserted = execute_values(cur, INSERT_REVIEWS_RETURNING, rows, page_size=max(len(rows), 1),
+                                  fetch=True) if rows else []
+        if incremental and inserted:
+            affected = apply_rating_deltas(cur, inserted)
+            embed_restaurants(cur, affected, model, cache)
+            db.bump_data_version(cur)
+        loaded += len(rows)
+        save_checkpoint(cur, source, end_offset, loaded)
+        conn.commit()
+        if not incremental and loaded >= limit:
+            break
+    return loaded
+
+def embed_missing(conn, chunk_size, model=None, cache=None):
+    """Embed restaurants with reviews but no embedding, one committed chunk at a time"""
+    cur = conn.cursor()
+    total = 0
+    while True:
+        cur.execute("""
+            SELECT DISTINCT r.restaurant_id
+            FROM ratings r
+            LEFT JOIN restaurant_embeddings re ON r.restaurant_id = re.restaurant_id
+            WHERE re.restaurant_id IS NULL
+            LIMIT %s
+        """, (chunk_size,))
+        missing = [row[0] for row in cur.fetchall()]
+        if not missing:
+            return total
+        total += embed_restaurants(cur, missing, model, cache)
+        db.bump_data_version(cur)
+        conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkpointed, resumable Yelp ingestion')
+    parser.add_argument('--business-path', default='yelp_academic_dataset_business.json')
+    parser.add_argument('--review-path', default='yelp_academic_dataset_review.json')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='JSON lines per committed chunk')
+    parser.add_argument('--incremental', action='store_true',
+                        help='apply only reviews past the checkpoint, updating aggregates and embeddings in place')
+    parser.add_argument('--cache-dir', default=None, help='embedding cache directory')
+    args = parser.parse_args()
+
+    conn = db.connect()
+    cur = conn.cursor()
+    cur.execute(CREATE_CHECKPOINTS)
+    cur.execute(db.CREATE_DATA_VERSION)
+    cur.execute(ADD_RATING_TOTAL)
+    conn.commit()
+    cache = EmbeddingCache(args.cache_dir, MODEL_NAME) if args.cache_dir else None
+    # Loaded once here: every committed chunk with cache misses encodes with it
+    model = load_model(MODEL_NAME)
+
+    if args.incremental:
+        print("Applying new reviews...")
+        reviews = load_reviews(conn, args.review_path, args.chunk_size, incremental=True, model=model,
+                               cache=cache)
+        print(f"Reviews processed from {args.review_path}: {reviews}")
+    else:
+        print("Loading restaurant data...")
+        restaurants = load_restaurants(conn, args.business_path, args.chunk_size)
+        print("Loading reviews...")
+        reviews = load_reviews(conn, args.review_path, args.chunk_size)
+        print("Generating embeddings...")
+        embedded = embed_missing(conn, args.chunk_size, model, cache)
+        print(f"Restaurants: {restaurants}, reviews: {reviews}, new embeddings: {embedded}")
+
+    conn.close()
+    print("Processing complete!")
+
+if __name__ == "__main__":
+    main()
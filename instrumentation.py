@@ -0,0 +1,127 @@
+import bisect
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           float('inf'))
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms keyed by (name, labels)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        self.observe_key((name, tuple(sorted(labels.items()))), seconds)
+
+    def observe_key(self, key, seconds):
+        """observe() with a precomputed (name, sorted labels) key"""
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def export_text(self):
+        """Counters and cumulative histograms in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+METRICS = Registry()
+
+# Instrumentation is on unless RESTAURANT_INSTRUMENTATION=0
+ENABLED = os.environ.get('RESTAURANT_INSTRUMENTATION', '1') != '0'
+# Fraction of repository queries re-run under EXPLAIN (ANALYZE, BUFFERS)
+EXPLAIN_RATE = float(os.environ.get('RESTAURANT_EXPLAIN_RATE', '0'))
+# Most recent captured plans: (statement, params, plan text)
+PLANS = deque(maxlen=50)
+
+_explain_random = random.Random(0)
+
+def configure(enabled=None, explain_rate=None):
+    global ENABLED, EXPLAIN_RATE
+    if enabled is not None:
+        ENABLED = enabled
+    if explain_rate is not None:
+        EXPLAIN_RATE = explain_rate
+
+class stage:
+    """Context manager recording the wall time of a block as stage_seconds{stage=name}"""
+    __slots__ = ('key', 'start')
+
+    def __init__(self, name):
+        self.key = ('stage_seconds', (('stage', name),))
+        self.start = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            METRICS.observe_key(self.key, time.perf_counter() - self.start)
+        return False
+
+def count(name, value=1, **labels):
+    if ENABLED:
+        METRICS.count(name, value, **labels)
+
+def observe(name, seconds, **labels):
+    if ENABLED:
+        METRICS.observe(name, seconds, **labels)
+
+def should_explain():
+    return ENABLED and EXPLAIN_RATE > 0 and _explain_random.random() < EXPLAIN_RATE
+
+def record_plan(statement, params, plan_lines):
+    """Keep a captured plan and record its planning and execution times"""
+    for line in plan_lines:
+        if line.startswith('Planning Time:'):
+            observe('query_planning_seconds', float(line.split()[2]) / 1000, statement=statement)
+        elif line.startswith('Execution Time:'):
+            observe('query_execution_seconds', float(line.split()[2]) / 1000, statement=statement)
+    PLANS.append((statement, params, '\n'.join(plan_lines)))
+
+def write_report(path):
+    """Write the metrics export followed by the captured plans"""
+    with open(path, 'w') as f:
+        f.write(METRICS.export_text())
+        for statement, params, plan in PLANS:
+            f.write(f"\n# plan {statement} {params!r}\n")
+            f.write(''.join(f"# {line}\n" for line in plan.split('\n')))
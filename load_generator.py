@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import db
+from benchmark_suite import BACKENDS, close_context
+from evaluation import sample_restaurants
+
+class ZipfSampler:
+    """Draw restaurant ids with a Zipf-like popularity skew
+
+    Popularity ranks are a seeded shuffle of the ids, so the hot set is not
+    tied to id order.
+    """
+
+    def __init__(self, restaurant_ids, exponent=1.1, seed=42):
+        self.rng = np.random.default_rng(seed)
+        self.restaurant_ids = [restaurant_ids[i] for i in self.rng.permutation(len(restaurant_ids))]
+        weights = 1.0 / np.arange(1, len(restaurant_ids) + 1) ** exponent
+        self.cumulative = np.cumsum(weights / weights.sum())
+
+    def sample(self):
+        return self.restaurant_ids[min(int(np.searchsorted(self.cumulative, self.rng.random())),
+                                       len(self.restaurant_ids) - 1)]
+
+class Recorder:
+    """Completed requests bucketed by the second in which they finished"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.seconds = {}
+
+    def record(self, latency, ok):
+        second = int(time.perf_counter() - self.start)
+        bucket = self.seconds.setdefault(second, {'latencies': [], 'errors': 0})
+        if ok:
+            bucket['latencies'].append(latency)
+        else:
+            bucket['errors'] += 1
+
+    def report(self):
+        print(f"\n{'second':>6} {'ok':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        print("=" * 52)
+        all_latencies = []
+        errors = 0
+        for second in sorted(self.seconds):
+            bucket = self.seconds[second]
+            all_latencies.extend(bucket['latencies'])
+            errors += bucket['errors']
+            print(f"{second:>6} {len(bucket['latencies']):>7} {bucket['errors']:>7} "
+                  f"{_percentiles(bucket['latencies'])}")
+        elapsed = max(self.seconds) + 1 if self.seconds else 1
+        print("=" * 52)
+        print(f"{'total':>6} {len(all_latencies):>7} {errors:>7} {_percentiles(all_latencies)}")
+        print(f"\nThroughput: {len(all_latencies) / elapsed:.1f} requests/sec, error rate "
+              f"{errors / max(len(all_latencies) + errors, 1):.2%}")
+
+def _percentiles(latencies):
+    if not latencies:
+        return f"{'-':>9} {'-':>9} {'-':>9}"
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return f"{p50:>9.2f} {p95:>9.2f} {p99:>9.2f}"
+
+class QueryRunner:
+    """Run backend queries on a thread pool, one connection per thread
+
+    psycopg2 is blocking, so the event loop hands each query to a thread
+    holding its own connection (and its own prepared statements). In-memory
+    indexes are built once in the shared context and used by every thread.
+    """
+
+    def __init__(self, backend, connections, context=None):
+        self.executor = ThreadPoolExecutor(max_workers=connections)
+        self.connections = []
+        self.queries = queue.Queue()
+        self.context = {} if context is None else context
+        for _ in range(connections):
+            conn = db.connect()
+            self.connections.append(conn)
+            self.queries.put(BACKENDS[backend](conn, self.context))
+
+    def _run(self, rest_id, k):
+        query = self.queries.get()
+        try:
+            return query(rest_id, k)
+        finally:
+            self.queries.put(query)
+
+    async def run(self, rest_id, k=5):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._run, rest_id, k)
+
+    def close(self):
+        self.executor.shutdown()
+        close_context(self.context)
+        for conn in self.connections:
+            conn.close()
+
+async def _timed_request(runner, sampler, recorder, scheduled=None):
+    # Open-loop latency counts from the scheduled start, so queueing delay is not hidden
+    start = scheduled if scheduled is not None else time.perf_counter()
+    try:
+        await runner.run(sampler.sample())
+        ok = True
+    except Exception:
+        ok = False
+    recorder.record(time.perf_counter() - start, ok)
+
+async def closed_loop(runner, sampler, recorder, clients, duration):
+    """clients concurrent users, each sending its next request when the last one returns"""
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            await _timed_request(runner, sampler, recorder)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+
+async def open_loop(runner, sampler, recorder, qps, duration, max_in_flight=1000, seed=42):
+    """Poisson arrivals at qps regardless of how fast requests complete"""
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    next_arrival = start
+    in_flight = set()
+    while next_arrival < start + duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            # Saturated: count the request as failed instead of growing the backlog without bound
+            recorder.record(0.0, False)
+        else:
+            task = asyncio.ensure_future(_timed_request(runner, sampler, recorder, scheduled=next_arrival))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_arrival += rng.exponential(1.0 / qps)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load generator for the recommendation queries')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='pgvector')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed',
+                        help='closed: fixed number of clients; open: fixed arrival rate')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients (closed loop)')
+    parser.add_argument('--qps', type=float, default=50, help='target requests/sec (open loop)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--connections', type=int, default=8, help='database connections / worker threads')
+    parser.add_argument('--max-in-flight', type=int, default=1000,
+                        help='open loop: requests beyond this backlog are counted as errors')
+    parser.add_argument('--ids', type=int, default=5000, help='restaurants in the request id pool')
+    parser.add_argument('--zipf', type=float, default=1.1, help='popularity skew exponent of request ids')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache-entries', type=int, default=10000,
+                        help='cached-* backends: results kept before LRU eviction')
+    parser.add_argument('--cache-ttl', type=float, default=300, help='cached-* backends: seconds an entry lives')
+    args = parser.parse_args()
+
+    conn = db.connect()
+    restaurant_ids = [row[0] for row in sample_restaurants(conn, args.ids, args.seed)]
+    conn.close()
+    sampler = ZipfSampler(restaurant_ids, args.zipf, args.seed)
+    runner = QueryRunner(args.backend, args.connections,
+                         {'cache_options': {'max_entries': args.cache_entries, 'ttl': args.cache_ttl}})
+    recorder = Recorder()
+    print(f"{args.backend}: {args.mode} loop for {args.duration:.0f}s over {len(restaurant_ids)} ids "
+          f"(zipf {args.zipf}), {args.connections} connections")
+    try:
+        if args.mode == 'closed':
+            asyncio.run(closed_loop(runner, sampler, recorder, args.clients, args.duration))
+        else:
+            asyncio.run(open_loop(runner, sampler, recorder, args.qps, args.duration,
+                                  args.max_in_flight, args.seed))
+    finally:
+        runner.close()
+    recorder.report()
+    cache = runner.context.get('recommendation_cache')
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\nResult cache: {stats['hit_rate']:.1%} hit rate ({stats['hits']} hits, {stats['misses']} misses), "
+              f"{stats['evictions']} evictions, {stats['expirations']} expirations, "
+              f"{stats['invalidations']} invalidations")
+
+if __name__ == "__main__":
+    main()
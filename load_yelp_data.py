@@ -1,162 +1,370 @@
+import argparse
+import bisect
 import json
-import pandas as pd
+import resource
+import sys
+import time
 import numpy as np
 from tqdm import tqdm
-import psycopg2
+import db
 from psycopg2.extras import execute_batch
-from sentence_transformers import SentenceTransformer
 import re
+from bulk_writer import embedding_writer, restaurant_writer, review_writer
+from embeddings import MODEL_NAME, combined_texts, encode_texts
+from embedding_cache import EmbeddingCache
+from parallel_reader import iter_reviews_parallel
+
+MAX_RESTAURANTS = 50000
+MAX_REVIEWS = 500000
+REVIEWS_PER_RESTAURANT = 5
+
+INSERT_RESTAURANTS = """
+    INSERT INTO restaurants
+    (restaurant_id, name, address, city, state, categories,
+     price_level, avg_rating, review_count)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (restaurant_id) DO NOTHING
+"""
+
+INSERT_REVIEWS = """
+    INSERT INTO ratings
+    (review_id, restaurant_id, user_id, rating, review_text, review_date)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (review_id) DO NOTHING
+"""
+
+INSERT_EMBEDDINGS = """
+    INSERT INTO restaurant_embeddings (restaurant_id, embedding)
+    VALUES (%s, %s)
+    ON CONFLICT (restaurant_id) DO NOTHING
+"""
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    """Current resident set size in MB, from /proc where available
+
+    Elsewhere this falls back to the process-wide peak, so per-stage peaks
+    there only show the highest value reached so far.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+# Rows between RSS samples of a generator stage
+RSS_SAMPLE_EVERY = 1000
+
+class StageStats:
+    """Rows, time and peak RSS of one pipeline stage
+
+    Generator stages are timed inclusively (pulling an item also runs every
+    upstream stage), so the stage's own time subtracts its upstream's. Peak
+    RSS is the highest current RSS sampled while the stage ran.
+    """
+
+    def __init__(self, name, upstream=None):
+        self.name = name
+        self.upstream = upstream
+        self.rows = 0
+        self.inclusive_seconds = 0.0
+        self.peak_rss_mb = 0.0
+
+    @property
+    def seconds(self):
+        upstream_seconds = self.upstream.inclusive_seconds if self.upstream else 0.0
+        return max(self.inclusive_seconds - upstream_seconds, 0.0)
+
+    def measure(self, iterable):
+        """Yield from iterable while counting rows and time spent producing them"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                self.inclusive_seconds += time.perf_counter() - start
+            self.rows += 1
+            if self.rows % RSS_SAMPLE_EVERY == 1:
+                self.sample_rss()
+            yield item
+        self.sample_rss()
+
+    def sample_rss(self):
+        self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+
+class Pipeline:
+    """A chain of generator stages ending in a batched database write"""
+
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name, iterable, upstream=True):
+        stats = StageStats(name, self.stages[-1] if upstream and self.stages else None)
+        self.stages.append(stats)
+        return stats.measure(iterable)
+
+    def write(self, name, write_batch, rows, batch_size, conn=None, commit_every=None):
+        """Consume rows and write them in batches of batch_size, committing every commit_every rows"""
+        stats = StageStats(name)
+        self.stages.append(stats)
+        uncommitted = 0
+        for batch in batched(rows, batch_size):
+            start = time.perf_counter()
+            write_batch(batch)
+            uncommitted += len(batch)
+            if commit_every and uncommitted >= commit_every:
+                conn.commit()
+                uncommitted = 0
+            stats.inclusive_seconds += time.perf_counter() - start
+            stats.rows += len(batch)
+            stats.sample_rss()
+        if commit_every and uncommitted:
+            start = time.perf_counter()
+            conn.commit()
+            stats.inclusive_seconds += time.perf_counter() - start
+        stats.sample_rss()
+
+    def report(self):
+        print(f"\n{'Stage':<24} {'Rows':>10} {'Seconds':>9} {'Rows/sec':>11} {'Peak RSS MB':>12}")
+        print("=" * 70)
+        for stats in self.stages:
+            rate = stats.rows / stats.seconds if stats.seconds > 0 else float('inf')
+            print(f"{stats.name:<24} {stats.rows:>10} {stats.seconds:>9.2f} {rate:>11.0f} "
+                  f"{stats.peak_rss_mb:>12.1f}")
+
+def batched(iterable, size):
+    """Group an iterable into lists of at most size items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def parse_json_lines(path, desc):
+    """Parse one JSON document per line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in tqdm(f, desc=desc):
+            yield json.loads(line)
+
+def filter_restaurants(businesses, limit=MAX_RESTAURANTS):
+    """Keep businesses whose categories include 'Restaurants', up to limit"""
+    count = 0
+    for business in businesses:
+        # Filter for restaurants only - handle None categories
+        categories = business.get('categories', '')
+        if categories and 'Restaurants' in categories:  # Check if categories exists and contains 'Restaurants'
+            yield business
+            count += 1
+            # Limit to first 50000 restaurants for testing
+            if count >= limit:
+                break
+
+def transform_restaurant(business):
+    """Build the restaurants insert tuple for a business"""
+    # Handle missing price level data
+    try:
+        price_level = len(business.get('attributes', {}).get('RestaurantsPriceRange2', '$')) if business.get('attributes') is not None else 1
+    except (AttributeError, TypeError):
+        price_level = 1  # Default to lowest price level if missing
+
+    return (business['business_id'], business['name'], business.get('address', ''),
+            business.get('city', ''), business.get('state', ''), business['categories'],
+            price_level, float(business.get('stars', 0)), business.get('review_count', 0))
+
+def filter_reviews(reviews, restaurant_ids, limit=MAX_REVIEWS):
+    """Keep reviews of loaded restaurants, up to limit"""
+    count = 0
+    for review in reviews:
+        if review['business_id'] in restaurant_ids:
+            yield review
+            count += 1
+            # Limit reviews per restaurant
+            if count >= limit:
+                break
+
+def transform_review(review):
+    """Build the ratings insert tuple for a review"""
+    return (review['review_id'], review['business_id'], review['user_id'],
+            float(review['stars']), review['text'], review['date'])
+
+def iter_restaurants(business_path, limit=MAX_RESTAURANTS):
+    """Stream restaurant insert tuples from the Yelp business file"""
+    businesses = parse_json_lines(business_path, "Loading businesses")
+    return map(transform_restaurant, filter_restaurants(businesses, limit))
+
+def iter_reviews(review_path, restaurant_ids, limit=MAX_REVIEWS):
+    """Stream review insert tuples for the given restaurants"""
+    reviews = parse_json_lines(review_path, "Loading reviews")
+    return map(transform_review, filter_reviews(reviews, restaurant_ids, limit))
+
+def collect_restaurant_ids(rows, restaurant_ids):
+    """Pass restaurant rows through, remembering their ids"""
+    for row in rows:
+        restaurant_ids.add(row[0])
+        yield row
+
+def review_order(review_id, review_date):
+    """Sort key picking a restaurant's "first" reviews: (review_date, review_id)
+
+    review_date is stored as a DATE, so only the day counts. Matches
+    incremental_ingest.first_review_texts (review_id compared with COLLATE "C"),
+    so both loaders embed the same text and hit the same cache entries.
+    """
+    return str(review_date)[:10], review_id
+
+def collect_review_texts(rows, restaurant_texts, per_restaurant=REVIEWS_PER_RESTAURANT):
+    """Pass review rows through, keeping each restaurant's first few texts in review_order"""
+    order = {}
+    for row in rows:
+        keys = order.setdefault(row[1], [])
+        texts = restaurant_texts.setdefault(row[1], [])
+        key = review_order(row[0], row[5])
+        if len(keys) < per_restaurant or key < keys[-1]:
+            position = bisect.bisect(keys, key)
+            keys.insert(position, key)
+            texts.insert(position, row[4])
+            del keys[per_restaurant:], texts[per_restaurant:]
+        yield row
+
+def embed_restaurants(restaurant_texts, batch_size=64, workers=1, cache=None):
+    """Yield (restaurant_id, embedding) for each restaurant's combined review text"""
+    # Combine the first 5 reviews of each restaurant and encode them in length-sorted batches
+    texts = combined_texts(restaurant_texts, REVIEWS_PER_RESTAURANT)
+    vectors = encode_texts(list(texts.values()), batch_size=batch_size, workers=workers, cache=cache)
+    yield from zip(texts.keys(), vectors)
 
 def load_restaurant_data(business_path):
     """Load and filter restaurant businesses from Yelp dataset"""
-    restaurants = []
-    
-    with open(business_path, 'r', encoding='utf-8') as f:
-        for line in tqdm(f, desc="Loading businesses"):
-            business = json.loads(line)
-            # Filter for restaurants only - handle None categories
-            categories = business.get('categories', '')
-            if categories and 'Restaurants' in categories:  # Check if categories exists and contains 'Restaurants'
-                # Handle missing price level data
-                try:
-                    price_level = len(business.get('attributes', {}).get('RestaurantsPriceRange2', '$')) if business.get('attributes') is not None else 1
-                except (AttributeError, TypeError):
-                    price_level = 1  # Default to lowest price level if missing
-                
-                restaurant = {
-                    'business_id': business['business_id'],
-                    'name': business['name'],
-                    'address': business.get('address', ''),
-                    'city': business.get('city', ''),
-                    'state': business.get('state', ''),
-                    'categories': categories,
-                    'price_level': price_level,
-                    'stars': float(business.get('stars', 0)),
-                    'review_count': business.get('review_count', 0)
-                }
-                restaurants.append(restaurant)
-                
-                # Limit to first 50000 restaurants for testing
-                if len(restaurants) >= 50000:
-                    break
-    
-    return pd.DataFrame(restaurants)
+    import pandas as pd
+    columns = ['business_id', 'name', 'address', 'city', 'state', 'categories',
+               'price_level', 'stars', 'review_count']
+    return pd.DataFrame(list(iter_restaurants(business_path)), columns=columns)
 
 def load_reviews(review_path, restaurant_ids):
     """Load reviews for restaurants"""
-    reviews = []
-    
-    with open(review_path, 'r', encoding='utf-8') as f:
-        for line in tqdm(f, desc="Loading reviews"):
-            review = json.loads(line)
-            if review['business_id'] in restaurant_ids:
-                reviews.append({
-                    'review_id': review['review_id'],
-                    'business_id': review['business_id'],
-                    'user_id': review['user_id'],
-                    'stars': float(review['stars']),
-                    'text': review['text'],
-                    'date': review['date']
-                })
-                
-                # Limit reviews per restaurant
-                if len(reviews) >= 500000:
-                    break
-    
-    return pd.DataFrame(reviews)
+    import pandas as pd
+    columns = ['review_id', 'business_id', 'user_id', 'stars', 'text', 'date']
+    return pd.DataFrame(list(iter_reviews(review_path, restaurant_ids)), columns=columns)
 
 def generate_embeddings(df_reviews):
     """Generate embeddings for restaurants using review text"""
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
     restaurant_texts = {}
-    for _, row in df_reviews.iterrows():
-        if row['business_id'] not in restaurant_texts:
-            restaurant_texts[row['business_id']] = []
-        restaurant_texts[row['business_id']].append(row['text'])
-    
-    embeddings = {}
-    for rest_id, texts in tqdm(restaurant_texts.items(), desc="Generating embeddings"):
-        # Combine all reviews and get embedding
-        combined_text = " ".join(texts[:5])  # Use first 5 reviews
-        embedding = model.encode(combined_text)
-        embeddings[rest_id] = embedding
-    
-    return embeddings
+    rows = df_reviews[['review_id', 'business_id', 'user_id', 'stars', 'text', 'date']].itertuples(index=False,
+                                                                                                   name=None)
+    for _ in collect_review_texts(rows, restaurant_texts):
+        pass
+    return dict(embed_restaurants(restaurant_texts))
+
+def make_writers(cur, writer, batch_size):
+    """Return batch-writing callables for restaurants, reviews and embeddings"""
+    if writer == 'execute_batch':
+        return (lambda batch: execute_batch(cur, INSERT_RESTAURANTS, batch, page_size=batch_size),
+                lambda batch: execute_batch(cur, INSERT_REVIEWS, batch, page_size=batch_size),
+                lambda batch: execute_batch(cur, INSERT_EMBEDDINGS,
+                                            [(rest_id, embedding.tolist()) for rest_id, embedding in batch],
+                                            page_size=batch_size))
+    staging = writer == 'copy-staging'
+    return restaurant_writer(cur, staging), review_writer(cur, staging), embedding_writer(cur, staging)
+
+def stamp_data_version(cur, write_batch):
+    """Wrap a batch writer so each batch also bumps the data version in the same transaction"""
+    def write(batch):
+        write_batch(batch)
+        db.bump_data_version(cur)
+    return write
 
 def main():
-    # Database connection parameters
-    db_params = {
-        'dbname': 'restaurant_db',
-        'user': 'helloalpacaa',  # your PostgreSQL username
-        'password': '',  # your PostgreSQL password if any
-        'host': 'localhost'
-    }
-    
-    # Load and process restaurant data
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--business-path', default='yelp_academic_dataset_business.json')
+    parser.add_argument('--review-path', default='yelp_academic_dataset_review.json')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='rows per database write; bounds the rows held in memory per stage')
+    parser.add_argument('--writer', choices=['execute_batch', 'copy', 'copy-staging'], default='execute_batch',
+                        help='execute_batch inserts; COPY FROM STDIN into the tables (fresh tables only); '
+                             'or COPY into unlogged staging tables merged with ON CONFLICT DO NOTHING')
+    parser.add_argument('--embed-batch-size', type=int, default=64,
+                        help='texts per model.encode call')
+    parser.add_argument('--embed-workers', type=int, default=1,
+                        help='encoding processes, each with its own model')
+    parser.add_argument('--cache-dir', default=None,
+                        help='reuse embeddings of unchanged restaurant texts from this on-disk cache')
+    parser.add_argument('--cache-max-mb', type=int, default=1024,
+                        help='size bound of the embedding cache; least recently used entries are evicted')
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='processes parsing byte ranges of the review file')
+    parser.add_argument('--commit-every', type=int, default=None,
+                        help='commit after this many rows per table (default: one commit at the end)')
+    args = parser.parse_args()
+
+    conn = db.connect()
+    cur = conn.cursor()
+    pipeline = Pipeline()
+    cur.execute(db.CREATE_DATA_VERSION)
+    write_restaurants, write_reviews, write_embeddings = make_writers(cur, args.writer, args.batch_size)
+    # Recommendations read restaurants and embeddings, so those writes invalidate cached results
+    write_restaurants = stamp_data_version(cur, write_restaurants)
+    write_embeddings = stamp_data_version(cur, write_embeddings)
+
+    # Stream restaurants: parse -> filter -> transform -> write
     print("Loading restaurant data...")
-    df_restaurants = load_restaurant_data('yelp_academic_dataset_business.json')
-    
-    # Load reviews for restaurants
+    restaurant_ids = set()
+    businesses = pipeline.stage("parse businesses",
+                                parse_json_lines(args.business_path, "Loading businesses"))
+    businesses = pipeline.stage("filter restaurants", filter_restaurants(businesses))
+    rows = pipeline.stage("transform restaurants", map(transform_restaurant, businesses))
+    pipeline.write("write restaurants", write_restaurants,
+                   collect_restaurant_ids(rows, restaurant_ids), args.batch_size, conn, args.commit_every)
+
+    # Stream reviews, keeping only the texts needed for embeddings
     print("Loading reviews...")
-    restaurant_ids = set(df_restaurants['business_id'])
-    df_reviews = load_reviews('yelp_academic_dataset_review.json', restaurant_ids)
-    
-    # Generate embeddings
+    restaurant_texts = {}
+    if args.parse_workers > 1:
+        # Workers prefilter, parse and transform byte ranges of the file
+        rows = pipeline.stage("parse reviews (parallel)",
+                              iter_reviews_parallel(args.review_path, restaurant_ids, MAX_REVIEWS,
+                                                    args.parse_workers),
+                              upstream=False)
+    else:
+        reviews = pipeline.stage("parse reviews",
+                                 parse_json_lines(args.review_path, "Loading reviews"), upstream=False)
+        reviews = pipeline.stage("filter reviews", filter_reviews(reviews, restaurant_ids))
+        rows = pipeline.stage("transform reviews", map(transform_review, reviews))
+    pipeline.write("write reviews", write_reviews,
+                   collect_review_texts(rows, restaurant_texts), args.batch_size, conn, args.commit_every)
+
+    # Generate and write embeddings
     print("Generating embeddings...")
-    embeddings = generate_embeddings(df_reviews)
-    
-    # Save to database
-    print("Saving to database...")
-    conn = psycopg2.connect(**db_params)
-    cur = conn.cursor()
-    
-    # Insert restaurants
-    restaurant_data = [
-        (row['business_id'], row['name'], row['address'], row['city'], 
-         row['state'], row['categories'], row['price_level'], 
-         row['stars'], row['review_count'])
-        for _, row in df_restaurants.iterrows()
-    ]
-    
-    execute_batch(cur, """
-        INSERT INTO restaurants 
-        (restaurant_id, name, address, city, state, categories, 
-         price_level, avg_rating, review_count)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (restaurant_id) DO NOTHING
-    """, restaurant_data)
-    
-    # Insert reviews
-    review_data = [
-        (row['review_id'], row['business_id'], row['user_id'], 
-         row['stars'], row['text'], row['date'])
-        for _, row in df_reviews.iterrows()
-    ]
-    
-    execute_batch(cur, """
-        INSERT INTO ratings 
-        (review_id, restaurant_id, user_id, rating, review_text, review_date)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON CONFLICT (review_id) DO NOTHING
-    """, review_data)
-    
-    # Insert embeddings
-    embedding_data = [
-        (rest_id, embedding.tolist())
-        for rest_id, embedding in embeddings.items()
-    ]
-    
-    execute_batch(cur, """
-        INSERT INTO restaurant_embeddings (restaurant_id, embedding)
-        VALUES (%s, %s)
-        ON CONFLICT (restaurant_id) DO NOTHING
-    """, embedding_data)
-    
+    cache = None
+    if args.cache_dir:
+        cache = EmbeddingCache(args.cache_dir, MODEL_NAME, max_bytes=args.cache_max_mb * 1024 * 1024)
+    embeddings = pipeline.stage("embed restaurants",
+                                embed_restaurants(restaurant_texts, args.embed_batch_size,
+                                                  args.embed_workers, cache),
+                                upstream=False)
+    pipeline.write("write embeddings", write_embeddings, embeddings,
+                   args.batch_size, conn, args.commit_every)
+
     conn.commit()
     conn.close()
-    
+
+    print(f"\nWriter: {args.writer}")
+    pipeline.report()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\nEmbedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evictions, {stats['bytes_saved'] / 1024 / 1024:.1f} MB of text not re-encoded")
     print("Processing complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
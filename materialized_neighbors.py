@@ -0,0 +1,355 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import db
+from attribute_engine import SQL_WEIGHTS, AttributeEngine
+from bulk_writer import CopyWriter
+from vector_engine import VectorEngine, _order_top_k
+
+# 'sql' is the attribute method with SQL_WEIGHTS, named like the recommendation cache keys
+METHODS = ('vector', 'sql')
+
+CREATE_NEIGHBORS = """
+    CREATE TABLE IF NOT EXISTS restaurant_neighbors (
+        restaurant_id VARCHAR(255),
+        method VARCHAR(16),
+        rank SMALLINT,
+        neighbor_id VARCHAR(255),
+        score DOUBLE PRECISION,
+        PRIMARY KEY (restaurant_id, method, rank)
+    )
+"""
+NEIGHBOR_COLUMNS = ('restaurant_id', 'method', 'rank', 'neighbor_id', 'score')
+
+# Rough scratch bytes per (query, restaurant) score cell, including the selection temporaries
+CELL_BYTES = {'vector': 16, 'sql': 48}
+
+def _fingerprint(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+class VectorScorer:
+    """Cosine scores of the vector engine, laid out over every restaurant
+
+    Restaurants without an embedding score -inf and get no neighbors.
+    """
+
+    def __init__(self, engine, restaurant_ids):
+        row_by_id = {rest_id: row for row, rest_id in enumerate(restaurant_ids)}
+        self.engine = engine
+        self.n = len(restaurant_ids)
+        # Both engines are ordered by restaurant_id, so this mapping is increasing and ties break alike
+        self.columns = np.array([row_by_id[rest_id] for rest_id in engine.restaurant_ids], dtype=np.int64)
+        self.engine_row = np.full(self.n, -1, dtype=np.int64)
+        self.engine_row[self.columns] = np.arange(len(self.columns))
+
+    def scores(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = np.full((len(rows), self.n), -np.inf, dtype=np.float32)
+        embedded = np.flatnonzero(self.engine_row[rows] >= 0)
+        if len(embedded):
+            matrix = self.engine.matrix
+            block = matrix[self.engine_row[rows[embedded]]] @ matrix.T
+            scores[embedded[:, None], self.columns[None, :]] = block
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return scores
+
+    def fingerprints(self):
+        fingerprints = np.zeros(self.n, dtype=np.uint64)
+        for row, vector in zip(self.columns, self.engine.matrix):
+            fingerprints[row] = _fingerprint(vector.tobytes())
+        return fingerprints
+
+class AttributeScorer:
+    """Attribute scores of the SQL-based method"""
+
+    def __init__(self, engine, weights=SQL_WEIGHTS):
+        self.engine = engine
+        self.weights = weights
+        self.n = len(engine)
+
+    def scores(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = self.engine.scores_for_rows(rows, self.weights)
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return scores
+
+    def fingerprints(self):
+        return np.array([_fingerprint(f"{details[1]}\0{details[2]}\0{details[3]}".encode('utf-8'))
+                         for details in self.engine.details], dtype=np.uint64)
+
+def select_top_k(scores, k):
+    """The k best finite scores, ties broken by row index like the engines"""
+    k = min(k, int(np.count_nonzero(scores > -np.inf)))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    candidates = np.flatnonzero(scores >= threshold)
+    return _order_top_k(scores[candidates], candidates, k)
+
+def block_size_for_budget(n, method, memory_mb, workers):
+    """Query rows per block so that workers concurrent blocks fit in memory_mb"""
+    return max(1, int(memory_mb * 1024 * 1024 // (workers * max(n, 1) * CELL_BYTES[method])))
+
+def compute_neighbors(scorer, rows, k, block_size, workers=1):
+    """Top-k (neighbor rows, scores) of the given query rows, padded with -1 and NaN
+
+    Blocks of query rows are scored with one matrix operation each and run
+    on a thread pool; NumPy releases the GIL in the products and comparisons.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    neighbor_rows = np.full((len(rows), k), -1, dtype=np.int32)
+    neighbor_scores = np.full((len(rows), k), np.nan, dtype=np.float64)
+
+    def run(start):
+        scores = scorer.scores(rows[start:start + block_size])
+        for i, row_scores in enumerate(scores, start):
+            top_rows, top_scores = select_top_k(row_scores, k)
+            neighbor_rows[i, :len(top_rows)] = top_rows
+            neighbor_scores[i, :len(top_rows)] = top_scores
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, range(0, len(rows), block_size)))
+    return neighbor_rows, neighbor_scores
+
+def refresh_neighbors(scorer, neighbor_rows, neighbor_scores, changed, block_size, workers=1):
+    """Update materialized neighbors in place after the rows in changed got new data
+
+    Rows that changed, or that list a changed row among their neighbors, are
+    recomputed in full. Every other row can only gain candidates, so the
+    changed rows' new scores (both methods are symmetric) are merged into
+    its list. Returns the sorted indices of rows whose lists were rewritten.
+    """
+    k = neighbor_rows.shape[1]
+    changed = np.asarray(changed, dtype=np.int64)
+    stale = np.isin(neighbor_rows, changed).any(axis=1)
+    stale[changed] = True
+    recompute = np.flatnonzero(stale)
+    if len(recompute):
+        neighbor_rows[recompute], neighbor_scores[recompute] = compute_neighbors(
+            scorer, recompute, k, block_size, workers)
+
+    rest = np.flatnonzero(~stale)
+    merged = set()
+    for start in range(0, len(changed), block_size):
+        block = changed[start:start + block_size]
+        # Column y of scorer.scores(block) holds the scores of y against the block
+        block_scores = scorer.scores(block)[:, rest]
+        kth = np.where(neighbor_rows[rest, -1] >= 0, neighbor_scores[rest, -1], -np.inf)
+        best = block_scores.max(axis=0, initial=-np.inf)
+        for j in np.flatnonzero((best >= kth) & (best > -np.inf)):
+            row = rest[j]
+            listed = neighbor_rows[row] >= 0
+            candidates = np.concatenate([neighbor_rows[row][listed].astype(np.int64), block])
+            scores = np.concatenate([neighbor_scores[row][listed], block_scores[:, j].astype(np.float64)])
+            finite = scores > -np.inf
+            top_rows, top_scores = _order_top_k(scores[finite], candidates[finite], k)
+            neighbor_rows[row] = -1
+            neighbor_scores[row] = np.nan
+            neighbor_rows[row, :len(top_rows)] = top_rows
+            neighbor_scores[row, :len(top_rows)] = top_scores
+            merged.add(int(row))
+    return np.union1d(recompute, np.array(sorted(merged), dtype=np.int64))
+
+class NeighborTable:
+    """Materialized top-k neighbors of every restaurant, memory-mapped from a directory
+
+    Each build is a subdirectory of its own, named by CURRENT. In it,
+    meta.json holds the restaurant ids, their details and the data version
+    the table was built from; each method has .npy files of neighbor rows,
+    scores and per-restaurant input fingerprints. A save writes a new build
+    and then switches CURRENT, so readers always see one complete build.
+    """
+
+    def __init__(self, restaurant_ids, details, k, data_version, neighbors, fingerprints):
+        self.restaurant_ids = list(restaurant_ids)
+        self.row_by_id = {rest_id: row for row, rest_id in enumerate(self.restaurant_ids)}
+        self.details = details
+        self.k = k
+        self.data_version = data_version
+        # method -> (rows, scores)
+        self.neighbors_by_method = neighbors
+        self.fingerprints = fingerprints
+
+    @staticmethod
+    def build_directory(directory):
+        """Directory of the current build, or None if nothing was saved yet"""
+        try:
+            with open(os.path.join(directory, 'CURRENT'), encoding='utf-8') as f:
+                return os.path.join(directory, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def exists(cls, directory):
+        return cls.build_directory(directory) is not None
+
+    @classmethod
+    def open(cls, directory, mmap_mode='r'):
+        build = cls.build_directory(directory)
+        if build is None:
+            raise FileNotFoundError(f"no neighbor table in {directory}")
+        directory = build
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        neighbors = {}
+        fingerprints = {}
+        for method in meta['methods']:
+            neighbors[method] = (np.load(os.path.join(directory, f"{method}_rows.npy"), mmap_mode=mmap_mode),
+                                 np.load(os.path.join(directory, f"{method}_scores.npy"), mmap_mode=mmap_mode))
+            fingerprints[method] = np.load(os.path.join(directory, f"{method}_fingerprints.npy"))
+        return cls(meta['restaurant_ids'], [tuple(row) for row in meta['details']], meta['k'],
+                   meta['data_version'], neighbors, fingerprints)
+
+    def save(self, directory):
+        """Write a new build subdirectory, point CURRENT at it, then remove older builds"""
+        os.makedirs(directory, exist_ok=True)
+        name = f"build-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        build = os.path.join(directory, name)
+        os.makedirs(build)
+
+        for method, (rows, scores) in self.neighbors_by_method.items():
+            np.save(os.path.join(build, f"{method}_rows.npy"), np.asarray(rows, dtype=np.int32))
+            np.save(os.path.join(build, f"{method}_scores.npy"), np.asarray(scores, dtype=np.float64))
+            np.save(os.path.join(build, f"{method}_fingerprints.npy"), self.fingerprints[method])
+        meta = {
+            'k': self.k,
+            'data_version': self.data_version,
+            'methods': list(self.neighbors_by_method),
+            'restaurant_ids': self.restaurant_ids,
+            'details': [[d[0], d[1], _number(d[2]), _number(d[3]), d[4], d[5]] for d in self.details]
+        }
+        with open(os.path.join(build, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        # The rename is the commit point; a crash before it leaves the previous build current
+        pointer = os.path.join(directory, 'CURRENT')
+        with open(pointer + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(pointer + '.tmp', pointer)
+        for entry in os.listdir(directory):
+            if entry.startswith('build-') and entry != name:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+    def neighbors(self, restaurant_id, method, k=5):
+        """(rows, scores) of the stored top-k, at most self.k"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        rows, scores = self.neighbors_by_method[method]
+        listed = rows[row, :k] >= 0
+        return np.asarray(rows[row, :k][listed], dtype=np.int64), np.asarray(scores[row, :k][listed])
+
+    def top_k(self, restaurant_id, method, k=5):
+        """Rows shaped like the engines' top_k: (name, categories, price_level, avg_rating, similarity_score)"""
+        return [tuple(self.details[row][:4]) + (float(score),)
+                for row, score in zip(*self.neighbors(restaurant_id, method, k))]
+
+def _number(value):
+    return None if value is None else float(value)
+
+def store_neighbors(conn, table, method, rows=None, batch_size=10000):
+    """Replace the restaurant_neighbors rows of method, or only those of the given table rows"""
+    cur = conn.cursor()
+    neighbor_rows, neighbor_scores = table.neighbors_by_method[method]
+    if rows is None:
+        cur.execute("DELETE FROM restaurant_neighbors WHERE method = %s", (method,))
+        rows = np.arange(len(table.restaurant_ids))
+    else:
+        cur.execute("DELETE FROM restaurant_neighbors WHERE method = %s AND restaurant_id = ANY(%s)",
+                    (method, [table.restaurant_ids[row] for row in rows]))
+    write = CopyWriter(cur, 'restaurant_neighbors', NEIGHBOR_COLUMNS, 'restaurant_id, method, rank')
+    for start in range(0, len(rows), batch_size):
+        write([(table.restaurant_ids[row], method, rank, table.restaurant_ids[neighbor], float(score))
+               for row in rows[start:start + batch_size]
+               for rank, (neighbor, score) in enumerate(zip(neighbor_rows[row], neighbor_scores[row]), 1)
+               if neighbor >= 0])
+    cur.close()
+
+def materialize(conn, directory, k=10, methods=METHODS, memory_mb=512, workers=None, incremental=False,
+                write_db=True):
+    """Build or refresh the neighbor table of every method; returns {method: rows rewritten}
+
+    With incremental=True only rows whose inputs changed since the last
+    build (by fingerprint), and rows whose neighbors they can affect, are
+    recomputed. A changed set of restaurants or k forces a full build.
+    """
+    workers = workers or os.cpu_count() or 1
+    repo = db.Repository(conn)
+    # Read before loading, so the stamp is never newer than the data it describes
+    data_version = repo.data_version()
+    attribute_engine = AttributeEngine.load(conn)
+    scorers = {'sql': lambda: AttributeScorer(attribute_engine),
+               'vector': lambda: VectorScorer(VectorEngine.load(conn), attribute_engine.restaurant_ids)}
+    n = len(attribute_engine)
+
+    previous = None
+    if incremental and NeighborTable.exists(directory):
+        previous = NeighborTable.open(directory, mmap_mode=None)
+        if previous.restaurant_ids != attribute_engine.restaurant_ids or previous.k != k:
+            print("Restaurants or k changed since the last build; recomputing everything")
+            previous = None
+
+    neighbors = {}
+    fingerprints = {}
+    rewritten = {}
+    for method in methods:
+        start = time.perf_counter()
+        scorer = scorers[method]()
+        fingerprints[method] = scorer.fingerprints()
+        block_size = block_size_for_budget(n, method, memory_mb, workers)
+        if previous is not None and method in previous.neighbors_by_method:
+            rows, scores = (np.array(array) for array in previous.neighbors_by_method[method])
+            changed = np.flatnonzero(fingerprints[method] != previous.fingerprints[method])
+            rewritten[method] = refresh_neighbors(scorer, rows, scores, changed, block_size, workers)
+        else:
+            rows, scores = compute_neighbors(scorer, np.arange(n), k, block_size, workers)
+            rewritten[method] = None
+        neighbors[method] = (rows, scores)
+        count = n if rewritten[method] is None else len(rewritten[method])
+        print(f"{method}: {count} of {n} rows computed in {time.perf_counter() - start:.1f}s "
+              f"(blocks of {block_size} rows, {workers} workers)")
+
+    if previous is not None:
+        for method, arrays in previous.neighbors_by_method.items():
+            if method not in neighbors:
+                neighbors[method] = arrays
+                fingerprints[method] = previous.fingerprints[method]
+    table = NeighborTable(attribute_engine.restaurant_ids, attribute_engine.details, k, data_version,
+                          neighbors, fingerprints)
+    table.save(directory)
+
+    if write_db:
+        cur = conn.cursor()
+        cur.execute(CREATE_NEIGHBORS)
+        for method in methods:
+            store_neighbors(conn, table, method, rewritten[method])
+        conn.commit()
+        cur.close()
+    return {method: n if rows is None else len(rows) for method, rows in rewritten.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the top-k neighbors of every restaurant')
+    parser.add_argument('--directory', default='neighbors', help='memory-mapped neighbor files')
+    parser.add_argument('--k', type=int, default=10, help='neighbors stored per restaurant and method')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--memory-mb', type=int, default=512,
+                        help='budget for the score blocks of all workers together')
+    parser.add_argument('--workers', type=int, default=None, help='threads scoring blocks (default: all cores)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='recompute only rows affected by data changed since the last build')
+    parser.add_argument('--no-db', action='store_true', help='write only the memory-mapped files')
+    args = parser.parse_args()
+
+    conn = db.connect()
+    materialize(conn, args.directory, args.k, args.methods, args.memory_mb, args.workers,
+                args.incremental, not args.no_db)
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import numpy as np
+from catalog import CatalogDetails
+
+# Weights of overall_score, shared with relevant_metrics.calculate_metrics
+METRIC_WEIGHTS = {
+    'category_match': 0.3,
+    'price_level_accuracy': 0.2,
+    'rating_similarity': 0.2,
+    'location_relevance': 0.2,
+    'variety_score': 0.1
+}
+
+METRIC_NAMES = tuple(METRIC_WEIGHTS) + ('overall_score',)
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        """Set bits per row of a (..., n_words) uint64 array"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+    def popcount(words):
+        """Set bits per row of a (..., n_words) uint64 array"""
+        as_bytes = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+        return _BYTE_BITS[as_bytes].sum(axis=-1)
+
+def category_bitsets(categories):
+    """Pack each row's category set into a uint64 bitset, splitting like calculate_metrics
+
+    Returns (bitsets, vocabulary) where bitsets has shape (n_rows, n_words).
+    """
+    vocabulary = {}
+    split = []
+    for value in categories:
+        row = set(value.split(', '))
+        split.append([vocabulary.setdefault(category, len(vocabulary)) for category in row])
+    n_words = max(1, (len(vocabulary) + 63) // 64)
+    bitsets = np.zeros((len(split), n_words), dtype=np.uint64)
+    for row, ids in enumerate(split):
+        for category_id in ids:
+            bitsets[row, category_id >> 6] |= np.uint64(1) << np.uint64(category_id & 63)
+    return bitsets, vocabulary
+
+class MetricsColumns:
+    """Per-restaurant columns needed by the metrics, aligned with an engine's rows"""
+
+    def __init__(self, details):
+        """details: rows of (name, categories, price_level, avg_rating, city, state)"""
+        self.bitsets, self.vocabulary = category_bitsets([row[1] for row in details])
+        self.price_level = np.array([float(row[2]) for row in details], dtype=np.float64)
+        self.avg_rating = np.array([float(row[3]) for row in details], dtype=np.float64)
+        locations = {}
+        states = {}
+        self.location_id = np.array([locations.setdefault((row[4], row[5]), len(locations)) for row in details],
+                                    dtype=np.int64)
+        self.state_id = np.array([states.setdefault(row[5], len(states)) for row in details], dtype=np.int64)
+
+    @classmethod
+    def from_catalog(cls, catalog, rows=None):
+        """Columns of the given catalog rows (default all), reusing its interned categories and locations"""
+        rows = np.arange(len(catalog)) if rows is None else np.asarray(rows, dtype=np.int64)
+        columns = cls.__new__(cls)
+        columns.bitsets = catalog.category_bitsets()[catalog.category_set[rows]]
+        columns.vocabulary = {category: i for i, category in enumerate(catalog.category_vocabulary)}
+        columns.price_level = catalog.price_level[rows].astype(np.float64)
+        columns.avg_rating = catalog.avg_rating[rows]
+        columns.location_id = catalog.location_id[rows].astype(np.int64)
+        columns.state_id = catalog.state_id[rows].astype(np.int64)
+        return columns
+
+    @classmethod
+    def from_engine(cls, engine):
+        if isinstance(engine.details, CatalogDetails):
+            return cls.from_catalog(engine.details.catalog, engine.details.catalog_rows())
+        return cls(engine.details)
+
+def compute_metrics(columns, query_rows, rec_rows):
+    """Metrics of calculate_metrics for many queries in one pass
+
+    query_rows: (n,) rows of the original restaurants.
+    rec_rows: (n, k) rows of their recommendations, padded with -1 when a
+    query has fewer than k. Returns {metric: (n,) float64 array}; queries
+    without recommendations get NaN.
+    """
+    query_rows = np.asarray(query_rows, dtype=np.int64)
+    rec_rows = np.asarray(rec_rows, dtype=np.int64)
+    valid = rec_rows >= 0
+    safe = np.where(valid, rec_rows, 0)
+    counts = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        def mean(values):
+            return np.where(valid, values, 0.0).sum(axis=1) / counts
+
+        query_bits = columns.bitsets[query_rows]
+        rec_bits = columns.bitsets[safe]
+        overlap = popcount(rec_bits & query_bits[:, None, :])
+        orig_size = popcount(query_bits)
+        category_match = mean(overlap / orig_size[:, None])
+
+        price_level_accuracy = mean(1 - np.abs(columns.price_level[safe] -
+                                               columns.price_level[query_rows][:, None]) / 4)
+        rating_similarity = mean(1 - np.abs(columns.avg_rating[safe] -
+                                            columns.avg_rating[query_rows][:, None]) / 5)
+
+        same_location = columns.location_id[safe] == columns.location_id[query_rows][:, None]
+        same_state = columns.state_id[safe] == columns.state_id[query_rows][:, None]
+        location_relevance = mean(np.where(same_location, 1.0, np.where(same_state, 0.5, 0.0)))
+
+        union = np.bitwise_or.reduce(np.where(valid[:, :, None], rec_bits, np.uint64(0)), axis=1)
+        variety_score = popcount(union) / (counts * 3)
+
+    metrics = {
+        'category_match': category_match,
+        'price_level_accuracy': price_level_accuracy,
+        'rating_similarity': rating_similarity,
+        'location_relevance': location_relevance,
+        'variety_score': variety_score
+    }
+    metrics['overall_score'] = sum(metrics[metric] * weight for metric, weight in METRIC_WEIGHTS.items())
+    return metrics
+
+def pad_rows(results, k):
+    """Stack neighbors results [(rows, scores), ...] into an (n, k) matrix padded with -1"""
+    rec_rows = np.full((len(results), k), -1, dtype=np.int64)
+    for i, (rows, _) in enumerate(results):
+        rec_rows[i, :len(rows)] = rows[:k]
+    return rec_rows
+
+def verify_parity(details, query_rows, rec_rows):
+    """Compare compute_metrics with relevant_metrics.calculate_metrics
+
+    Returns the largest absolute difference per metric.
+    """
+    from relevant_metrics import calculate_metrics
+    columns = MetricsColumns(details)
+    kernel = compute_metrics(columns, query_rows, rec_rows)
+    keys = ('name', 'categories', 'price_level', 'avg_rating', 'city', 'state')
+    worst = dict.fromkeys(METRIC_NAMES, 0.0)
+    for i, (query_row, rows) in enumerate(zip(query_rows, rec_rows)):
+        rows = [row for row in rows if row >= 0]
+        if not rows:
+            continue
+        original = dict(zip(keys, details[query_row]))
+        expected = calculate_metrics(original, [dict(zip(keys, details[row])) for row in rows])
+        for metric in METRIC_NAMES:
+            worst[metric] = max(worst[metric], abs(expected[metric] - kernel[metric][i]))
+    return worst
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+
+BUSINESS_ID_PATTERN = re.compile(rb'"business_id"\s*:\s*"([^"\\]*)"')
+
+_worker_ids = None
+
+def byte_ranges(path, chunk_bytes):
+    """Split a file into (start, end) ranges that begin and end on line boundaries"""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def _init_worker(restaurant_ids):
+    global _worker_ids
+    _worker_ids = restaurant_ids
+
+def parse_range(path, start, end, restaurant_ids, limit):
+    """Return (rows, lines) for the reviews of restaurant_ids in one byte range
+
+    The business_id is matched on the raw bytes, so lines of other businesses
+    are never JSON-decoded. At most limit rows are kept: no later range can
+    contribute to the first limit matches of this one.
+    """
+    from load_yelp_data import transform_review
+    rows = []
+    lines = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for line in f.read(end - start).split(b'\n'):
+            if not line:
+                continue
+            lines += 1
+            match = BUSINESS_ID_PATTERN.search(line)
+            if match is not None and match.group(1) not in restaurant_ids:
+                continue
+            review = json.loads(line)
+            if review['business_id'].encode('utf-8') in restaurant_ids:
+                rows.append(transform_review(review))
+                if len(rows) >= limit:
+                    break
+    return rows, lines
+
+def _parse_range_task(args):
+    path, start, end, limit = args
+    return parse_range(path, start, end, _worker_ids, limit)
+
+def iter_reviews_parallel(review_path, restaurant_ids, limit, workers=4, chunk_bytes=32 * 1024 * 1024):
+    """Stream review insert tuples, parsing byte ranges of the file in a process pool
+
+    Ranges are merged back in file order, so the rows and the cutoff at limit
+    are identical to the single-process reader. Only a few ranges are in
+    flight at a time to keep memory bounded.
+    """
+    ids = frozenset(rest_id.encode('utf-8') for rest_id in restaurant_ids)
+    ranges = byte_ranges(review_path, chunk_bytes)
+    tasks = ((review_path, start, end, limit) for start, end in ranges)
+    remaining = limit
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ids,)) as pool:
+        pending = [pool.submit(_parse_range_task, task) for task in islice(tasks, 2 * workers)]
+        while pending and remaining > 0:
+            rows, _ = pending.pop(0).result()
+            next_task = next(tasks, None)
+            if next_task is not None:
+                pending.append(pool.submit(_parse_range_task, next_task))
+            rows = rows[:remaining]
+            remaining -= len(rows)
+            yield from rows
+        for future in pending:
+            future.cancel()
+
+def write_synthetic_reviews(path, n_lines, n_businesses=20000, seed=42):
+    """Write a review file shaped like yelp_academic_dataset_review.json
+
+    Returns the list of business ids used.
+    """
+    rng = np.random.default_rng(seed)
+    business_ids = [f"b{i:021d}" for i in range(n_businesses)]
+    words = "great food service pizza tacos friendly staff slow wait delicious fresh menu price".split()
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n_lines):
+            review = {
+                'review_id': f"r{i:021d}",
+                'user_id': f"u{int(rng.integers(1_000_000)):021d}",
+                'business_id': business_ids[int(rng.integers(n_businesses))],
+                'stars': float(rng.integers(1, 6)),
+                'useful': 0, 'funny': 0, 'cool': 0,
+                'text': " ".join(rng.choice(words, int(rng.integers(20, 150)))),
+                'date': '2018-07-07 22:09:11'
+            }
+            f.write(json.dumps(review) + '\n')
+    return business_ids
+
+def run_benchmark(worker_counts, n_lines=500000, match_fraction=0.15, chunk_mb=8):
+    """Report lines/sec for the serial reader and each worker count"""
+    from load_yelp_data import iter_reviews
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'reviews.json')
+        print(f"Writing {n_lines} synthetic reviews...")
+        business_ids = write_synthetic_reviews(path, n_lines)
+        restaurant_ids = set(business_ids[:int(len(business_ids) * match_fraction)])
+        limit = n_lines
+
+        start = time.perf_counter()
+        expected = list(iter_reviews(path, restaurant_ids, limit))
+        baseline = n_lines / (time.perf_counter() - start)
+
+        print(f"\n{'workers':>8} {'lines/sec':>12} {'speedup':>8} {'rows':>8} {'identical':>10}")
+        print("=" * 50)
+        print(f"{'serial':>8} {baseline:>12.0f} {1.0:>7.1f}x {len(expected):>8} {'-':>10}")
+        for workers in worker_counts:
+            start = time.perf_counter()
+            rows = list(iter_reviews_parallel(path, restaurant_ids, limit, workers,
+                                              chunk_bytes=chunk_mb * 1024 * 1024))
+            rate = n_lines / (time.perf_counter() - start)
+            print(f"{workers:>8} {rate:>12.0f} {rate / baseline:>7.1f}x {len(rows):>8} "
+                  f"{str(rows == expected):>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parallel review parsing benchmark')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--lines', type=int, default=500000)
+    parser.add_argument('--match-fraction', type=float, default=0.15,
+                        help='share of businesses that are loaded restaurants')
+    parser.add_argument('--chunk-mb', type=int, default=8)
+    args = parser.parse_args()
+    run_benchmark(args.workers, args.lines, args.match_fraction, args.chunk_mb)
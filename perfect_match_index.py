@@ -0,0 +1,66 @@
+import copy
+import numpy as np
+from attribute_engine import SQL_WEIGHTS, attribute_scores
+from attribute_index import AttributeIndex
+
+def normalize_categories(categories):
+    """Order-insensitive category set, so 'Pizza, Bars' and 'Bars, Pizza' compare equal"""
+    if not categories:
+        return frozenset()
+    return frozenset(c.strip() for c in categories.split(',') if c.strip())
+
+class PerfectMatchIndex:
+    """Equivalence classes of restaurants keyed on (category set, price_level, avg_rating)"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        groups = {}
+        self.key_of_row = []
+        # Normalized category sets interned as ids, the category key of the closest-match fallback
+        self.category_set_ids = {}
+        category_set = []
+        for row, detail in enumerate(engine.details):
+            key = (normalize_categories(detail[1]), float(detail[2]), float(detail[3]))
+            groups.setdefault(key, []).append(row)
+            self.key_of_row.append(key)
+            category_set.append(self.category_set_ids.setdefault(key[0], len(self.category_set_ids)))
+        self.category_set = np.array(category_set, dtype=np.int32)
+        self.groups = {key: np.array(rows, dtype=np.int64) for key, rows in groups.items()}
+        self.bucket_index = None
+
+    @classmethod
+    def from_engine(cls, engine):
+        return cls(engine)
+
+    def perfect_match_rows(self, restaurant_id):
+        """Rows sharing the restaurant's equivalence class, excluding itself"""
+        row = self.engine.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        rows = self.groups[self.key_of_row[row]]
+        return rows[rows != row]
+
+    def perfect_matches(self, restaurant_id, weights=SQL_WEIGHTS):
+        """Perfect matches formatted like the SQL query"""
+        rows = self.perfect_match_rows(restaurant_id)
+        scores = np.full(len(rows), attribute_scores(1.0, 0.0, 0.0, weights))
+        return self.engine._format(rows, scores)
+
+    def closest_matches(self, restaurant_id, k=5, weights=SQL_WEIGHTS):
+        """Fallback top-k served by the bucket index, built on first use
+
+        Categories match on the normalized set, as in perfect matching, so
+        'Bars, Pizza' gets full category credit against 'Pizza, Bars'.
+        """
+        if self.bucket_index is None:
+            normalized = copy.copy(self.engine)
+            normalized.category = self.category_set
+            normalized.category_ids = self.category_set_ids
+            self.bucket_index = AttributeIndex.from_engine(normalized)
+        return self.bucket_index.top_k(restaurant_id, k, weights)
+
+    def audit(self, min_size=2):
+        """Return every equivalence class with at least min_size restaurants, largest first"""
+        groups = [(key, rows) for key, rows in self.groups.items() if len(rows) >= min_size]
+        groups.sort(key=lambda group: (-len(group[1]), group[1][0]))
+        return groups
@@ -0,0 +1,183 @@
+import json
+import os
+import numpy as np
+from vector_engine import _order_top_k
+
+class ScalarQuantizer:
+    """Symmetric per-dimension int8 quantization, one byte per dimension"""
+    kind = 'int8'
+
+    def __init__(self, scale):
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def train(cls, matrix, **params):
+        scale = np.abs(matrix).max(axis=0) / 127
+        scale[scale == 0] = 1.0
+        return cls(scale)
+
+    def encode(self, matrix):
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes, query, block_size=1024):
+        """Approximate inner products of query with every encoded row"""
+        # Fold the scale into the query, and convert small blocks into one reused buffer that stays in cache
+        weighted = (query * self.scale).astype(np.float32)
+        scores = np.empty(len(codes), dtype=np.float32)
+        buffer = np.empty((block_size, codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), block_size):
+            block = codes[start:start + block_size]
+            converted = buffer[:len(block)]
+            converted[...] = block
+            scores[start:start + block_size] = converted @ weighted
+        return scores
+
+    def params(self):
+        return {'scale': self.scale}
+
+class ProductQuantizer:
+    """Product quantization: m subspaces, each coded as one of 256 k-means centroids"""
+    kind = 'pq'
+
+    def __init__(self, centroids):
+        # (m, 256, dim // m)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+
+    @property
+    def m(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, matrix, m=48, n_iter=20, train_size=25600, seed=0):
+        if matrix.shape[1] % m:
+            raise ValueError(f"{matrix.shape[1]} dimensions do not split into {m} subspaces")
+        rng = np.random.default_rng(seed)
+        train = matrix
+        if len(matrix) > train_size:
+            train = matrix[rng.choice(len(matrix), train_size, replace=False)]
+        n_centroids = min(256, len(train))
+        sub = train.reshape(len(train), m, -1)
+        centroids = np.empty((m, n_centroids, sub.shape[2]), dtype=np.float32)
+        for i in range(m):
+            centroids[i] = _kmeans(sub[:, i], n_centroids, n_iter, rng)
+        return cls(centroids)
+
+    def encode(self, matrix, block_size=16384):
+        """Codes of shape (m, n): one contiguous row of centroid ids per subspace"""
+        sub = matrix.reshape(len(matrix), self.m, -1)
+        codes = np.empty((self.m, len(matrix)), dtype=np.uint8)
+        for i in range(self.m):
+            for start in range(0, len(matrix), block_size):
+                codes[i, start:start + block_size] = _nearest(sub[start:start + block_size, i], self.centroids[i])
+        return codes
+
+    def scores(self, codes, query):
+        """Asymmetric distance computation: sum of per-subspace lookup table entries"""
+        table = np.einsum('mcd,md->mc', self.centroids, query.reshape(self.m, -1))
+        scores = np.zeros(codes.shape[1], dtype=np.float32)
+        for subspace_table, subspace_codes in zip(table, codes):
+            scores += subspace_table.take(subspace_codes)
+        return scores
+
+    def params(self):
+        return {'centroids': self.centroids}
+
+QUANTIZERS = {quantizer.kind: quantizer for quantizer in (ScalarQuantizer, ProductQuantizer)}
+
+def _nearest(vectors, centroids):
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * vectors @ centroids.T
+    return distances.argmin(axis=1)
+
+def _kmeans(vectors, n_centroids, n_iter, rng):
+    centroids = vectors[rng.choice(len(vectors), n_centroids, replace=False)].copy()
+    for _ in range(n_iter):
+        assignment = _nearest(vectors, centroids)
+        sums = np.stack([np.bincount(assignment, weights=vectors[:, d], minlength=n_centroids)
+                         for d in range(vectors.shape[1])], axis=1)
+        counts = np.bincount(assignment, minlength=n_centroids)
+        # Re-seed empty cells from random training vectors
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), empty.sum(), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+    return centroids
+
+class QuantizedIndex:
+    """Compressed embedding codes with exact rescoring of a shortlist
+
+    A query scans the codes for its rescore best approximate matches, then
+    ranks those against the full-precision vectors, which are memory-mapped
+    from vectors.npy on first use. Only the codes stay resident.
+    """
+
+    def __init__(self, directory, restaurant_ids, quantizer, codes, rescore=100):
+        self.directory = directory
+        self.restaurant_ids = list(restaurant_ids)
+        self.row_by_id = {rest_id: row for row, rest_id in enumerate(self.restaurant_ids)}
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rescore = rescore
+        self._vectors = None
+
+    @classmethod
+    def build(cls, matrix, restaurant_ids, directory, kind='int8', rescore=100, **params):
+        """Train the quantizer on normalized vectors and write codes and full vectors to directory"""
+        os.makedirs(directory, exist_ok=True)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        quantizer = QUANTIZERS[kind].train(matrix, **params)
+        codes = quantizer.encode(matrix)
+        np.save(os.path.join(directory, 'vectors.npy'), matrix)
+        np.save(os.path.join(directory, 'codes.npy'), codes)
+        np.savez(os.path.join(directory, 'quantizer.npz'), **quantizer.params())
+        with open(os.path.join(directory, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump({'kind': kind, 'restaurant_ids': list(restaurant_ids)}, f)
+        return cls(directory, restaurant_ids, quantizer, codes, rescore)
+
+    @classmethod
+    def from_engine(cls, engine, directory, **params):
+        """Build from a loaded VectorEngine"""
+        return cls.build(engine.matrix, engine.restaurant_ids, directory, **params)
+
+    @classmethod
+    def load(cls, directory, rescore=100):
+        with open(os.path.join(directory, 'index.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        with np.load(os.path.join(directory, 'quantizer.npz')) as data:
+            quantizer = QUANTIZERS[meta['kind']](**{name: data[name] for name in data.files})
+        codes = np.load(os.path.join(directory, 'codes.npy'))
+        return cls(directory, meta['restaurant_ids'], quantizer, codes, rescore)
+
+    def __len__(self):
+        return len(self.restaurant_ids)
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            self._vectors = np.load(os.path.join(self.directory, 'vectors.npy'), mmap_mode='r')
+        return self._vectors
+
+    def memory_bytes(self):
+        """Resident bytes: the codes and quantizer parameters, not the memory-mapped vectors"""
+        return self.codes.nbytes + sum(value.nbytes for value in self.quantizer.params().values())
+
+    def search(self, query, k=5, rescore=None, exclude=None):
+        """Return (rows, scores) of the top-k after exact rescoring of the approximate shortlist"""
+        rescore = max(k, rescore or self.rescore)
+        scores = self.quantizer.scores(self.codes, query)
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        shortlist = min(rescore, len(scores) - (exclude is not None))
+        if shortlist <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # Sorted rows read the memory-mapped vectors in file order
+        rows = np.sort(np.argpartition(-scores, shortlist - 1)[:shortlist])
+        exact = np.asarray(self.vectors[rows]) @ query
+        return _order_top_k(exact, rows, k)
+
+    def neighbors(self, restaurant_id, k=5, rescore=None):
+        """Counterpart of VectorEngine.neighbors"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.search(np.asarray(self.vectors[row]), k, rescore, exclude=row)
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+import instrumentation
+
+_MISSING = object()
+
+def cache_key(restaurant_id, method, k, weights=None):
+    """(restaurant_id, method, k, weights) with weights as a sorted, hashable tuple"""
+    return (restaurant_id, method, k, tuple(sorted(weights.items())) if weights else None)
+
+class RecommendationCache:
+    """Bounded in-process cache of recommendation results with LRU and TTL eviction
+
+    Every entry is tagged with the data version it was computed under (see
+    db.bump_data_version). Lookups read the current version through the
+    caller's read_version callable, at most once per check_interval seconds;
+    when it advances all entries are dropped. With the default
+    check_interval of 0 the version is read on every lookup, so a result is
+    never served after the loader has committed newer restaurants or
+    embeddings. Thread-safe; results are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300.0, check_interval=0.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        # key -> (expires_at, version, value), least recently used first
+        self.entries = OrderedDict()
+        self.version = None
+        self.checked_at = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def refresh_version(self, read_version):
+        """Read the data version if the check is due and drop everything when it advanced"""
+        now = self.clock()
+        with self.lock:
+            due = self.checked_at is None or now - self.checked_at >= self.check_interval
+        if not due:
+            return self.version
+        version = read_version()
+        with self.lock:
+            self.checked_at = now
+            # Versions only grow; a thread that read before a bump must not roll the cache back
+            if self.version is None or version > self.version:
+                if self.entries:
+                    self.invalidations += 1
+                    self.entries.clear()
+                self.version = version
+            return self.version
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, entry_version, value = entry
+                if entry_version == version and expires_at > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    instrumentation.count('recommendation_cache_total', result='hit')
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+        instrumentation.count('recommendation_cache_total', result='miss')
+        return _MISSING
+
+    def put(self, key, value, version):
+        with self.lock:
+            if self.version is not None and version < self.version:
+                # Computed against data that has since been replaced
+                return
+            self.entries[key] = (self.clock() + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, read_version):
+        """Cached value of key, calling compute() on a miss
+
+        The version is read before computing, so an entry is never tagged
+        newer than the data it was computed from.
+        """
+        version = self.refresh_version(read_version)
+        value = self.get(key, version)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'version': self.version
+            }
+
+class CachedRepository:
+    """db.Repository front end answering repeated recommendation queries from a cache
+
+    Several instances, each on its own connection, can share one cache.
+    """
+
+    def __init__(self, repo, cache):
+        self.repo = repo
+        self.cache = cache
+
+    def sql_recommendations(self, restaurant_id, weights, k=5):
+        return self.cache.get_or_compute(cache_key(restaurant_id, 'sql', k, weights),
+                                         lambda: self.repo.sql_recommendations(restaurant_id, weights, k),
+                                         self.repo.data_version)
+
+    def vector_recommendations(self, restaurant_id, k=5):
+        return self.cache.get_or_compute(cache_key(restaurant_id, 'vector', k),
+                                         lambda: self.repo.vector_recommendations(restaurant_id, k),
+                                         self.repo.data_version)
+
+    def __getattr__(self, name):
+        # Everything else (details, batches, execute) goes straight to the repository
+        return getattr(self.repo, name)
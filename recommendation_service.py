@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+import numpy as np
+import instrumentation
+from attribute_engine import AttributeEngine
+from catalog import Catalog
+from vector_engine import VectorEngine
+
+# Same as db.RECOMMENDATION_COLUMNS, kept here so serving from a snapshot does not load psycopg2
+RECOMMENDATION_COLUMNS = ('name', 'categories', 'price_level', 'avg_rating', 'similarity_score', 'city', 'state')
+MAX_K = 100
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class MicroBatcher:
+    """Coalesce concurrent requests into one batched call of handler
+
+    A batch opens when a request arrives and closes after max_wait seconds
+    or at max_batch requests, whichever comes first. handler(items) runs on
+    its own thread, so requests arriving meanwhile queue up and form the
+    next batch. submit raises asyncio.QueueFull when max_queue requests are
+    already waiting.
+    """
+
+    def __init__(self, name, handler, max_batch=64, max_wait=0.002, max_queue=1024):
+        self.name = name
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batch-{name}")
+        self.task = None
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        # Batch size counts in power-of-two buckets: 1, 2, 3-4, 5-8, ...
+        self.batch_sizes = {}
+        self.queue_waits = deque(maxlen=10000)
+
+    def start(self):
+        self.queue = asyncio.Queue(self.max_queue)
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            instrumentation.count('service_rejected_total', method=self.name)
+            raise
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                if self.queue.qsize():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests a caller gave up on are dropped before computing
+            batch = [entry for entry in batch if not entry[1].cancelled()]
+            if not batch:
+                continue
+            self._record(batch)
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.handler, [item for item, _, _ in batch])
+            except Exception as error:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            instrumentation.observe('service_batch_seconds', time.perf_counter() - start, method=self.name)
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        bucket = 1 << (len(batch) - 1).bit_length()
+        self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+        for _, _, enqueued in batch:
+            self.queue_waits.append(now - enqueued)
+            instrumentation.observe('service_queue_seconds', now - enqueued, method=self.name)
+        instrumentation.count('service_batches_total', method=self.name)
+        instrumentation.count('service_batch_items_total', len(batch), method=self.name)
+
+    def stats(self):
+        waits = np.array(self.queue_waits) * 1000 if self.queue_waits else np.zeros(1)
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'queue_capacity': self.max_queue,
+            'batches': self.batches,
+            'requests': self.items,
+            'rejected': self.rejected,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'batch_size_buckets': {f"<={size}": count for size, count in sorted(self.batch_sizes.items())},
+            'queue_wait_ms': dict(zip(('p50', 'p95', 'p99'), np.percentile(waits, [50, 95, 99]).round(3).tolist()))
+        }
+
+def batch_handler(engine):
+    """handler for MicroBatcher: [(restaurant_id, k)] -> [(rows, scores)] with one neighbors_batch call
+
+    The batch is answered at its largest k and each result cut to its own k;
+    engines order by score then row, so that is the same as querying each k.
+    """
+    def handle(requests):
+        k = max(k for _, k in requests)
+        results = engine.neighbors_batch([rest_id for rest_id, _ in requests], k)
+        return [(rows[:request_k], scores[:request_k]) for (_, request_k), (rows, scores) in zip(requests, results)]
+    return handle
+
+class RecommendationService:
+    """HTTP/1.1 front end over micro-batched vector and attribute engines
+
+    GET /recommendations/{vector|attribute}/{restaurant_id}?k=5
+    GET /health   status, data version and per-method batch statistics (JSON)
+    GET /metrics  instrumentation counters and histograms (Prometheus text)
+    """
+
+    def __init__(self, engines, data_version=0, max_batch=64, max_wait=0.002, max_queue=1024):
+        """engines: method name -> engine with neighbors_batch, row_by_id and details"""
+        self.engines = engines
+        self.data_version = data_version
+        self.batchers = {method: MicroBatcher(method, batch_handler(engine), max_batch, max_wait, max_queue)
+                         for method, engine in engines.items()}
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8080):
+        for batcher in self.batchers.values():
+            batcher.start()
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.stop()
+
+    async def recommend(self, method, restaurant_id, k=5):
+        """Top-k rows shaped like db.RECOMMENDATION_COLUMNS, or None for an unknown restaurant"""
+        engine = self.engines[method]
+        if restaurant_id not in engine.row_by_id:
+            return None
+        rows, scores = await self.batchers[method].submit((restaurant_id, k))
+        return [dict(zip(RECOMMENDATION_COLUMNS,
+                         tuple(engine.details[row][:4]) + (float(score),) + tuple(engine.details[row][4:6])))
+                for row, score in zip(rows, scores)]
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'data_version': self.data_version,
+            'restaurants': {method: len(engine) for method, engine in self.engines.items()},
+            'batching': {method: batcher.stats() for method, batcher in self.batchers.items()}
+        }
+
+    async def route(self, verb, target):
+        """(status, content type, body) of one request"""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        if verb != 'GET':
+            return _json(405, {'error': 'only GET is supported'})
+        if parts == ['health']:
+            return _json(200, self.health())
+        if parts == ['metrics']:
+            return 200, 'text/plain; version=0.0.4', instrumentation.METRICS.export_text().encode('utf-8')
+        if len(parts) != 3 or parts[0] != 'recommendations' or parts[1] not in self.engines:
+            return _json(404, {'error': f"unknown path {url.path}"})
+
+        method, restaurant_id = parts[1], parts[2]
+        try:
+            k = int(parse_qs(url.query).get('k', ['5'])[0])
+        except ValueError:
+            k = 0
+        if not 1 <= k <= MAX_K:
+            return _json(400, {'error': f"k must be an integer from 1 to {MAX_K}"})
+        start = time.perf_counter()
+        try:
+            recommendations = await self.recommend(method, restaurant_id, k)
+        except asyncio.QueueFull:
+            instrumentation.count('service_requests_total', method=method, status=503)
+            return _json(503, {'error': f"{method} queue is full, retry later"})
+        status = 200 if recommendations is not None else 404
+        instrumentation.count('service_requests_total', method=method, status=status)
+        instrumentation.observe('service_request_seconds', time.perf_counter() - start, method=method)
+        if recommendations is None:
+            return _json(404, {'error': f"unknown restaurant {restaurant_id}"})
+        return _json(200, {'restaurant_id': restaurant_id, 'method': method, 'recommendations': recommendations})
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until the client closes it or asks to"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    content_length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    content_length = -1
+
+                fields = request_line.decode('latin-1').split()
+                keep_alive = False
+                if content_length < 0:
+                    # The body cannot be skipped, so the connection is closed after answering
+                    status, content_type, body = _json(400, {'error': 'invalid Content-Length'})
+                elif len(fields) != 3:
+                    status, content_type, body = _json(400, {'error': 'malformed request line'})
+                else:
+                    if content_length:
+                        await reader.readexactly(content_length)
+                    verb, target, version = fields
+                    try:
+                        status, content_type, body = await self.route(verb, target)
+                    except Exception as error:
+                        instrumentation.count('service_errors_total', error=type(error).__name__)
+                        status, content_type, body = _json(500, {'error': f"{type(error).__name__}: {error}"})
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+
+                head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        + ("Retry-After: 1\r\n" if status == 503 else "")
+                        + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+                writer.write(head.encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def _json(status, payload):
+    return status, 'application/json', json.dumps(payload).encode('utf-8')
+
+def load_engines(snapshot_path=None):
+    """(engines, data_version) from a snapshot file, or from Postgres"""
+    if snapshot_path:
+        from snapshot import Snapshot
+        snapshot = Snapshot.open(snapshot_path)
+        return {'vector': snapshot.vector_engine(), 'attribute': snapshot.attribute_engine()}, snapshot.data_version
+    import db
+    conn = db.connect()
+    data_version = db.Repository(conn).data_version()
+    catalog = Catalog.load(conn)
+    engines = {'vector': VectorEngine.load(conn, catalog=catalog), 'attribute': AttributeEngine.from_catalog(catalog)}
+    conn.close()
+    return engines, data_version
+
+async def serve(args):
+    engines, data_version = load_engines(args.snapshot)
+    service = RecommendationService(engines, data_version, args.max_batch, args.max_wait_ms / 1000, args.max_queue)
+    server = await service.start(args.host, args.port)
+    print(f"Serving {len(engines['vector'])} restaurants on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch}, max wait {args.max_wait_ms} ms, queue {args.max_queue})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve vector and attribute recommendations over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--snapshot', help='load from this snapshot file instead of Postgres')
+    parser.add_argument('--max-batch', type=int, default=64, help='most requests answered by one batched call')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help='longest a request waits for others to join its batch')
+    parser.add_argument('--max-queue', type=int, default=1024,
+                        help='waiting requests per method before new ones get 503')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
-import psycopg2
+import argparse
+import time
+import db
+import instrumentation
+from instrumentation import stage
 import numpy as np
 from tqdm import tqdm
 from collections import defaultdict
 from decimal import Decimal
+from vector_engine import VectorEngine
+from attribute_engine import SQL_WEIGHTS, AttributeEngine
+from catalog import Catalog
+from evaluation import batched_recommendations, parallel_map, sample_restaurants
+from hybrid_engine import LOCATIONS, HybridEngine
+from metrics_kernel import METRIC_NAMES, METRIC_WEIGHTS, MetricsColumns, compute_metrics, pad_rows
 
 def convert_decimal(value):
     """Convert decimal to float if needed"""
@@ -56,92 +66,150 @@ def calculate_metrics(original, recommendations):
     metrics['variety_score'] = float(len(unique_categories) / (len(recommendations) * 3))
     
     # Calculate overall score
-    weights = {
-        'category_match': 0.3,
-        'price_level_accuracy': 0.2,
-        'rating_similarity': 0.2,
-        'location_relevance': 0.2,
-        'variety_score': 0.1
-    }
-    
-    metrics['overall_score'] = sum(float(metrics[metric]) * weights[metric] 
-                                 for metric in weights.keys())
+    metrics['overall_score'] = sum(float(metrics[metric]) * METRIC_WEIGHTS[metric] 
+                                 for metric in METRIC_WEIGHTS.keys())
     
     return metrics
 
-def evaluate_recommendations():
-    conn = psycopg2.connect(
-        dbname="restaurant_db",
-        user="helloalpacaa",
-        host="localhost"
-    )
-    cur = conn.cursor()
+_catalog = None
+
+def _set_catalog(catalog):
+    global _catalog
+    _catalog = catalog
+
+def _score_query(args):
+    """Metrics of both methods for one query; None where a method returned nothing
+
+    With a catalog set (the numpy backend) recommendations arrive as catalog
+    rows and are viewed here, so workers never receive the catalog per item.
+    """
+    original, sql_recs, vector_recs = args
+    if _catalog is not None:
+        sql_recs = [_catalog.view(row) for row in sql_recs]
+        vector_recs = [_catalog.view(row) for row in vector_recs]
+    return (calculate_metrics(original, sql_recs) if sql_recs else None,
+            calculate_metrics(original, vector_recs) if vector_recs else None)
+
+def evaluate_hybrid(conn, rest_ids, depths, location='none', engine=None, attribute_engine=None, k=5):
+    """Print quality metrics and per-query latency of the hybrid recommender at each candidate depth"""
+    with stage('engines.load'):
+        if engine is None or attribute_engine is None:
+            catalog = Catalog.load(conn)
+            engine = engine or VectorEngine.load(conn, catalog=catalog)
+            attribute_engine = attribute_engine or AttributeEngine.from_catalog(catalog)
+    columns = MetricsColumns.from_engine(engine)
+    known = [rest_id for rest_id in rest_ids if rest_id in engine.row_by_id]
+    query_rows = [engine.row_by_id[rest_id] for rest_id in known]
+    hybrid = HybridEngine(engine, attribute_engine, location=location)
+
+    quality = {}
+    latency = {}
+    for depth in depths:
+        hybrid.depth = depth
+        results = []
+        latencies = []
+        with stage(f"recommend.hybrid.{depth}"):
+            for rest_id in known:
+                start = time.perf_counter()
+                results.append(hybrid.neighbors(rest_id, k))
+                latencies.append(time.perf_counter() - start)
+        metrics = compute_metrics(columns, query_rows, pad_rows(results, k))
+        quality[depth] = {metric: float(np.nanmean(metrics[metric])) for metric in METRIC_NAMES}
+        latency[depth] = np.percentile(latencies, [50, 95]) * 1000
+
+    print(f"\nHybrid recommender (vector candidates, attribute rerank, pre-filter: {location}):")
+    print(f"\n{'Metric':<20}" + ''.join(f"{f'depth {depth}':>14}" for depth in depths))
+    print("=" * (20 + 14 * len(depths)))
+    for metric in METRIC_NAMES:
+        print(f"{metric:<20}" + ''.join(f"{quality[depth][metric]:>14.4f}" for depth in depths))
+    print(f"{'p50 latency ms':<20}" + ''.join(f"{latency[depth][0]:>14.3f}" for depth in depths))
+    print(f"{'p95 latency ms':<20}" + ''.join(f"{latency[depth][1]:>14.3f}" for depth in depths))
+
+def evaluate_recommendations(backend='sql', batched=False, samples=50, seed=42, workers=1,
+                             hybrid_depths=None, hybrid_location='none'):
+    conn = db.connect()
+    repo = db.Repository(conn)
     
     # Get sample restaurants
-    cur.execute("""
-        SELECT DISTINCT r.restaurant_id, r.name, r.categories, r.price_level, 
-               r.avg_rating, r.city, r.state
-        FROM restaurants r
-        JOIN restaurant_embeddings re ON r.restaurant_id = re.restaurant_id
-        LIMIT 50
-    """)
-    test_restaurants = cur.fetchall()
+    with stage('sample'):
+        test_restaurants = sample_restaurants(conn, samples, seed)
+    
+    with stage('engines.load'):
+        catalog = Catalog.load(conn) if backend == 'numpy' else None
+        engine = VectorEngine.load(conn, catalog=catalog) if catalog else None
+        attribute_engine = AttributeEngine.from_catalog(catalog) if catalog else None
     
     sql_metrics = defaultdict(list)
     vector_metrics = defaultdict(list)
     
     print("Evaluating recommendations...")
-    for rest_data in tqdm(test_restaurants):
-        rest_id = rest_data[0]
-        original = {
-            'categories': rest_data[2],
-            'price_level': rest_data[3],
-            'avg_rating': rest_data[4],
-            'city': rest_data[5],
-            'state': rest_data[6]
-        }
-        
-        # SQL recommendations
-        cur.execute("""
-            SELECT 
-                r2.name, r2.categories, r2.price_level, r2.avg_rating,
-                r2.city, r2.state
-            FROM restaurants r1
-            JOIN restaurants r2 ON r1.restaurant_id != r2.restaurant_id
-            WHERE r1.restaurant_id = %s
-            ORDER BY (
-                CASE WHEN r1.categories = r2.categories THEN 0.3 ELSE 0 END +
-                (1 - ABS(r1.price_level - r2.price_level)::float/4) * 0.3 +
-                (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * 0.4
-            ) DESC
-            LIMIT 5
-        """, (rest_id,))
-        sql_recs = [dict(zip(['name', 'categories', 'price_level', 'avg_rating', 'city', 'state'], 
-                            rec)) for rec in cur.fetchall()]
-        
-        # Vector recommendations
-        cur.execute("""
-            SELECT 
-                r.name, r.categories, r.price_level, r.avg_rating,
-                r.city, r.state
-            FROM restaurant_embeddings re1
-            JOIN restaurant_embeddings re2 ON re1.restaurant_id != re2.restaurant_id
-            JOIN restaurants r ON re2.restaurant_id = r.restaurant_id
-            WHERE re1.restaurant_id = %s
-            ORDER BY 1 - (re1.embedding <=> re2.embedding) DESC
-            LIMIT 5
-        """, (rest_id,))
-        vector_recs = [dict(zip(['name', 'categories', 'price_level', 'avg_rating', 'city', 'state'], 
-                               rec)) for rec in cur.fetchall()]
-        
-        # Calculate metrics
-        if sql_recs:
-            sql_result = calculate_metrics(original, sql_recs)
+    rest_ids = [rest_data[0] for rest_data in test_restaurants]
+    if batched and engine is not None:
+        # Row indices are known, so score every query at once with the vectorized kernel
+        for target, method_engine, results in (
+                (sql_metrics, attribute_engine, attribute_engine.neighbors_batch(rest_ids, k=5)),
+                (vector_metrics, engine, engine.neighbors_batch(rest_ids, k=5))):
+            known = [i for i, rest_id in enumerate(rest_ids) if rest_id in method_engine.row_by_id]
+            metrics = compute_metrics(MetricsColumns.from_engine(method_engine),
+                                      [method_engine.row_by_id[rest_ids[i]] for i in known],
+                                      pad_rows([results[i] for i in known], 5))
+            scored = ~np.isnan(metrics['overall_score'])
+            for metric in METRIC_NAMES:
+                target[metric].extend(metrics[metric][scored].tolist())
+        all_sql_recs, all_vector_recs = [], []
+    elif batched:
+        # Both methods' top-5 for the whole sample at once
+        with stage('recommend.batched'):
+            all_sql_recs, all_vector_recs = batched_recommendations(repo, rest_ids, SQL_WEIGHTS, 5,
+                                                                    engine, attribute_engine,
+                                                                    materialized=backend == 'materialized')
+        all_sql_recs = [[dict(zip(db.RECOMMENDATION_COLUMNS, rec)) for rec in recs] for recs in all_sql_recs]
+        all_vector_recs = [[dict(zip(db.RECOMMENDATION_COLUMNS, rec)) for rec in recs] for recs in all_vector_recs]
+    else:
+        all_sql_recs = []
+        all_vector_recs = []
+        # Numpy recommendations stay catalog rows until scoring, rather than per-row dicts
+        vector_rows = engine.details.catalog_rows() if engine is not None else None
+        for rest_id in tqdm(rest_ids):
+            # SQL recommendations
+            if attribute_engine is not None:
+                rows, _ = attribute_engine.neighbors(rest_id, k=5)
+                sql_recs = rows.tolist()
+            elif backend == 'materialized':
+                sql_recs = [dict(zip(db.RECOMMENDATION_COLUMNS, rec))
+                            for rec in repo.materialized_recommendations(rest_id, 'sql', k=5)]
+            else:
+                sql_recs = [dict(zip(db.RECOMMENDATION_COLUMNS, rec))
+                            for rec in repo.sql_recommendations(rest_id, SQL_WEIGHTS, k=5)]
+            
+            # Vector recommendations
+            if engine is not None:
+                rows, _ = engine.neighbors(rest_id, k=5)
+                vector_recs = vector_rows[rows].tolist()
+            elif backend == 'materialized':
+                vector_recs = [dict(zip(db.RECOMMENDATION_COLUMNS, rec))
+                               for rec in repo.materialized_recommendations(rest_id, 'vector', k=5)]
+            else:
+                vector_recs = [dict(zip(db.RECOMMENDATION_COLUMNS, rec))
+                               for rec in repo.vector_recommendations(rest_id, k=5)]
+            all_sql_recs.append(sql_recs)
+            all_vector_recs.append(vector_recs)
+    
+    # Calculate metrics
+    queries = [({'categories': rest_data[2],
+                 'price_level': rest_data[3],
+                 'avg_rating': rest_data[4],
+                 'city': rest_data[5],
+                 'state': rest_data[6]}, sql_recs, vector_recs)
+               for rest_data, sql_recs, vector_recs in zip(test_restaurants, all_sql_recs, all_vector_recs)]
+    with stage('score'):
+        scored = parallel_map(_score_query, queries, workers, initializer=_set_catalog, initargs=(catalog,))
+    for sql_result, vector_result in scored:
+        if sql_result is not None:
             for metric, value in sql_result.items():
                 sql_metrics[metric].append(value)
         
-        if vector_recs:
-            vector_result = calculate_metrics(original, vector_recs)
+        if vector_result is not None:
             for metric, value in vector_result.items():
                 vector_metrics[metric].append(value)
     
@@ -155,7 +223,31 @@ def evaluate_recommendations():
         vector_avg = np.mean(vector_metrics[metric])
         print(f"{metric:<20} {sql_avg:>10.4f}        {vector_avg:>10.4f}")
     
+    if hybrid_depths:
+        evaluate_hybrid(conn, rest_ids, hybrid_depths, hybrid_location, engine, attribute_engine)
     conn.close()
 
 if __name__ == "__main__":
-    evaluate_recommendations()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['sql', 'numpy', 'materialized'], default='sql',
+                        help='run recommendations in PostgreSQL, in the in-process NumPy engines, '
+                             'or from the precomputed restaurant_neighbors table')
+    parser.add_argument('--batched', action='store_true',
+                        help='fetch top-k of the whole sample in one LATERAL query or engine batch per method')
+    parser.add_argument('--samples', type=int, default=50, help='number of sampled restaurants')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the restaurant sample')
+    parser.add_argument('--workers', type=int, default=1, help='processes scoring the recommendations')
+    parser.add_argument('--hybrid-depths', type=int, nargs='+',
+                        help='also evaluate the hybrid recommender with these vector candidate depths')
+    parser.add_argument('--hybrid-location', choices=LOCATIONS, default='none',
+                        help='restrict hybrid candidates to the same state or city')
+    parser.add_argument('--metrics-file', help='write stage timings, counters and captured query plans here')
+    parser.add_argument('--explain-rate', type=float, default=None,
+                        help='fraction of queries re-run under EXPLAIN (ANALYZE, BUFFERS)')
+    args = parser.parse_args()
+    instrumentation.configure(explain_rate=args.explain_rate)
+    evaluate_recommendations(backend=args.backend, batched=args.batched, samples=args.samples,
+                             seed=args.seed, workers=args.workers, hybrid_depths=args.hybrid_depths,
+                             hybrid_location=args.hybrid_location)
+    if args.metrics_file:
+        instrumentation.write_report(args.metrics_file)
@@ -0,0 +1,123 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from vector_engine import _order_top_k
+
+# Shard keys taken from the (name, categories, price_level, avg_rating, city, state) detail rows
+SHARD_KEYS = {
+    'state': lambda details: details[5],
+    'city': lambda details: (details[4], details[5])
+}
+
+class ShardedIndex:
+    """Embeddings of a VectorEngine partitioned into region shards
+
+    by='state' shards on state and by='city' on (city, state). A same-region
+    query scans only its own shard. A fan-out query scans every shard (or
+    the given regions) on a thread pool and merges the per-shard top-k,
+    which is exactly the top-k over those shards, ties included. Rows and
+    scores follow the engine's rows.
+    """
+
+    def __init__(self, engine, by='state', workers=4):
+        self.engine = engine
+        self.by = by
+        self.restaurant_ids = engine.restaurant_ids
+        self.row_by_id = engine.row_by_id
+        self.details = engine.details
+
+        shard_key = SHARD_KEYS[by]
+        groups = {}
+        for row, details in enumerate(engine.details):
+            groups.setdefault(shard_key(details), []).append(row)
+        self.keys = sorted(groups, key=str)
+        self.shard_by_key = {key: shard for shard, key in enumerate(self.keys)}
+        self.shard_rows = [np.array(groups[key], dtype=np.int64) for key in self.keys]
+        # Each shard's vectors are stored contiguously so a scan reads only that shard
+        self.shard_matrices = [np.ascontiguousarray(engine.matrix[rows]) for rows in self.shard_rows]
+        self.shard_of_row = np.empty(len(engine), dtype=np.int64)
+        for shard, rows in enumerate(self.shard_rows):
+            self.shard_of_row[rows] = shard
+
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self.fanout_batches = self._balance(range(len(self.keys)))
+
+    def __len__(self):
+        return len(self.restaurant_ids)
+
+    def shard_sizes(self):
+        return {key: len(rows) for key, rows in zip(self.keys, self.shard_rows)}
+
+    def region_of(self, restaurant_id):
+        row = self.row_by_id.get(restaurant_id)
+        return None if row is None else self.keys[self.shard_of_row[row]]
+
+    def _balance(self, shards):
+        """Split shards into one batch per worker with roughly equal row counts"""
+        bins = [(0, i, []) for i in range(min(self.workers, len(self.keys)) or 1)]
+        for shard in sorted(shards, key=lambda shard: -len(self.shard_rows[shard])):
+            size, i, batch = heapq.heappop(bins)
+            batch.append(shard)
+            heapq.heappush(bins, (size + len(self.shard_rows[shard]), i, batch))
+        return [batch for _, _, batch in sorted(bins, key=lambda item: item[1]) if batch]
+
+    def search_shard(self, shard, query, k=5, exclude=None):
+        """(rows, scores) of the top-k of one shard for a normalized query vector"""
+        rows = self.shard_rows[shard]
+        scores = self.shard_matrices[shard] @ query
+        if exclude is not None and self.shard_of_row[exclude] == shard:
+            keep = rows != exclude
+            rows, scores = rows[keep], scores[keep]
+        if len(scores) > k:
+            # Keep every row tied with the k-th score so the merge breaks ties like a full scan
+            threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            keep = scores >= threshold
+            rows, scores = rows[keep], scores[keep]
+        return _order_top_k(scores, rows, k)
+
+    def _search_batch(self, shards, query, k, exclude):
+        results = [self.search_shard(shard, query, k, exclude) for shard in shards]
+        rows = np.concatenate([rows for rows, _ in results])
+        scores = np.concatenate([scores for _, scores in results])
+        return _order_top_k(scores, rows, k)
+
+    def neighbors(self, restaurant_id, k=5):
+        """Top-k within the restaurant's own region"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.search_shard(self.shard_of_row[row], self.engine.matrix[row], k, exclude=row)
+
+    def neighbors_fanout(self, restaurant_id, k=5, regions=None):
+        """Top-k across regions (default all), one batch of shards per worker, merged"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if regions is None:
+            batches = self.fanout_batches
+        else:
+            batches = self._balance([self.shard_by_key[key] for key in regions if key in self.shard_by_key])
+        query = self.engine.matrix[row]
+        if self.executor is None or len(batches) == 1:
+            results = [self._search_batch(batch, query, k, row) for batch in batches]
+        else:
+            futures = [self.executor.submit(self._search_batch, batch, query, k, row) for batch in batches]
+            results = [future.result() for future in futures]
+        rows = np.concatenate([rows for rows, _ in results])
+        scores = np.concatenate([scores for _, scores in results])
+        return _order_top_k(scores, rows, k)
+
+    def top_k(self, restaurant_id, k=5):
+        """Same-region rows shaped like the pgvector query"""
+        return self._format(*self.neighbors(restaurant_id, k))
+
+    def top_k_fanout(self, restaurant_id, k=5, regions=None):
+        return self._format(*self.neighbors_fanout(restaurant_id, k, regions))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _format(self, rows, scores):
+        return [tuple(self.details[row][:4]) + (float(score),) for row, score in zip(rows, scores)]
@@ -0,0 +1,220 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+import numpy as np
+from ann_index import IVFIndex
+from attribute_engine import AttributeEngine
+from catalog import ARRAY_COLUMNS, Catalog
+from vector_engine import VectorEngine
+
+# File layout: prefix (magic, format version, reserved, header length), JSON header, then every array
+# at an ALIGNMENT-byte boundary of the data section. The header records each array's dtype, shape and
+# offset into the data section, so the loader maps the file once and takes views without copying.
+MAGIC = b'RSNAPSHT'
+FORMAT_VERSION = 1
+PREFIX = struct.Struct('<8sIIQ')
+ALIGNMENT = 64
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def _join_ids(restaurant_ids):
+    """Restaurant ids as one newline-separated UTF-8 array, split again in a single call on load"""
+    if any('\n' in rest_id for rest_id in restaurant_ids):
+        raise ValueError("restaurant ids must not contain newlines")
+    return np.frombuffer('\n'.join(restaurant_ids).encode('utf-8'), dtype=np.uint8)
+
+def _split_ids(array):
+    return bytes(array).decode('utf-8').split('\n') if len(array) else []
+
+def write_snapshot(path, catalog, engine, index=None, data_version=0):
+    """Write the catalog, a catalog-backed VectorEngine and an optional IVFIndex to one file
+
+    The file is written under a temporary name and renamed, so readers never
+    see a partial snapshot.
+    """
+    arrays = {f"catalog.{name}": array for name, array in catalog.arrays().items()}
+    arrays['catalog.restaurant_ids'] = _join_ids(catalog.restaurant_ids)
+    arrays['vector.rows'] = np.asarray(engine.details.catalog_rows(), dtype=np.int64)
+    arrays['vector.matrix'] = engine.matrix
+    if index is not None:
+        arrays.update({'ivf.centroids': index.centroids, 'ivf.list_offsets': index.list_offsets,
+                       'ivf.list_rows': index.list_rows, 'ivf.list_vectors': index.list_vectors})
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'data_version': data_version,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'arrays': layout,
+        'category_strings': catalog.category_strings,
+        'category_vocabulary': catalog.category_vocabulary,
+        'locations': catalog.locations,
+        'states': catalog.states,
+        'ivf_nprobe': index.nprobe if index is not None else None
+    }).encode('utf-8')
+
+    data_start = _align(PREFIX.size + len(header))
+    with open(path + '.tmp', 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, 0, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.data)
+        f.truncate(data_start + offset)
+    os.replace(path + '.tmp', path)
+
+class Snapshot:
+    """Read-only serving state mapped from a snapshot file
+
+    Every array is a view of one shared read-only memory map, so opening
+    costs a header parse and the id lookup dicts; pages are read from disk
+    (or the page cache) as queries touch them.
+    """
+
+    def __init__(self, path, header, arrays):
+        self.path = path
+        self.header = header
+        self.arrays = arrays
+        self.data_version = header['data_version']
+        self.catalog = Catalog.from_arrays(
+            _split_ids(arrays['catalog.restaurant_ids']),
+            {name: arrays[f"catalog.{name}"] for name in ARRAY_COLUMNS},
+            header['category_strings'], header['category_vocabulary'], header['locations'], header['states'])
+        self._vector_engine = None
+        self._attribute_engine = None
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, header_length = PREFIX.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a restaurant snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        header = json.loads(buffer[PREFIX.size:PREFIX.size + header_length])
+        data_start = _align(PREFIX.size + header_length)
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            if count == 0:
+                arrays[name] = np.empty(spec['shape'], dtype=dtype)
+                continue
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                         offset=data_start + spec['offset']).reshape(spec['shape'])
+        return cls(path, header, arrays)
+
+    def vector_engine(self):
+        """VectorEngine over the mapped, already normalized embedding matrix"""
+        if self._vector_engine is None:
+            rows = self.arrays['vector.rows']
+            restaurant_ids = self.catalog.restaurant_ids
+            if len(rows) != len(restaurant_ids):
+                restaurant_ids = [restaurant_ids[row] for row in rows]
+            self._vector_engine = VectorEngine.from_normalized(restaurant_ids, self.arrays['vector.matrix'],
+                                                               self.catalog.details.subset(rows))
+        return self._vector_engine
+
+    def attribute_engine(self):
+        if self._attribute_engine is None:
+            self._attribute_engine = AttributeEngine.from_catalog(self.catalog)
+        return self._attribute_engine
+
+    def ivf_index(self, nprobe=None):
+        """The stored IVFIndex over the vector engine's rows, or None"""
+        if 'ivf.centroids' not in self.arrays:
+            return None
+        return IVFIndex(self.arrays['ivf.centroids'], self.arrays['ivf.list_offsets'],
+                        self.arrays['ivf.list_rows'], self.arrays['ivf.list_vectors'],
+                        self.vector_engine().restaurant_ids, nprobe=nprobe or self.header['ivf_nprobe'])
+
+def export(conn, path, nlist=0, nprobe=8):
+    """Load everything from Postgres and write it as a snapshot; nlist > 0 also builds an IVF index"""
+    import db
+    data_version = db.Repository(conn).data_version()
+    catalog = Catalog.load(conn)
+    engine = VectorEngine.load(conn, catalog=catalog)
+    index = IVFIndex.from_engine(engine, nlist=nlist, nprobe=nprobe) if nlist > 0 else None
+    write_snapshot(path, catalog, engine, index, data_version)
+    return catalog, engine
+
+def first_recommendation(source, path, restaurant_id):
+    """Load from source ('snapshot' or 'postgres') and answer one vector query; returns timings in seconds"""
+    start = time.perf_counter()
+    if source == 'snapshot':
+        engine = Snapshot.open(path).vector_engine()
+    else:
+        import db
+        conn = db.connect()
+        engine = VectorEngine.load(conn, catalog=Catalog.load(conn))
+        conn.close()
+    loaded = time.perf_counter()
+    recommendations = engine.top_k(restaurant_id, k=5)
+    done = time.perf_counter()
+    return {'load': loaded - start, 'query': done - loaded, 'names': [rec[0] for rec in recommendations]}
+
+def run_startup_benchmark(path, runs=3, sources=('snapshot', 'postgres')):
+    """Time fresh processes from interpreter start to their first recommendation"""
+    restaurant_id = Snapshot.open(path).vector_engine().restaurant_ids[0]
+    print(f"\n{'source':<10} {'process s':>10} {'load s':>8} {'query ms':>9}")
+    print("=" * 40)
+    answers = {}
+    for source in sources:
+        walls, loads, queries = [], [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--first-recommendation', source,
+                                     '--snapshot', path, '--restaurant-id', restaurant_id],
+                                    capture_output=True, text=True, check=True).stdout
+            walls.append(time.perf_counter() - start)
+            result = json.loads(output.strip().splitlines()[-1])
+            loads.append(result['load'])
+            queries.append(result['query'])
+            answers[source] = result['names']
+        print(f"{source:<10} {np.median(walls):>10.3f} {np.median(loads):>8.3f} {np.median(queries) * 1000:>9.2f}")
+    if len(answers) > 1:
+        print(f"\nSame recommendations from every source: {len({tuple(names) for names in answers.values()}) == 1}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or benchmark a memory-mapped serving snapshot')
+    parser.add_argument('--snapshot', default='restaurants.snap', help='snapshot file')
+    parser.add_argument('--export', action='store_true', help='write the snapshot from Postgres')
+    parser.add_argument('--nlist', type=int, default=0, help='also store an IVF index with this many cells')
+    parser.add_argument('--nprobe', type=int, default=8, help='default cells probed by the stored IVF index')
+    parser.add_argument('--startup-benchmark', action='store_true',
+                        help='time to first recommendation of fresh processes, snapshot vs Postgres')
+    parser.add_argument('--runs', type=int, default=3, help='processes started per source')
+    parser.add_argument('--first-recommendation', choices=['snapshot', 'postgres'], help=argparse.SUPPRESS)
+    parser.add_argument('--restaurant-id', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.first_recommendation:
+        print(json.dumps(first_recommendation(args.first_recommendation, args.snapshot, args.restaurant_id)))
+        return
+    if args.export:
+        import db
+        conn = db.connect()
+        start = time.perf_counter()
+        catalog, engine = export(conn, args.snapshot, args.nlist, args.nprobe)
+        conn.close()
+        print(f"Wrote {len(catalog)} restaurants and {len(engine)} embeddings to {args.snapshot} "
+              f"({os.path.getsize(args.snapshot) / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.1f}s")
+    if args.startup_benchmark:
+        run_startup_benchmark(args.snapshot, args.runs)
+
+if __name__ == "__main__":
+    main()
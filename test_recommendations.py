@@ -1,95 +1,89 @@
-import psycopg2
+import argparse
 import time
+import db
+import instrumentation
+from instrumentation import stage
+from vector_engine import VectorEngine
+from attribute_engine import SQL_WEIGHTS, AttributeEngine
+from attribute_index import AttributeIndex
 
-def test_recommendations(restaurant_id):
-    conn = psycopg2.connect(
-        dbname="restaurant_db",
-        user="helloalpacaa",
-        host="localhost"
-    )
-    cur = conn.cursor()
+def test_recommendations(restaurant_id, backend='sql'):
+    conn = db.connect()
+    repo = db.Repository(conn)
     
     # Get details of the target restaurant
-    cur.execute("""
-        SELECT name, categories, price_level, avg_rating 
-        FROM restaurants 
-        WHERE restaurant_id = %s
-    """, (restaurant_id,))
-    restaurant_details = cur.fetchone()
+    restaurant_details = repo.restaurant_details(restaurant_id)
     print(f"\nFinding similar restaurants to: {restaurant_details[0]}")
     print(f"Categories: {restaurant_details[1]}")
     print(f"Price Level: {restaurant_details[2]}")
     print(f"Average Rating: {restaurant_details[3]}")
     
     print("\nSQL-based recommendations:")
+    with stage('attribute_engine.load'):
+        if backend == 'numpy':
+            attribute_engine = AttributeEngine.load(conn)
+        elif backend == 'index':
+            attribute_engine = AttributeIndex.from_engine(AttributeEngine.load(conn))
     # SQL-based similarity
     start_time = time.time()
-    cur.execute("""
-        WITH RestaurantMetrics AS (
-            SELECT 
-                r.restaurant_id,
-                r.name,
-                r.categories,
-                r.price_level,
-                r.avg_rating
-            FROM restaurants r
-        )
-        SELECT 
-            r2.name,
-            r2.categories,
-            r2.price_level,
-            r2.avg_rating,
-            (
-                CASE WHEN r1.categories = r2.categories THEN 0.3 ELSE 0 END +
-                (1 - ABS(r1.price_level - r2.price_level)::float/4) * 0.3 +
-                (1 - ABS(r1.avg_rating - r2.avg_rating)::float/5) * 0.4
-            ) as similarity_score
-        FROM RestaurantMetrics r1
-        JOIN RestaurantMetrics r2 ON r1.restaurant_id != r2.restaurant_id
-        WHERE r1.restaurant_id = %s
-        ORDER BY similarity_score DESC
-        LIMIT 5
-    """, (restaurant_id,))
+    with stage(f"sql_recommendations.{backend}"):
+        if backend in ('numpy', 'index'):
+            sql_recs = attribute_engine.top_k(restaurant_id, k=5)
+        elif backend == 'materialized':
+            sql_recs = repo.materialized_recommendations(restaurant_id, 'sql', k=5)
+        else:
+            sql_recs = repo.sql_recommendations(restaurant_id, SQL_WEIGHTS, k=5)
     sql_time = time.time() - start_time
     
-    for row in cur.fetchall():
-        print(f"\nName: {row[0]}")
-        print(f"Categories: {row[1]}")
-        print(f"Price Level: {row[2]}")
-        print(f"Rating: {row[3]}")
-        print(f"Similarity Score: {row[4]:.3f}")
+    with stage('format'):
+        for row in sql_recs:
+            print(f"\nName: {row[0]}")
+            print(f"Categories: {row[1]}")
+            print(f"Price Level: {row[2]}")
+            print(f"Rating: {row[3]}")
+            print(f"Similarity Score: {row[4]:.3f}")
     
-    print(f"\nSQL query took {sql_time:.3f} seconds")
+    print(f"\nSQL query ({backend}) took {sql_time:.3f} seconds")
     
     print("\nVector-based recommendations:")
+    if backend in ('numpy', 'index'):
+        with stage('vector_engine.load'):
+            engine = VectorEngine.load(conn)
     # Vector-based similarity
     start_time = time.time()
-    cur.execute("""
-        SELECT 
-            r.name,
-            r.categories,
-            r.price_level,
-            r.avg_rating,
-            1 - (re1.embedding <=> re2.embedding) as similarity_score
-        FROM restaurant_embeddings re1
-        JOIN restaurant_embeddings re2 ON re1.restaurant_id != re2.restaurant_id
-        JOIN restaurants r ON re2.restaurant_id = r.restaurant_id
-        WHERE re1.restaurant_id = %s
-        ORDER BY similarity_score DESC
-        LIMIT 5
-    """, (restaurant_id,))
+    with stage(f"vector_recommendations.{backend}"):
+        if backend in ('numpy', 'index'):
+            vector_recs = engine.top_k(restaurant_id, k=5)
+        elif backend == 'materialized':
+            vector_recs = repo.materialized_recommendations(restaurant_id, 'vector', k=5)
+        else:
+            vector_recs = repo.vector_recommendations(restaurant_id, k=5)
     vector_time = time.time() - start_time
     
-    for row in cur.fetchall():
-        print(f"\nName: {row[0]}")
-        print(f"Categories: {row[1]}")
-        print(f"Price Level: {row[2]}")
-        print(f"Rating: {row[3]}")
-        print(f"Similarity Score: {row[4]:.3f}")
+    with stage('format'):
+        for row in vector_recs:
+            print(f"\nName: {row[0]}")
+            print(f"Categories: {row[1]}")
+            print(f"Price Level: {row[2]}")
+            print(f"Rating: {row[3]}")
+            print(f"Similarity Score: {row[4]:.3f}")
     
-    print(f"\nVector query took {vector_time:.3f} seconds")
+    print(f"\nVector query ({backend}) took {vector_time:.3f} seconds")
     
     conn.close()
 
 if __name__ == "__main__":
-    test_recommendations('XQfwVwDr-v0ZS3_CbbE5Xw')  # Turning Point of North Wales
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('restaurant_id', nargs='?', default='XQfwVwDr-v0ZS3_CbbE5Xw')  # Turning Point of North Wales
+    parser.add_argument('--backend', choices=['sql', 'numpy', 'index', 'materialized'], default='sql',
+                        help='run recommendations in PostgreSQL, in the in-process NumPy engines, '
+                             'with the bucket index serving the SQL-based method, '
+                             'or from the precomputed restaurant_neighbors table')
+    parser.add_argument('--metrics-file', help='write stage timings, counters and captured query plans here')
+    parser.add_argument('--explain-rate', type=float, default=None,
+                        help='fraction of queries re-run under EXPLAIN (ANALYZE, BUFFERS)')
+    args = parser.parse_args()
+    instrumentation.configure(explain_rate=args.explain_rate)
+    test_recommendations(args.restaurant_id, backend=args.backend)
+    if args.metrics_file:
+        instrumentation.write_report(args.metrics_file)
\ No newline at end of file
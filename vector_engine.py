@@ -0,0 +1,145 @@
+from collections.abc import Sequence
+import numpy as np
+
+DETAIL_COLUMNS = ('name', 'categories', 'price_level', 'avg_rating', 'city', 'state')
+
+def _order_top_k(scores, rows, k):
+    """Order candidate rows by score descending, breaking ties by row index"""
+    order = np.lexsort((rows, -scores))[:k]
+    return rows[order], scores[order]
+
+class VectorEngine:
+    """In-memory cosine similarity search over restaurant_embeddings"""
+
+    def __init__(self, restaurant_ids, embeddings, details):
+        self.restaurant_ids = list(restaurant_ids)
+        self.row_by_id = {rest_id: row for row, rest_id in enumerate(self.restaurant_ids)}
+        # A catalog's details are already an indexable sequence; copying would rebuild every tuple
+        self.details = details if isinstance(details, Sequence) and not isinstance(details, list) else list(details)
+
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+    @classmethod
+    def from_normalized(cls, restaurant_ids, matrix, details):
+        """Wrap an already normalized float32 matrix (e.g. a snapshot view) without copying it"""
+        engine = cls.__new__(cls)
+        engine.restaurant_ids = list(restaurant_ids)
+        engine.row_by_id = {rest_id: row for row, rest_id in enumerate(engine.restaurant_ids)}
+        engine.details = details
+        engine.matrix = matrix
+        return engine
+
+    @classmethod
+    def load(cls, conn, itersize=2000, catalog=None):
+        """Load every embedding with its restaurant details in one pass
+
+        With a catalog only ids and embeddings are read, and details are
+        views of the catalog rows. Ids missing from the catalog are skipped.
+        """
+        if catalog is not None:
+            return cls._load_with_catalog(conn, itersize, catalog)
+        cur = conn.cursor(name='vector_engine_load')
+        cur.itersize = itersize
+        cur.execute("""
+            SELECT
+                re.restaurant_id,
+                r.name, r.categories, r.price_level, r.avg_rating,
+                r.city, r.state,
+                re.embedding::text
+            FROM restaurant_embeddings re
+            JOIN restaurants r ON re.restaurant_id = r.restaurant_id
+            ORDER BY re.restaurant_id
+        """)
+
+        restaurant_ids = []
+        details = []
+        vectors = []
+        for row in cur:
+            restaurant_ids.append(row[0])
+            details.append(row[1:7])
+            vectors.append(np.array(row[7][1:-1].split(','), dtype=np.float32))
+        cur.close()
+
+        embeddings = np.vstack(vectors) if vectors else np.empty((0, 384), dtype=np.float32)
+        return cls(restaurant_ids, embeddings, details)
+
+    @classmethod
+    def _load_with_catalog(cls, conn, itersize, catalog):
+        cur = conn.cursor(name='vector_engine_load')
+        cur.itersize = itersize
+        cur.execute("""
+            SELECT restaurant_id, embedding::text
+            FROM restaurant_embeddings
+            ORDER BY restaurant_id
+        """)
+
+        restaurant_ids = []
+        rows = []
+        vectors = []
+        for rest_id, embedding in cur:
+            row = catalog.row_by_id.get(rest_id)
+            if row is None:
+                continue
+            restaurant_ids.append(rest_id)
+            rows.append(row)
+            vectors.append(np.array(embedding[1:-1].split(','), dtype=np.float32))
+        cur.close()
+
+        embeddings = np.vstack(vectors) if vectors else np.empty((0, 384), dtype=np.float32)
+        return cls(restaurant_ids, embeddings, catalog.details.subset(rows))
+
+    def __len__(self):
+        return len(self.restaurant_ids)
+
+    def neighbors(self, restaurant_id, k=5):
+        """Return (rows, scores) of the k most similar restaurants, excluding itself"""
+        row = self.row_by_id.get(restaurant_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = self.matrix @ self.matrix[row]
+        scores[row] = -np.inf
+        return self._select(scores, k, exclude=row)
+
+    def neighbors_batch(self, restaurant_ids, k=5, block_size=256):
+        """Answer many queries with one matrix-matrix product per block"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        results = [empty] * len(restaurant_ids)
+        known = [(i, self.row_by_id[rest_id]) for i, rest_id in enumerate(restaurant_ids)
+                 if rest_id in self.row_by_id]
+
+        for start in range(0, len(known), block_size):
+            block = known[start:start + block_size]
+            query_rows = np.array([row for _, row in block])
+            scores = self.matrix[query_rows] @ self.matrix.T
+            scores[np.arange(len(block)), query_rows] = -np.inf
+            for (i, row), row_scores in zip(block, scores):
+                results[i] = self._select(row_scores, k, exclude=row)
+        return results
+
+    def top_k(self, restaurant_id, k=5):
+        """Return rows shaped like the pgvector query: (name, categories, price_level, avg_rating, similarity_score)"""
+        return self._format(*self.neighbors(restaurant_id, k))
+
+    def top_k_batch(self, restaurant_ids, k=5, block_size=256):
+        """Batched version of top_k"""
+        return [self._format(rows, scores)
+                for rows, scores in self.neighbors_batch(restaurant_ids, k, block_size)]
+
+    def _select(self, scores, k, exclude):
+        # The query row itself is masked with -inf and must never be returned
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Pull in every row tied with the k-th score so tie-breaking stays deterministic
+        threshold = scores[candidates].min()
+        candidates = np.flatnonzero(scores >= threshold)
+        candidates = candidates[candidates != exclude]
+        return _order_top_k(scores[candidates], candidates, k)
+
+    def _format(self, rows, scores):
+        return [tuple(self.details[row][:4]) + (float(score),) for row, score in zip(rows, scores)]